@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Compares memory needed to hold large inventory as pyVmomi objects with names in dictionaries (the way
+listings used to keep it) and as compact inventory records. No vCenter is needed, objects are synthetic.
+
+    ./benchmarks/inventory_records.py [count]
+"""
+import os
+import sys
+import tracemalloc
+from pyVmomi import vim, SoapStubAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.tools.records import InventoryRecord  # noqa: E402
+
+
+def synthetic(count):
+    """Yields moid, name and parent moid of synthetic vms spread over hundred folders."""
+    for i in range(count):
+        yield 'vm-{}'.format(i), 'vm-{:06d}.example.com'.format(i), 'group-v{}'.format(i % 100)
+
+
+def measure(build):
+    """Returns bytes allocated by build and kept alive by its result."""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    stub = SoapStubAdapter(host='localhost', port=443)
+
+    def objects():
+        return dict((name, (vim.VirtualMachine(moid, stub), {'name': name, 'parent': vim.Folder(parent, stub)}))
+                    for moid, name, parent in synthetic(count))
+
+    def records():
+        return [InventoryRecord(moid, 'vim.VirtualMachine', name, parent) for moid, name, parent in synthetic(count)]
+
+    for label, build in (('objects', objects), ('records', records)):
+        size = measure(build)
+        print('{:8} {:>12,} bytes {:>8.1f} bytes/object'.format(label, size, float(size) / count))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,152 @@
+import os
 import sys
+import pickle
 import yaml
+
+from lib import config as conf
 from lib.tools.logger import logger
+from lib.exceptions import VmCLIException
+
+
+# Bump whenever structure of the pickled index changes, so stale caches are rebuilt instead of loaded
+INDEX_VERSION = 1
+
+
+class FlavorCatalogue(object):
+    """Indexes every flavor found in the flavors directory. Inheritance declared via 'extends' directive
+    is resolved while the index is built and the result is pickled into a cache file, which is reused for
+    as long as modification times of the flavor files stay the same."""
+
+    def __init__(self, path=None, cache_path=None):
+        self.path = path or conf.FLAVORS_DIR
+        self.cache_path = cache_path or conf.FLAVORS_CACHE
+        self._flavors = None
+
+    def _scan(self):
+        """Returns dictionary of flavor names and modification times of their files."""
+        try:
+            files = os.listdir(self.path)
+        except OSError:
+            raise VmCLIException('Unable to read flavors directory {}!'.format(self.path))
+
+        mtimes = {}
+        for file_name in files:
+            if file_name.startswith('.') or not file_name.endswith('.yml'):
+                continue
+            mtimes[file_name[:-4]] = os.stat(os.path.join(self.path, file_name)).st_mtime
+        return mtimes
+
+    def _load_cache(self, mtimes):
+        """Returns resolved flavors from cache file if it is still valid, None otherwise."""
+        try:
+            with open(self.cache_path, 'rb') as cache_file:
+                index = pickle.load(cache_file)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+        if not isinstance(index, dict) or index.get('version') != INDEX_VERSION:
+            return None
+        if index.get('path') != os.path.abspath(self.path) or index.get('files') != mtimes:
+            return None
+        return index.get('flavors')
+
+    def _save_cache(self, mtimes, flavors):
+        """Stores resolved flavors into cache file. Failure to write cache is not fatal."""
+        index = {'version': INDEX_VERSION, 'path': os.path.abspath(self.path), 'files': mtimes, 'flavors': flavors}
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # write into temporary file first, so concurrent runs never read partially written index
+            tmp_path = '{}.{}'.format(self.cache_path, os.getpid())
+            with open(tmp_path, 'wb') as cache_file:
+                pickle.dump(index, cache_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self.cache_path)
+        except (IOError, OSError) as e:
+            logger.debug('Unable to store flavor index into {}: {}'.format(self.cache_path, e))
+
+    def _read(self, name):
+        """Parses single flavor file into dictionary."""
+        try:
+            with open(os.path.join(self.path, '{}.yml'.format(name))) as flavor_file:
+                flavor = yaml.safe_load(flavor_file)
+        except yaml.YAMLError as e:
+            raise VmCLIException('Flavor syntax error {}'.format(str(getattr(e, 'context_mark', e)).lstrip()))
+
+        try:
+            # Ensure returned object is dictionary, empty file is treated as empty flavor
+            return dict(flavor or {})
+        except (TypeError, ValueError):
+            raise VmCLIException('Unable to convert flavor {} into dictionary object'.format(name))
+
+    def _resolve(self, name, raw, resolved, stack=()):
+        """Merges flavor with all of its parents listed in 'extends' directive. Parents are applied in the
+        listed order and directives of the flavor itself always take precedence."""
+        if name in resolved:
+            return resolved[name]
+        if name in stack:
+            raise VmCLIException('Flavor {} extends itself: {}'.format(name, ' -> '.join(stack + (name,))))
+        if name not in raw:
+            raise VmCLIException('Flavor {} extends unknown flavor {}!'.format(stack[-1], name))
+
+        flavor = dict(raw[name])
+        parents = flavor.pop('extends', None) or []
+        if not isinstance(parents, (list, tuple)):
+            parents = [parents]
+
+        merged = {}
+        for parent in parents:
+            merged.update(self._resolve(str(parent), raw, resolved, stack + (name,)))
+        merged.update(flavor)
+
+        resolved[name] = merged
+        return merged
+
+    def _build(self):
+        """Loads flavors from cache or builds new index by parsing and resolving all flavor files."""
+        mtimes = self._scan()
+        flavors = self._load_cache(mtimes)
+        if flavors is not None:
+            logger.debug('Loaded {} flavors from index {}'.format(len(flavors), self.cache_path))
+            return flavors
+
+        logger.debug('Building flavor index from {}...'.format(self.path))
+        raw = dict((name, self._read(name)) for name in mtimes)
+        flavors = {}
+        for name in raw:
+            self._resolve(name, raw, flavors)
+
+        self._save_cache(mtimes, flavors)
+        return flavors
+
+    @property
+    def flavors(self):
+        if self._flavors is None:
+            self._flavors = self._build()
+        return self._flavors
+
+    def names(self):
+        """Returns alphabetically sorted names of all available flavors."""
+        return sorted(self.flavors)
+
+    def get(self, name):
+        """Returns copy of fully resolved flavor, so callers are free to modify it."""
+        try:
+            return dict(self.flavors[name])
+        except KeyError:
+            raise VmCLIException('No such flavor named {}!'.format(name))
+
+
+# Catalogue is shared by all callers within single run, so flavor directory is scanned only once
+_catalogue = None
+
+
+def get_catalogue():
+    """Returns catalogue instance shared across the program."""
+    global _catalogue
+    if _catalogue is None:
+        _catalogue = FlavorCatalogue()
+    return _catalogue
 
 
 def load_vm_flavor(name):
@@ -8,17 +154,9 @@ def load_vm_flavor(name):
     as an argument provided. Found file must contain valid YAML directives."""
     if name:
         try:
-            module = yaml.safe_load(open('flavors/{}.yml'.format(name)))
-            # Ensure returned object is dictionary
-            return dict(module)
-        except IOError as e:
-            logger.error('No such flavor named {}!'.format(name))
-            sys.exit(1)
-        except yaml.scanner.ScannerError as e:
-            logger.error('Flavor syntax error {}'.format(str(e.context_mark).lstrip()))
-            sys.exit(1)
-        except ValueError:
-            logger.error('Unable to convert flavor {} into dictionary object'.format(name))
+            return get_catalogue().get(name)
+        except VmCLIException as e:
+            logger.error(e.message)
             sys.exit(1)
     else:
         return {}
@@ -0,0 +1,103 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pyVmomi import vim, vmodl
+
+from lib import config as conf
+from lib.tools.collector import collect_properties
+from lib.tools.throttle import get_throttle
+
+
+class AsyncVimClient(object):
+    """asyncio facade over the blocking pyVmomi SOAP stub of a connection. Every SOAP call runs on a worker
+    thread of a bounded executor and HTTP connection pool of the stub is enlarged to the number of workers,
+    so connections are reused instead of being reopened. Waiting for updates uses a dedicated property
+    collector per waiter, so any number of coroutines can wait concurrently without sharing filters."""
+
+    def __init__(self, connection, workers=None):
+        self.connection = connection
+        self.content = connection.RetrieveContent()
+        self.workers = workers or conf.ASYNC_WORKERS
+        stub = connection._stub
+        stub.poolSize = max(stub.poolSize, self.workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def call(self, func, *args, **kwargs):
+        """Runs blocking pyVmomi call on worker thread and returns its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def retrieve_properties(self, type_paths, root=None, objects=None):
+        """Bulk retrieval of properties, returns list of (object, {path: value}) tuples."""
+        return await self.call(lambda: list(collect_properties(self.content, type_paths, root=root, objects=objects)))
+
+    async def submit_task(self, obj, method, *args, **kwargs):
+        """Calls *_Task method of the object through throttle of the vCenter and returns created vim.Task object."""
+        return await self.call(get_throttle(obj._stub).submit, obj, method, *args, **kwargs)
+
+    async def wait_for_updates(self, filter_spec, handler, timeout=None):
+        """Creates filter on a dedicated property collector and passes every updated object with its changes
+        to handler until it returns True. Returns False when timeout in seconds is reached."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        collector = await self.call(self.content.propertyCollector.CreatePropertyCollector)
+        try:
+            await self.call(collector.CreateFilter, filter_spec, True)
+            version = ''
+            while True:
+                max_wait = conf.ASYNC_UPDATE_WAIT
+                if deadline is not None:
+                    # 0 would return immediately, waiting for less than a second would then turn into busy loop
+                    max_wait = max(1, int(min(max_wait, deadline - loop.time())))
+                options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=max_wait)
+                update = await self.call(collector.WaitForUpdatesEx, version, options)
+                if update:
+                    version = update.version
+                    for filter_set in update.filterSet:
+                        for obj_set in filter_set.objectSet:
+                            if handler(obj_set.obj, obj_set.changeSet):
+                                return True
+                if deadline is not None and loop.time() >= deadline:
+                    return False
+        finally:
+            await self.call(collector.DestroyPropertyCollector)
+
+    async def wait_for_property(self, obj, path, predicate, timeout=None):
+        """Waits until value of the property satisfies predicate."""
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=obj)],
+                propSet=[vmodl.query.PropertyCollector.PropertySpec(type=type(obj), pathSet=[path])])
+
+        def handler(_, changes):
+            return any(change.name == path and predicate(change.val) for change in changes)
+        return await self.wait_for_updates(filter_spec, handler, timeout)
+
+    async def wait_for_tasks(self, tasks):
+        """Waits for all provided tasks to finish, error of the first failed task is raised."""
+        pending = set(str(task) for task in tasks)
+        if not pending:
+            return
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info.state', 'info.error'])
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=task) for task in tasks], propSet=[prop_spec])
+
+        throttle = get_throttle(self.connection._stub)
+
+        def handler(task, changes):
+            values = dict((change.name, change.val) for change in changes)
+            state = values.get('info.state')
+            if state == vim.TaskInfo.State.success:
+                pending.discard(str(task))
+                throttle.finish(task)
+            elif state == vim.TaskInfo.State.error:
+                throttle.finish(task)
+                raise values.get('info.error') or task.info.error
+            return not pending
+        try:
+            await self.wait_for_updates(filter_spec, handler)
+        finally:
+            for task in tasks:
+                throttle.finish(task)
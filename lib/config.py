@@ -17,6 +17,13 @@ def get_config(section, key, env_var, var_type, default=None):
     return default
 
 
+def as_list(value):
+    """Converts comma separated string (e.g. from environment variable) or YAML sequence into list."""
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return list(value)
+
+
 # If path to configuration file is not provided via environment variable VMCLI_CONFIG_FILE, an attempt is
 # made to load locally present file named 'vmcli.yml'.
 try:
@@ -31,6 +38,19 @@ LOG_FORMAT = get_config('logging', 'log_format', 'VMCLI_LOG_FORMAT', str, '%(asc
 LOG_PATH = get_config('logging', 'log_path', 'VMCLI_LOG_PATH', str, None)
 LOG_LEVEL = get_config('logging', 'log_level', 'VMCLI_LOG_LEVEL', str, 'WARNING')
 
+# Root directory of the vmcli project
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Directory where vmcli keeps its local state, e.g. caches and indexes reused between runs
+STATE_DIR = os.path.expanduser(get_config('general', 'state_dir', 'VMCLI_STATE_DIR', str, '~/.vmcli'))
+
+# Flavors are searched in flavors/ directory of the project, unless other location is configured
+FLAVORS_DIR = os.path.expanduser(get_config(
+        'flavors', 'path', 'VMCLI_FLAVORS_DIR', str,
+        os.path.join(BASE_DIR, 'flavors')))
+FLAVORS_CACHE = os.path.expanduser(get_config(
+        'flavors', 'cache', 'VMCLI_FLAVORS_CACHE', str, os.path.join(STATE_DIR, 'flavors.cache')))
+
 # Authentication directives
 # If password is neither provided via command line or present in ENV variable or configuration file,
 # user will be prompted to enter his password after program starts
@@ -38,11 +58,70 @@ USERNAME = get_config('authentication', 'username', 'VMCLI_USERNAME', str, None)
 PASSWORD = get_config('authentication', 'password', 'VMCLI_PASSWORD', str, None)
 VCENTER = get_config('authentication', 'vcenter', 'VMCLI_VCENTER', str, None)
 INSECURE_CONNECTION = get_config('authentication', 'insecure_connection', 'VMCLI_INSECURE_CONNECTION', bool, False)
+# When more vCenters are listed, vmcli connects to all of them and commands like list or power search them all.
+# Every item is either name of vCenter or dictionary with its own vcenter, username, password and insecure keys.
+VCENTERS = get_config('authentication', 'vcenters', 'VMCLI_VCENTERS', as_list, None)
 
 # Timeouts
 VM_OS_TIMEOUT = get_config('timeouts', 'os_timeout', None, int, 120)
 VM_TOOLS_TIMEOUT = get_config('timeouts', 'tools_timeout', None, int, 20)
 
+# Asynchronous client
+# Number of worker threads (and pooled HTTP connections) used to drive concurrent vCenter calls and the longest
+# time in seconds single WaitForUpdatesEx call is allowed to block.
+ASYNC_WORKERS = get_config('async', 'workers', 'VMCLI_ASYNC_WORKERS', int, 64)
+ASYNC_UPDATE_WAIT = get_config('async', 'update_wait', 'VMCLI_ASYNC_UPDATE_WAIT', int, 30)
+
+# Throttling of task submissions
+# Tasks are submitted at most rate per second (with bursts up to burst) and at most concurrency tasks run at once.
+# Concurrency grows up to max_concurrency while vCenter keeps up and it is halved when vCenter throttles or tasks
+# wait in its queue longer than queue_delay seconds. Throttled submissions are retried up to max_delay seconds.
+THROTTLE_RATE = get_config('throttle', 'rate', 'VMCLI_THROTTLE_RATE', float, 10)
+THROTTLE_BURST = get_config('throttle', 'burst', 'VMCLI_THROTTLE_BURST', int, 20)
+THROTTLE_CONCURRENCY = get_config('throttle', 'concurrency', 'VMCLI_THROTTLE_CONCURRENCY', int, 8)
+THROTTLE_MAX_CONCURRENCY = get_config('throttle', 'max_concurrency', 'VMCLI_THROTTLE_MAX_CONCURRENCY', int, 64)
+THROTTLE_QUEUE_DELAY = get_config('throttle', 'queue_delay', 'VMCLI_THROTTLE_QUEUE_DELAY', float, 5)
+THROTTLE_MAX_DELAY = get_config('throttle', 'max_delay', 'VMCLI_THROTTLE_MAX_DELAY', int, 60)
+
+# Retry policy
+# Calls failing due to network errors or expired session are repeated up to attempts times with exponentially
+# growing random delays between base_delay and max_delay seconds. Directives can be overriden per subcommand
+# in commands subsection, e.g. commands: {create: {attempts: 5}}.
+RETRY_ATTEMPTS = get_config('retry', 'attempts', 'VMCLI_RETRY_ATTEMPTS', int, 3)
+RETRY_BASE_DELAY = get_config('retry', 'base_delay', 'VMCLI_RETRY_BASE_DELAY', float, 1)
+RETRY_MAX_DELAY = get_config('retry', 'max_delay', 'VMCLI_RETRY_MAX_DELAY', float, 30)
+RETRY_COMMANDS = get_config('retry', 'commands', '', dict, {})
+
+# Inventory mirror
+# Names of inventory objects are kept in local SQLite database per vCenter and looked up there instead of walking
+# container views. Mirror is updated incrementally at most once per sync_interval seconds (0 syncs once per run)
+# and on every lookup miss. Mirror holds id of its vCenter session, so it is readable only by its owner.
+INVENTORY_MIRROR = get_config('inventory', 'mirror', 'VMCLI_INVENTORY_MIRROR', bool, False)
+INVENTORY_SYNC_INTERVAL = get_config('inventory', 'sync_interval', 'VMCLI_INVENTORY_SYNC_INTERVAL', int, 0)
+
+# Number of VMs retrieved in one property collector call by export subcommand
+EXPORT_PAGE_SIZE = get_config('export', 'page_size', 'VMCLI_EXPORT_PAGE_SIZE', int, 1000)
+
+# Number of entities queried with single QueryPerf call by stats subcommand
+STATS_BATCH_SIZE = get_config('stats', 'batch_size', 'VMCLI_STATS_BATCH_SIZE', int, 50)
+
+# Number of events or tasks read with single call by events subcommand and seconds between reads in follow mode
+EVENTS_PAGE_SIZE = get_config('events', 'page_size', 'VMCLI_EVENTS_PAGE_SIZE', int, 1000)
+EVENTS_FOLLOW_INTERVAL = get_config('events', 'follow_interval', 'VMCLI_EVENTS_FOLLOW_INTERVAL', int, 5)
+
+# Number of vms converged concurrently by apply subcommand, tasks are throttled as usual on top of this
+APPLY_WORKERS = get_config('apply', 'workers', 'VMCLI_APPLY_WORKERS', int, 16)
+
+# OVF import and export
+# Number of disks transferred concurrently, size of chunks in bytes streamed to or from ESXi hosts and seconds
+# between progress reports, which keep NFC lease alive.
+OVF_WORKERS = get_config('ovf', 'workers', 'VMCLI_OVF_WORKERS', int, 4)
+OVF_CHUNK_SIZE = get_config('ovf', 'chunk_size', 'VMCLI_OVF_CHUNK_SIZE', int, 8 * 1024 * 1024)
+OVF_PROGRESS_INTERVAL = get_config('ovf', 'progress_interval', 'VMCLI_OVF_PROGRESS_INTERVAL', int, 10)
+
+# Number of vms powered off and destroyed at once by destroy subcommand
+DESTROY_PARALLEL = get_config('destroy', 'parallel', 'VMCLI_DESTROY_PARALLEL', int, 16)
+
 # Deploy specific directives
 # It is recommended to use flavors instead!
 # These directives are overriden via command line arguments and flavor settings, the former being preffered
@@ -64,8 +143,41 @@ VM_DATASTORE = get_config('deploy', 'datastore', 'VMCLI_VM_DATASTORE', str, None
 VM_CLUSTER = get_config('deploy', 'cluster', 'VMCLI_VM_CLUSTER', str, None)
 VM_RESOURCE_POOL = get_config('deploy', 'resource_pool', 'VMCLI_VM_RESOURCE_POOL', str, None)
 
+# Placement engine picks cluster, host and datastore by live capacity data when auto_place is enabled.
+# Datastores are never filled above (1 - datastore_reserve) of their capacity and pending placements are
+# booked for booking_ttl seconds, so concurrently running deploys spread across available resources.
+VM_AUTO_PLACE = get_config('deploy', 'auto_place', 'VMCLI_VM_AUTO_PLACE', bool, False)
+PLACEMENT_DS_RESERVE = get_config('placement', 'datastore_reserve', 'VMCLI_PLACEMENT_DS_RESERVE', float, 0.1)
+PLACEMENT_BOOKING_TTL = get_config('placement', 'booking_ttl', 'VMCLI_PLACEMENT_BOOKING_TTL', int, 1800)
+
 VM_ADDITIONAL_CMDS = get_config('deploy', 'additional_commands', '', list, None)
 
+# Pool of pre-cloned running vms
+# Pool members of every flavor are kept in the same folder, size is the number of vms kept per flavor.
+POOL_FOLDER = get_config('pool', 'folder', 'VMCLI_POOL_FOLDER', str, 'vmcli-pool')
+POOL_SIZE = get_config('pool', 'size', 'VMCLI_POOL_SIZE', int, 2)
+POOL_LINKED = get_config('pool', 'linked', 'VMCLI_POOL_LINKED', bool, True)
+
+# Address management
+# Address pools of vCenter networks keyed by network name, every pool has cidr and optionally range, gateway and
+# exclude keys. Addresses are handed out by ipam subcommand and by create with --net-cfg auto.
+IPAM_POOLS = get_config('ipam', 'pools', '', dict, {})
+# Skip addresses reported by vmtools of existing vms, even when they were not allocated from the pool
+IPAM_SCAN = get_config('ipam', 'scan', 'VMCLI_IPAM_SCAN', bool, True)
+
+# Template replicas
+# Datastores holding replicas of templates kept in sync by template subcommand. Clones pick replica placed
+# on their target datastore, unless use_replicas is disabled.
+TEMPLATE_DATASTORES = get_config('template', 'datastores', 'VMCLI_TEMPLATE_DATASTORES', as_list, None)
+TEMPLATE_USE_REPLICAS = get_config('template', 'use_replicas', 'VMCLI_TEMPLATE_USE_REPLICAS', bool, True)
+
+# Content library
+# Index of library and item names is kept in state directory for cache_ttl seconds, workers is the number
+# of concurrent deploys or item syncs and sync_timeout the longest wait for subscribed item download.
+LIBRARY_CACHE_TTL = get_config('library', 'cache_ttl', 'VMCLI_LIBRARY_CACHE_TTL', int, 3600)
+LIBRARY_WORKERS = get_config('library', 'workers', 'VMCLI_LIBRARY_WORKERS', int, 4)
+LIBRARY_SYNC_TIMEOUT = get_config('library', 'sync_timeout', 'VMCLI_LIBRARY_SYNC_TIMEOUT', int, 3600)
+
 # Guest information
 # Login information used to access guests operating system
 VM_GUEST_USER = get_config('guest', 'guest_user', 'VMCLI_GUEST_USER', str, None)
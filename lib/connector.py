@@ -3,11 +3,15 @@ import getpass
 import requests
 import atexit
 import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pyVmomi import vim
 from pyVim.connect import SmartConnect, Disconnect
 
 from lib import config as conf
 from lib.tools.logger import logger
+from lib.tools.retry import get_retry_policy
+from lib.tools.views import forget_views
 from lib.exceptions import VmCLIException
 
 try:
@@ -23,6 +27,50 @@ except ImportError:
     HAS_AUTOMAT_SDK_INSTALLED = False
 
 
+# Credentials used to log in to every vCenter, kept to renew sessions which expire during long runs
+_credentials = {}
+
+
+def login(vcenter, username, password, insecure=False, session_id=None, keep_session=False):
+    """Authenticates against single vCenter and returns connection object. Failures are raised as
+    VmCLIException, so callers connecting to many vCenters can decide how to handle them. Existing session
+    can be reused via session_id and keep_session leaves the session logged in after program exits."""
+    sslContext = None
+    if insecure:
+        requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
+        # Create SSL context for connection without certificate checks
+        sslContext = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        sslContext.verify_mode = ssl.CERT_NONE
+
+    try:
+        connection = get_retry_policy().call(
+                lambda: SmartConnect(host=vcenter, user=username, pwd=password, sslContext=sslContext,
+                                     sessionId=session_id),
+                description='Connection to {}'.format(vcenter))
+    except vim.fault.InvalidLogin:
+        raise VmCLIException('Unable to connect. Check your credentials!')
+    except (requests.exceptions.SSLError, requests.exceptions.ConnectionError) as e:
+        raise VmCLIException(str(e))
+    except vim.fault.HostConnectFault as e:
+        raise VmCLIException(e.msg)
+    if username:
+        _credentials[connection._stub.host] = (username, password)
+    if not keep_session:
+        # Register function to be executed at termination, eg. session cleanup
+        atexit.register(Disconnect, connection)
+    return connection
+
+
+def relogin(stub):
+    """Logs in again through existing SOAP stub after its session expired, e.g. due to vCenter restart.
+    Managed objects bound to the stub keep working with the new session."""
+    username, password = _credentials.get(stub.host, (conf.USERNAME, conf.PASSWORD))
+    logger.info('Session expired, logging in to {} again...'.format(stub.host))
+    vim.ServiceInstance('ServiceInstance', stub).RetrieveContent().sessionManager.Login(username, password)
+    # container views belonged to the previous session
+    forget_views(stub.host)
+
+
 def connect(vcenter=None, username=None, password=None, insecure=None):
     """Creates connection object authenticated against provided vCenter. Created object can be than used
     up to user's permissions to interact with the vCenter via API."""
@@ -34,35 +82,70 @@ def connect(vcenter=None, username=None, password=None, insecure=None):
     # If only password is missing, prompt user interactively
     if (vcenter and username) and not password:
         password = getpass.getpass()
-        conf.PASSWORD = password
     elif not (vcenter and username and password):
         logger.error('No authentication credentials provided!')
         sys.exit(1)
+    # Remember credentials actually used, so they can be reused e.g. by spawned vmcli processes
+    conf.VCENTER, conf.USERNAME, conf.PASSWORD, conf.INSECURE_CONNECTION = vcenter, username, password, insecure
 
-    sslContext = None
-    if insecure:
-        requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-        # Create SSL context for connection without certificate checks
-        sslContext = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-        sslContext.verify_mode = ssl.CERT_NONE
-
-    connection = None
     try:
         logger.info('Trying to connect to {}...'.format(vcenter))
-        # Load connection object into global variable
-        connection = SmartConnect(host=vcenter, user=username, pwd=password, sslContext=sslContext)
-        # Register function to be executed at termination, eg. session cleanup
-        atexit.register(Disconnect, connection)
+        connection = login(vcenter, username, password, insecure)
         logger.info('Connection successful!')
         return connection
-    except vim.fault.InvalidLogin:
-        logger.error('Unable to connect. Check your credentials!')
-        sys.exit(1)
-    except (requests.exceptions.SSLError, requests.exceptions.ConnectionError) as e:
+    except VmCLIException as e:
         logger.error(e.message)
         sys.exit(1)
 
 
+def connect_all(vcenters=None, username=None, password=None, insecure=None):
+    """Connects concurrently to all vCenters listed in authentication.vcenters directive. Every entry is either
+    vCenter name using shared credentials or dictionary with its own vcenter, username, password and insecure
+    keys. vCenters which fail to connect are skipped with warning. Returns ordered dictionary of vCenter names
+    and connection objects."""
+    vcenters = vcenters or conf.VCENTERS or []
+    username = username or conf.USERNAME
+    password = password or conf.PASSWORD
+    insecure = insecure or conf.INSECURE_CONNECTION
+
+    endpoints = []
+    for entry in vcenters:
+        if isinstance(entry, dict):
+            endpoints.append([entry.get('vcenter'), entry.get('username') or username, entry.get('password'),
+                              entry.get('insecure', insecure)])
+        else:
+            endpoints.append([str(entry), username, None, insecure])
+
+    if not endpoints or not all(endpoint[0] and endpoint[1] for endpoint in endpoints):
+        logger.error('No authentication credentials provided!')
+        sys.exit(1)
+    # Prompt for shared password only once, before all connections are opened
+    if not password and any(not endpoint[2] for endpoint in endpoints):
+        password = getpass.getpass()
+    for endpoint in endpoints:
+        endpoint[2] = endpoint[2] or password
+
+    logger.info('Trying to connect to {}...'.format(', '.join(endpoint[0] for endpoint in endpoints)))
+    connections = OrderedDict()
+    with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+        futures = [(endpoint, executor.submit(login, *endpoint)) for endpoint in endpoints]
+        for endpoint, future in futures:
+            try:
+                connections[endpoint[0]] = future.result()
+            except VmCLIException as e:
+                logger.warning('Skipping vCenter {}: {}'.format(endpoint[0], e.message))
+
+    if not connections:
+        logger.error('Unable to connect to any vCenter!')
+        sys.exit(1)
+
+    logger.info('Connected to {} vCenters'.format(len(connections)))
+    # First connected vCenter is used for operations which are not spread across vCenters
+    primary = [endpoint for endpoint in endpoints if endpoint[0] in connections][0]
+    conf.VCENTER, conf.USERNAME, conf.PASSWORD, conf.INSECURE_CONNECTION = primary
+    return connections
+
+
 def automationSDKConnect(vcenter=None, username=None, password=None, insecure=None):
     """Creates stub_config with connection object for advanced features like VM Tagging present
     in vsphere-automation-sdk-python library, which is required to be installed:
@@ -1,23 +1,36 @@
 import os
 import sys
 import time
+import datetime
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from importlib import import_module
 from pyVmomi import vim, vmodl
 
 from lib.tools.logger import logger
 from lib.exceptions import VmCLIException
+from lib.aio import AsyncVimClient
+from lib.tools.inventory import InventoryMirror, get_inventory_mirror
+from lib.tools.throttle import get_throttle
+from lib.tools.retry import get_retry_policy
+from lib.tools.records import load_records
+from lib.tools.pathindex import get_path_index
+from lib.connector import relogin
 
+from lib import config as conf
 from lib.config import VM_OS_TIMEOUT, VM_TOOLS_TIMEOUT
 from lib.constants import VMWARE_TYPES
 
-try:
-    # unfortunately, module_loader overwrittes builtin list function with subcommands name
-    # during import_module('lib.modules.list'), this will help to restore it later in get_obj
-    import builtins
-except ImportError:
-    import __builtin__ as builtins
 
+# Lookups of vms indexed by vCenter, selected by prefix of the name, e.g. uuid:4211c0de-...
+VM_LOOKUPS = {
+    # BIOS uuid is tried first, instance uuid afterwards
+    'uuid': lambda index, value: (index.FindByUuid(None, value, vmSearch=True, instanceUuid=False) or
+                                  index.FindByUuid(None, value, vmSearch=True, instanceUuid=True)),
+    'path': lambda index, value: index.FindByInventoryPath(value),
+    'ip': lambda index, value: index.FindByIp(None, value, True),
+    'dns': lambda index, value: index.FindByDnsName(None, value, True),
+}
 
 # Object containing registered subcommands to be available to user. Dictionary is used in command line argument
 # parsing of arguments defined with @args decorator as well as subcommand execution.
@@ -45,58 +58,183 @@ def module_loader(file_name):
 class BaseCommands(object):
     """Introduces base class for other Commands classes with sharing of same connection content
     and object retrieval. Should be subclassed and its method execute() overriden. Docstring of the
-    BaseCommands class should be overriden as well, beacause it will be used as a help for subcommand."""
+    BaseCommands class should be overriden as well, beacause it will be used as a help for subcommand.
+    Subcommands working only with local data can set requires_connection to False to skip vCenter login.
+    When more vCenters are configured, sites holds connections to all of them and lookups span all sites."""
+    requires_connection = True
+    # name of the subcommand, set on registration and used to select its retry policy
+    command = None
 
-    def __init__(self, connection=None):
+    def __init__(self, connection=None, sites=None):
         self.logger = logger
         self.connection = connection
+        self.sites = sites or OrderedDict()
+        self._aio = None
         if connection:
             self.content = connection.RetrieveContent()
         else:
             self.content = None
 
+    def async_client(self):
+        """Returns asynchronous client sharing connection of the command, created on first use."""
+        if self._aio is None:
+            self._aio = AsyncVimClient(self.connection)
+        return self._aio
+
     def execute(self, args):
         """Routes to a correct method based on arguments provided. This is also the perfect place
         to define generic arguments, which should be used for every method, via args decorator."""
         raise NotImplementedError("Cannot call super's execute() method! This method must be overidden.")
 
-    def get_obj(self, vimtype, name, default=False):
+    def get_obj(self, vimtype, name, default=False, content=None):
         """Gets the vsphere object associated with a given text name.
-        If default is set to True and name does not match, return first object found."""
+        If default is set to True and name does not match, return first object found.
+        Content of other vCenter than the one of the command can be provided to search there."""
+        vimtype = VMWARE_TYPES.get(vimtype, None)
+        if not vimtype:
+            raise VmCLIException('Provided type does not match any existing VMware object types!')
+
+        content = content or self.content
+        if conf.INVENTORY_MIRROR and content is self.content:
+            return self.get_mirrored_obj(vimtype, name, default)
+
+        # names are retrieved with single bulk call, objects are kept as compact records while searching
+        # and only the matching one is turned back into managed object
+        first = None
+        for record in load_records(content, [vimtype]):
+            if name is not None and record.name == name:
+                return record.to_object(content.rootFolder._stub)
+            if first is None or record.name < first.name:
+                first = record
+
+        # If searched object is not found and default is True, provide first instance found in alphabetical order
+        if default and first is not None:
+            return first.to_object(content.rootFolder._stub)
+        return None
+
+    def get_container_obj(self, vimtype, name, bases=()):
+        """Same as get_obj for folders and resource pools, but names containing / are taken as inventory paths,
+        either full (dc1/vm/team/prod) or relative to any of bases objects, e.g. datacenter's vmFolder or cluster.
+        Paths are resolved exactly via path index, when path is not found, its last part is looked up as a name."""
+        if name and '/' in name:
+            obj = get_path_index(self.content).resolve(name, VMWARE_TYPES[vimtype], bases)
+            if obj is not None:
+                return obj
+            self.logger.debug('Path {} not found in inventory, looking up {} by its name'.format(name, vimtype))
+            name = name.rstrip('/').split('/')[-1]
+        return self.get_obj(vimtype, name)
+
+    def get_mirrored_obj(self, vimtype, name, default=False):
+        """Same as get_obj, but the object is looked up in local inventory mirror of the vCenter."""
+        kind = [key for key, value in VMWARE_TYPES.items() if value is vimtype][0]
+        mirror = get_inventory_mirror(conf.VCENTER)
+        synced = mirror.ensure_fresh()
+        row = mirror.lookup(kind, name)
+        if row is None and name is not None and not synced:
+            # object could have been created since the last sync
+            mirror.sync()
+            row = mirror.lookup(kind, name)
+        if row is None and default:
+            row = mirror.lookup(kind, None, default=True)
+        return InventoryMirror.to_object(row, self.connection._stub) if row else None
+
+    async def async_get_obj(self, vimtype, name, default=False):
+        """Asynchronous variant of get_obj. Names of all objects are fetched with single bulk retrieval."""
         vimtype = VMWARE_TYPES.get(vimtype, None)
         if not vimtype:
             raise VmCLIException('Provided type does not match any existing VMware object types!')
 
-        container = self.content.viewManager.CreateContainerView(self.content.rootFolder, [vimtype], True)
-        if name is not None:
-            for item in container.view:
-                if item.name == name:
-                    return item
-
-        # If searched object is not found and default is True, provide first instance found
-        if default:
-            # Order result list before selecting default
-            list = builtins.list
-            view_items = list({x.name: x for x in container.view}.items())
-            sorted_view = OrderedDict(sorted(view_items, key=lambda t: t[0]))
-            sorted_view = list(sorted_view.values())
-            try:
-                return sorted_view[0]
-            except IndexError:
-                return None
+        items = await self.async_client().retrieve_properties({vimtype: ['name']})
+        items = sorted(((props.get('name'), obj) for obj, props in items), key=lambda t: t[0] or '')
+        for item_name, obj in items:
+            if name is not None and item_name == name:
+                return obj
+
+        if default and items:
+            return items[0][1]
+        return None
+
+    def for_each_site(self, func):
+        """Calls func(vcenter, content) for every connected vCenter in parallel. Results are yielded as
+        (vcenter, result) tuples in the order in which vCenters respond."""
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self.sites)))
+        try:
+            futures = dict((executor.submit(lambda s, c: func(s, c.RetrieveContent()), site, conn), site)
+                           for site, conn in self.sites.items())
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # do not wait for slower vCenters, when caller is already satisfied with the results
+            executor.shutdown(wait=False)
+
+    def find_obj(self, vimtype, name):
+        """Same as get_obj, but with more vCenters connected all of them are searched in parallel and
+        the object found first is returned."""
+        if len(self.sites) < 2:
+            return self.get_obj(vimtype, name)
+
+        for site, obj in self.for_each_site(lambda site, content: self.get_obj(vimtype, name, content=content)):
+            if obj is not None:
+                self.logger.info('Found {} {} on vCenter {}'.format(vimtype, name, site))
+                return obj
         return None
 
-    def get_vm_obj(self, name, fail_missing=False):
-        """Checks if passed object is of vim.VirtualMachine type, if not retrieves it from container view"""
+    def get_content(self, obj):
+        """Returns service content of the vCenter the object belongs to. Objects found on other vCenters
+        carry their own stub, which is used instead of the command's connection."""
+        if self.connection is not None and obj._stub is self.connection._stub:
+            return self.content
+        return vim.ServiceInstance('ServiceInstance', obj._stub).RetrieveContent()
+
+    def get_vm_obj(self, name, fail_missing=False, datacenter=None, folder=None):
+        """Checks if passed object is of vim.VirtualMachine type, if not retrieves it by its name. Name prefixed
+        with uuid:, path:, ip: or dns: is looked up via vCenter's search index with single call. When folder
+        (object or path within datacenter's vm folder) is known, vm is looked up directly there first, before
+        falling back to the search of the whole inventory."""
         if isinstance(name, vim.VirtualMachine):
             return name
+
+        # name is optional for some subcommands, missing name is reported as missing vm
+        mode, _, value = (name or '').partition(':')
+        if mode in VM_LOOKUPS and value:
+            vm = self.search_vm(mode, value)
         else:
             self.logger.info('Loading required VMware resources...')
-            vm = self.get_obj('vm', name)
+            vm = None
+            if name:
+                vm = self.find_vm_in_folder(name, datacenter or conf.VM_DATACENTER, folder or conf.VM_FOLDER)
+            if vm is None:
+                vm = self.find_obj('vm', name)
 
-            if not vm and fail_missing:
-                raise VmCLIException('Unable to find specified VM {}! Aborting...'.format(name))
-            return vm
+        if not vm and fail_missing:
+            raise VmCLIException('Unable to find specified VM {}! Aborting...'.format(name))
+        return vm
+
+    def search_vm(self, mode, value):
+        """Looks up vm via search index of every connected vCenter, mode is one of VM_LOOKUPS keys."""
+        def search(site, content):
+            obj = VM_LOOKUPS[mode](content.searchIndex, value)
+            return obj if isinstance(obj, vim.VirtualMachine) else None
+
+        if len(self.sites) < 2:
+            return search(None, self.content)
+        for site, obj in self.for_each_site(search):
+            if obj is not None:
+                self.logger.info('Found vm {} on vCenter {}'.format(value, site))
+                return obj
+        return None
+
+    def find_vm_in_folder(self, name, datacenter, folder):
+        """Returns vm of the name placed directly in the folder or None. Folder object is searched with FindChild,
+        folder path needs datacenter to build full inventory path for FindByInventoryPath."""
+        if isinstance(folder, vim.Folder):
+            obj = self.get_content(folder).searchIndex.FindChild(folder, name)
+        elif folder and datacenter:
+            path = '/'.join([datacenter, 'vm', folder.strip('/'), name])
+            obj = self.content.searchIndex.FindByInventoryPath(path)
+        else:
+            return None
+        return obj if isinstance(obj, vim.VirtualMachine) else None
 
     @staticmethod
     def register(name, class_name):
@@ -106,10 +244,62 @@ class BaseCommands(object):
             raise VmCLIException('Subcommand with the name {} already registered!'.format(name))
         else:
             COMMANDS[name] = class_name
+            if 'command' not in class_name.__dict__:
+                class_name.command = name
+
+    def retry(self, func, check=None, stub=None, description='vCenter call'):
+        """Calls func with retry policy of the subcommand. Expired session of the stub (connection of the command
+        by default) is renewed automatically, check is an idempotency test described in RetryPolicy.call."""
+        stub = stub or self.connection._stub
+        return get_retry_policy(self.command).call(func, check=check, relogin=lambda: relogin(stub),
+                                                   description=description)
+
+    def submit_task(self, obj, method, *args, **kwargs):
+        """Calls *_Task method of a managed object and returns created task. Submissions are rate limited and
+        number of concurrently running tasks adapts to how fast vCenter keeps up. When submission fails due
+        to network error, it is repeated only if vCenter did not create the task in the meantime."""
+        started = time.time()
+        return self.retry(lambda: get_throttle(obj._stub).submit(obj, method, *args, **kwargs),
+                          check=lambda: self.find_submitted_task(obj, method, started), stub=obj._stub,
+                          description='Submission of {}'.format(method))
+
+    def find_submitted_task(self, obj, method, started):
+        """Returns task of the method running or finished on the object, which was created after started."""
+        try:
+            name = obj._GetMethodInfo(method).wsdlName
+        except AttributeError:
+            name = method
+        content = self.get_content(obj)
+        # local and vCenter clocks can differ, start time is translated to vCenter's time
+        since = content.CurrentTime() - datetime.timedelta(seconds=time.time() - started + 1)
+        for task in getattr(obj, 'recentTask', None) or []:
+            info = task.info
+            # name of task info is the managed method itself, its wsdl name identifies the method
+            task_name = getattr(getattr(info.name, 'info', None), 'wsdlName', info.name)
+            if task_name == name and info.queueTime >= since and info.state != vim.TaskInfo.State.error:
+                return task
+        return None
 
     def wait_for_tasks(self, tasks):
         """Method waits for all of the provided tasks and returns after they finished their runs."""
-        property_collector = self.content.propertyCollector
+        # Tasks running on different vCenters are watched through property collectors of their own vCenters
+        site_tasks = OrderedDict()
+        for task in tasks:
+            site_tasks.setdefault(id(task._stub), []).append(task)
+        if len(site_tasks) > 1:
+            for group in site_tasks.values():
+                self.wait_for_tasks(group)
+            return
+
+        # Waiting does not change anything, so it is simply repeated after network failures
+        self.retry(lambda: self.watch_tasks(tasks), stub=tasks[0]._stub if tasks else None,
+                   description='Waiting for tasks')
+
+    def watch_tasks(self, tasks):
+        """Watches tasks of a single vCenter until all of them finish, error of the first failed task is raised."""
+        content = self.get_content(tasks[0]) if tasks else self.content
+        property_collector = content.propertyCollector
+        throttle = get_throttle(tasks[0]._stub if tasks else self.connection._stub)
         task_list = [str(task) for task in tasks]
         self.logger.debug('Waiting for the following tasks to finish their runs:')
         for task in task_list:
@@ -144,14 +334,26 @@ class BaseCommands(object):
                                 # Remove task from taskList
                                 self.logger.debug('Task {} has finished'.format(str(task)))
                                 task_list.remove(str(task))
+                                throttle.finish(task, change.val if change.name == 'info' else None)
                             elif state == vim.TaskInfo.State.error:
+                                throttle.finish(task, change.val if change.name == 'info' else None)
                                 raise task.info.error
                 # Move to next version
                 version = update.version
         finally:
+            # slots of tasks left running after failure are freed as well
+            for task in tasks:
+                throttle.finish(task)
             if pcfilter:
                 pcfilter.Destroy()
 
+    async def async_wait_for_tasks(self, tasks):
+        """Asynchronous variant of wait_for_tasks, which lets other coroutines run while waiting."""
+        self.logger.debug('Waiting for the following tasks to finish their runs:')
+        for task in tasks:
+            self.logger.debug('  * {}'.format(task))
+        await self.async_client().wait_for_tasks(tasks)
+
     def wait_for_guest_os(self, vm, timeout=VM_OS_TIMEOUT):
         """Returns when guest's OS has finished booting up or when timeout is reached."""
         self.logger.info("Waiting for guest's OS to be ready... (timeout {}s)".format(timeout))
@@ -174,6 +376,23 @@ class BaseCommands(object):
             time.sleep(5)
             time_wait += 5
 
+    async def async_wait_for_guest_os(self, vm, timeout=VM_OS_TIMEOUT):
+        """Asynchronous variant of wait_for_guest_os, property changes are pushed by vCenter instead of polling."""
+        self.logger.info("Waiting for guest's OS to be ready... (timeout {}s)".format(timeout))
+        client = self.async_client()
+        if not await client.wait_for_property(vm, 'guest.guestState', lambda state: state == 'running', timeout):
+            self.logger.error("Timeout reached while waiting for vm's OS to boot up...")
+            return False
+
+    async def async_wait_for_guest_vmtools(self, vm, timeout=VM_TOOLS_TIMEOUT):
+        """Asynchronous variant of wait_for_guest_vmtools."""
+        self.logger.info("Waiting for guest's vmtools to be ready... (timeout {}s)".format(timeout))
+        client = self.async_client()
+        if not await client.wait_for_property(vm, 'guest.toolsStatus',
+                                              lambda status: status in ['toolsOk', 'toolsOld'], timeout):
+            self.logger.error("Timeout reached while waiting for vm's vmtools process...")
+            return False
+
     def exit(self, msg, errno=1):
         """Provides way to fail during execution."""
         self.logger.error(msg)
@@ -0,0 +1,336 @@
+import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.modules import BaseCommands
+from lib.tools import normalize_memory
+from lib.tools.argparser import args
+from lib.tools.collector import collect_properties
+from lib.connector import automationSDKConnect
+from lib.exceptions import VmCLIException
+
+import lib.constants as c
+
+from lib.modules.tag import TagCommands, HAS_AUTOMAT_SDK_INSTALLED
+
+if HAS_AUTOMAT_SDK_INSTALLED:
+    from com.vmware.cis.tagging_client import TagAssociation
+    from com.vmware.vapi.std_client import DynamicID
+
+
+VM_PROPERTIES = ['name', 'config.hardware.numCPU', 'config.hardware.memoryMB', 'config.hardware.device',
+                 'runtime.powerState']
+POWER_STATES = {
+    'on': 'poweredOn',
+    'off': 'poweredOff',
+}
+
+
+class Change(object):
+    """Single difference between declared and current state of a vm."""
+
+    def __init__(self, kind, description, device_spec=None, **config):
+        self.kind = kind
+        self.description = description
+        self.device_spec = device_spec
+        self.config = config
+
+    def __str__(self):
+        return self.description
+
+
+class ApplyCommands(BaseCommands):
+    """converge existing vms to the state declared in fleet file (cpu, memory, disks, nics, power and tags)."""
+
+    def __init__(self, *args, **kwargs):
+        super(ApplyCommands, self).__init__(*args, **kwargs)
+        self.networks = {}
+        self.portgroups = {}
+
+    @args('-f', '--file', required=True, help='YAML file declaring vms and their desired state', dest='fleet_file')
+    @args('--dry-run', help='only print changes, which would be made', action='store_true')
+    @args('--workers', help='number of vms converged concurrently', type=int, map='APPLY_WORKERS')
+    def execute(self, args):
+        try:
+            fleet = self.load_fleet(args.fleet_file)
+            current = self.get_current_state(list(fleet))
+            missing = [name for name in fleet if name not in current]
+            for name in missing:
+                self.logger.error('VM {} does not exist, create it first'.format(name))
+
+            plans = dict((name, self.diff(name, fleet[name], current[name])) for name in fleet if name in current)
+            tagged = [name for name in plans if fleet[name].get('tags')]
+            stub_config = None
+            if tagged:
+                stub_config, tags, attached = self.get_tags(args, fleet, [current[name]['obj'] for name in tagged])
+                for name in tagged:
+                    plans[name].extend(self.diff_tags(
+                            fleet[name]['tags'], tags, attached.get(current[name]['obj']._GetMoId(), set())))
+
+            changed = dict((name, plan) for name, plan in plans.items() if plan)
+            for name in sorted(changed):
+                print('{}: {}'.format(name, ', '.join(str(change) for change in changed[name])))
+            print('{} vms up to date, {} to change, {} missing'.format(
+                    len(plans) - len(changed), len(changed), len(missing)))
+            if args.dry_run or not changed:
+                if missing:
+                    raise VmCLIException('Some declared vms do not exist!')
+                return
+
+            failed = self.converge(changed, current, stub_config, args.workers)
+            if failed or missing:
+                raise VmCLIException('Failed to converge {} vms!'.format(len(failed) + len(missing)))
+        except VmCLIException as e:
+            self.exit(e.message, errno=6)
+
+    def load_fleet(self, path):
+        """Loads fleet file. Its vms section maps names of vms to their desired state, values of defaults
+        section apply to every vm, which does not override them."""
+        try:
+            with open(path) as fleet_file:
+                document = yaml.safe_load(fleet_file) or {}
+        except (IOError, OSError, yaml.YAMLError) as e:
+            raise VmCLIException('Unable to load fleet file {}: {}'.format(path, e))
+
+        defaults = document.get('defaults') or {}
+        fleet = {}
+        for name, state in (document.get('vms') or {}).items():
+            fleet[name] = dict(defaults, **(state or {}))
+            power = fleet[name].get('power')
+            # YAML reads bare on and off as booleans
+            if isinstance(power, bool):
+                fleet[name]['power'] = 'on' if power else 'off'
+            if fleet[name].get('power') not in (None, 'on', 'off'):
+                raise VmCLIException('Power of vm {} must be on or off!'.format(name))
+        if not fleet:
+            raise VmCLIException('Fleet file {} does not declare any vms!'.format(path))
+        return fleet
+
+    def get_current_state(self, names):
+        """Retrieves state of all declared vms together with networks and switches they may refer to with
+        single bulk property retrieval. Returns dictionary of vm name: properties."""
+        type_paths = {
+            vim.VirtualMachine: VM_PROPERTIES,
+            vim.Network: ['name'],
+            vim.dvs.DistributedVirtualPortgroup: ['name', 'key', 'config.distributedVirtualSwitch'],
+            vim.DistributedVirtualSwitch: ['uuid'],
+        }
+        wanted = set(names)
+        current, portgroups, switches = {}, {}, {}
+        for obj, props in collect_properties(self.content, type_paths):
+            if isinstance(obj, vim.VirtualMachine):
+                if props.get('name') in wanted:
+                    if props['name'] in current:
+                        self.logger.warning('More vms named {} found, using the first one'.format(props['name']))
+                        continue
+                    current[props['name']] = dict(props, obj=obj)
+            elif isinstance(obj, vim.dvs.DistributedVirtualPortgroup):
+                portgroups[props.get('key')] = dict(props, obj=obj)
+                self.networks[obj._GetMoId()] = props.get('name')
+            elif isinstance(obj, vim.DistributedVirtualSwitch):
+                switches[obj._GetMoId()] = props.get('uuid')
+            else:
+                self.networks[obj._GetMoId()] = props.get('name')
+
+        for key, props in portgroups.items():
+            switch = props.get('config.distributedVirtualSwitch')
+            props['switch_uuid'] = switches.get(switch._GetMoId()) if switch is not None else None
+            self.portgroups[key] = props
+        self.logger.debug('Loaded state of {} vms'.format(len(current)))
+        return current
+
+    def get_network_name(self, nic):
+        """Returns name of the network the ethernet card is connected to."""
+        backing = nic.backing
+        if isinstance(backing, vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo):
+            return self.portgroups.get(backing.port.portgroupKey, {}).get('name')
+        if getattr(backing, 'network', None) is not None:
+            return self.networks.get(backing.network._GetMoId())
+        return getattr(backing, 'deviceName', None)
+
+    def network_backing(self, net):
+        """Returns backing connecting ethernet card to the network of provided name."""
+        for props in self.portgroups.values():
+            if props.get('name') == net:
+                port = vim.dvs.PortConnection(portgroupKey=props['key'], switchUuid=props['switch_uuid'])
+                return vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo(port=port)
+        for moid, name in self.networks.items():
+            if name == net:
+                return vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(
+                        useAutoDetect=False, network=vim.Network(moid, self.content.rootFolder._stub),
+                        deviceName=net)
+        raise VmCLIException('Unable to find provided network {}! Aborting...'.format(net))
+
+    def diff(self, name, desired, props):
+        """Returns list of changes needed to bring the vm into desired state. Disks are only grown or added
+        and nics only re-attached or added, devices not declared are left untouched."""
+        changes = []
+        cpu = desired.get('cpu')
+        if cpu and cpu != props.get('config.hardware.numCPU'):
+            if cpu < c.VM_MIN_CPU or cpu > c.VM_MAX_CPU:
+                raise VmCLIException('CPU count of vm {} must be between {}-{}'.format(
+                        name, c.VM_MIN_CPU, c.VM_MAX_CPU))
+            changes.append(Change('config', 'cpu {} -> {}'.format(props.get('config.hardware.numCPU'), cpu),
+                                  numCPUs=cpu))
+
+        mem = normalize_memory(desired['mem']) if desired.get('mem') else None
+        if mem and mem != props.get('config.hardware.memoryMB'):
+            changes.append(Change('config', 'mem {} -> {}'.format(props.get('config.hardware.memoryMB'), mem),
+                                  memoryMB=mem))
+
+        devices = props.get('config.hardware.device') or []
+        if desired.get('disks'):
+            changes.extend(self.diff_disks(name, desired['disks'], devices))
+        if desired.get('nics'):
+            changes.extend(self.diff_nics(desired['nics'], devices))
+
+        power = POWER_STATES.get(desired.get('power'))
+        if power and power != props.get('runtime.powerState'):
+            changes.append(Change(power, 'power {} -> {}'.format(props.get('runtime.powerState'), power)))
+        return changes
+
+    def diff_disks(self, name, sizes, devices):
+        """Compares declared sizes of disks in gigabytes with existing disks ordered by controller and unit."""
+        disks = sorted([d for d in devices if isinstance(d, vim.vm.device.VirtualDisk)],
+                       key=lambda d: (d.controllerKey, d.unitNumber))
+        changes = []
+        free_units = None
+        for index, size in enumerate(sizes):
+            if size < c.VM_MIN_HDD or size > c.VM_MAX_HDD:
+                raise VmCLIException('Hdd size must be between {}-{}'.format(c.VM_MIN_HDD, c.VM_MAX_HDD))
+            capacity = size * 1024 * 1024
+            if index < len(disks):
+                disk = disks[index]
+                if capacity > disk.capacityInKB:
+                    description = 'disk {} {}G -> {}G'.format(index + 1, disk.capacityInKB // 1024 // 1024, size)
+                    disk.capacityInKB = capacity
+                    disk.capacityInBytes = capacity * 1024
+                    spec = vim.vm.device.VirtualDeviceSpec(
+                            device=disk, operation=vim.vm.device.VirtualDeviceSpec.Operation.edit)
+                    changes.append(Change('config', description, device_spec=spec))
+                elif capacity < disk.capacityInKB:
+                    self.logger.warning('Disk {} of vm {} cannot be shrunk, skipping'.format(index + 1, name))
+                continue
+
+            if free_units is None:
+                controller, free_units = self.get_free_units(name, devices)
+            if not free_units:
+                raise VmCLIException('The SCSI controller of vm {} does not support any more disks!'.format(name))
+            disk = vim.vm.device.VirtualDisk(key=-(index + 1), controllerKey=controller.key,
+                                             unitNumber=free_units.pop(0), capacityInKB=capacity,
+                                             capacityInBytes=capacity * 1024)
+            disk.backing = vim.vm.device.VirtualDisk.FlatVer2BackingInfo(diskMode='persistent', thinProvisioned=True)
+            spec = vim.vm.device.VirtualDeviceSpec(device=disk, fileOperation='create',
+                                                   operation=vim.vm.device.VirtualDeviceSpec.Operation.add)
+            changes.append(Change('config', 'disk {} +{}G'.format(index + 1, size), device_spec=spec))
+        return changes
+
+    @staticmethod
+    def get_free_units(name, devices):
+        """Returns first SCSI controller of the vm and unit numbers still available on it."""
+        controllers = [d for d in devices if isinstance(d, vim.vm.device.VirtualSCSIController)]
+        if not controllers:
+            raise VmCLIException('VM {} has no SCSI controller to attach disks to!'.format(name))
+        controller = controllers[0]
+        used = set(d.unitNumber for d in devices if d.controllerKey == controller.key)
+        # unit 7 is reserved for SCSI controller itself
+        return controller, [unit for unit in range(16) if unit != 7 and unit not in used]
+
+    def diff_nics(self, networks, devices):
+        """Compares declared networks with networks of existing ethernet cards in their order."""
+        nics = [d for d in devices if isinstance(d, vim.vm.device.VirtualEthernetCard)]
+        changes = []
+        for index, net in enumerate(networks):
+            if index < len(nics):
+                current = self.get_network_name(nics[index])
+                if current == net:
+                    continue
+                nic = nics[index]
+                nic.backing = self.network_backing(net)
+                spec = vim.vm.device.VirtualDeviceSpec(
+                        device=nic, operation=vim.vm.device.VirtualDeviceSpec.Operation.edit)
+                changes.append(Change('config', 'nic {} {} -> {}'.format(index + 1, current, net), device_spec=spec))
+            else:
+                nic = vim.vm.device.VirtualVmxnet3(key=-(100 + index), deviceInfo=vim.Description(),
+                                                   backing=self.network_backing(net))
+                nic.connectable = vim.vm.device.VirtualDevice.ConnectInfo(
+                        connected=False, startConnected=True, allowGuestControl=True)
+                spec = vim.vm.device.VirtualDeviceSpec(
+                        device=nic, operation=vim.vm.device.VirtualDeviceSpec.Operation.add)
+                changes.append(Change('config', 'nic {} +{}'.format(index + 1, net), device_spec=spec))
+        return changes
+
+    def get_tags(self, args, fleet, vms):
+        """Logs into vAPI, looks up declared tags and retrieves tags attached to all vms with single call.
+        Returns vAPI stub configuration, dictionary of tag name: tag id and dictionary of vm moid: set of ids
+        of tags attached to the vm."""
+        if not HAS_AUTOMAT_SDK_INSTALLED:
+            raise VmCLIException('Required vsphere-automation-sdk-python not installed. Exiting...')
+
+        stub_config = automationSDKConnect(args.vcenter, args.username, args.password, args.insecure)
+        names = sorted(set(tag for state in fleet.values() for tag in state.get('tags') or []))
+        tags = dict((tag.name, tag.id) for tag in TagCommands(self.connection).find_tags(stub_config, names))
+
+        attached = {}
+        object_ids = [DynamicID(type='VirtualMachine', id=vm._GetMoId()) for vm in vms]
+        for item in TagAssociation(stub_config).list_attached_tags_on_objects(object_ids):
+            attached[item.object_id.id] = set(item.tag_ids)
+        return stub_config, tags, attached
+
+    @staticmethod
+    def diff_tags(names, tags, attached):
+        """Returns changes attaching declared tags missing on the vm. Other tags are left attached."""
+        return [Change('tag', 'tag +{}'.format(name), tag_id=tags[name])
+                for name in names if tags[name] not in attached]
+
+    def converge(self, plans, current, stub_config, workers):
+        """Applies changes of all vms concurrently, returns names of vms, which failed to converge."""
+        failed = []
+        executor = ThreadPoolExecutor(max_workers=max(1, workers or conf.APPLY_WORKERS))
+        try:
+            futures = dict((executor.submit(self.converge_vm, current[name]['obj'], plan, stub_config), name)
+                           for name, plan in plans.items())
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                    self.logger.info('VM {} converged'.format(name))
+                except Exception as e:
+                    self.logger.error('Failed to converge vm {}: {}'.format(name, getattr(e, 'msg', None) or e))
+                    failed.append(name)
+        finally:
+            executor.shutdown(wait=True)
+        return failed
+
+    def converge_vm(self, vm, plan, stub_config):
+        """Applies changes of single vm. When declared power state is off, running vm is powered off before
+        reconfiguration, when it is on, powered off vm is powered on after it. Otherwise hardware changes are
+        applied to the vm in its current power state."""
+        kinds = set(change.kind for change in plan)
+        if 'poweredOff' in kinds:
+            self.wait_for_tasks([self.submit_task(vm, 'PowerOffVM_Task')])
+
+        if 'config' in kinds:
+            config_spec = vim.vm.ConfigSpec(deviceChange=[])
+            for change in plan:
+                if change.kind != 'config':
+                    continue
+                for key, value in change.config.items():
+                    setattr(config_spec, key, value)
+                if change.device_spec is not None:
+                    config_spec.deviceChange.append(change.device_spec)
+            self.wait_for_tasks([self.submit_task(vm, 'ReconfigVM_Task', config_spec)])
+
+        if 'poweredOn' in kinds:
+            self.wait_for_tasks([self.submit_task(vm, 'PowerOnVM_Task')])
+
+        if 'tag' in kinds:
+            tag_asoc = TagAssociation(stub_config)
+            vm_dynid = DynamicID(type='VirtualMachine', id=vm._GetMoId())
+            for change in plan:
+                if change.kind == 'tag':
+                    tag_asoc.attach(tag_id=change.config['tag_id'], object_id=vm_dynid)
+
+
+BaseCommands.register('apply', ApplyCommands)
@@ -99,7 +99,7 @@ class AttachCommands(BaseCommands):
 
         config_spec = vim.vm.ConfigSpec(deviceChange=dev_change)
         self.logger.info('Attaching device to the virtual machine...')
-        task = vm.ReconfigVM_Task(config_spec)
+        task = self.submit_task(vm, 'ReconfigVM_Task', config_spec)
         self.wait_for_tasks([task])
 
     @args('--net', help='net to attach to a new device (network only)')
@@ -135,7 +135,7 @@ class AttachCommands(BaseCommands):
 
         config_spec = vim.vm.ConfigSpec(deviceChange=[nicspec])
         self.logger.info('Attaching network device to the virtual machine {}...'.format(name))
-        task = vm.ReconfigVM_Task(config_spec)
+        task = self.submit_task(vm, 'ReconfigVM_Task', config_spec)
         self.wait_for_tasks([task])
 
     def attach_floppy_drive(self, name):
@@ -165,7 +165,7 @@ class AttachCommands(BaseCommands):
 
         config_spec = vim.vm.ConfigSpec(deviceChange=[floppyspec])
         self.logger.info('Attaching device to the virtual machine...')
-        task = vm.ReconfigVM_Task(config_spec)
+        task = self.submit_task(vm, 'ReconfigVM_Task', config_spec)
         self.wait_for_tasks([task])
 
     def attach_cdrom_drive(self, name):
@@ -195,7 +195,7 @@ class AttachCommands(BaseCommands):
 
         config_spec = vim.vm.ConfigSpec(deviceChange=[cdspec])
         self.logger.info('Attaching device to the virtual machine...')
-        task = vm.ReconfigVM_Task(config_spec)
+        task = self.submit_task(vm, 'ReconfigVM_Task', config_spec)
         self.wait_for_tasks([task])
 
 
@@ -1,11 +1,21 @@
 from pyVmomi import vim
 
+from lib import config as conf
 from lib.modules import BaseCommands
 from lib.tools import normalize_memory
 from lib.tools.argparser import args
+from lib.tools.placement import get_placement_engine
+from lib.tools.replicas import find_local_replica
 from lib.exceptions import VmCLIException
+from lib.modules.snapshot import SnapshotCommands
+from lib.modules.library import LibraryCommands, LIBRARY_PREFIX
+from lib.tools.library import LibraryIndex
+from lib.connector import automationSDKConnect
 from flavors import load_vm_flavor
 
+# Name of the snapshot created on templates without any snapshot, when linked clone is requested
+LINKED_CLONE_SNAPSHOT = 'vmcli-linked-clone-base'
+
 
 class CloneCommands(BaseCommands):
     """clone specific VMware objects, without any further configuration."""
@@ -18,7 +28,8 @@ class CloneCommands(BaseCommands):
     def execute(self, args):
         try:
             self.clone_vm(args.name, args.template, args.datacenter, args.folder, args.datastore,
-                          args.cluster, args.resource_pool, args.poweron, args.mem, args.cpu, args.flavor)
+                          args.cluster, args.resource_pool, args.poweron, args.mem, args.cpu, args.flavor,
+                          args.auto_place, args.linked, args.instant, args.snapshot)
         except VmCLIException as e:
             self.exit(e.message, errno=2)
 
@@ -31,9 +42,17 @@ class CloneCommands(BaseCommands):
     @args('--mem', help='memory to set for a vm in megabytes', map='VM_MEM')
     @args('--cpu', help='cpu count to set for a vm', type=int, map='VM_CPU')
     @args('--poweron', help='whether to power on vm after cloning', action='store_true', map='VM_POWERON')
+    @args('--auto-place', help='pick least loaded cluster, host and datastore from live capacity data',
+          action='store_true', map='VM_AUTO_PLACE')
+    @args('--linked', help='create linked clone sharing disks with a snapshot of the template', action='store_true')
+    @args('--instant', help='create instant clone of a running source vm', action='store_true')
+    @args('--snapshot', help='snapshot of the template to use for linked clone (default is its current snapshot)')
     def clone_vm(self, name, template, datacenter=None, folder=None, datastore=None, cluster=None,
-                 resource_pool=None, poweron=None, mem=None, cpu=None, flavor=None):
-        """Clones new virtual machine from a template or any other existing machine."""
+                 resource_pool=None, poweron=None, mem=None, cpu=None, flavor=None, auto_place=False,
+                 linked=False, instant=False, snapshot=None):
+        """Clones new virtual machine from a template or any other existing machine. Linked clones share
+        disks of template's snapshot and instant clones share also memory state of running source vm, both
+        avoid full disk copy."""
         flavor = load_vm_flavor(flavor)
 
         # TODO: let script fail when user specifies something wrong instead of using vcenter defaults
@@ -42,41 +61,154 @@ class CloneCommands(BaseCommands):
         self.logger.info('Loading required VMware resources...')
         if mem:
             mem = normalize_memory(mem)
+        if linked and instant:
+            raise VmCLIException('Linked and instant clone modes cannot be combined!')
+        if template and template.startswith(LIBRARY_PREFIX):
+            return self.deploy_from_library(name, template[len(LIBRARY_PREFIX):], datacenter, folder, datastore,
+                                            cluster, resource_pool, poweron, mem, cpu)
         template = self.get_obj('vm', template)
+        if not template:
+            self.exit('Specified template does not exists. Exiting...')
+        if instant and template.runtime.powerState != 'poweredOn':
+            raise VmCLIException('Instant clone requires running source vm. Exiting...')
+
         datacenter = self.get_obj('datacenter', datacenter, default=True)
-        cluster = self.get_obj('cluster', cluster, default=True)
-        folder = self.get_obj('folder', folder) or datacenter.vmFolder
-        resource_pool = self.get_obj('resource_pool', resource_pool) or cluster.resourcePool
-
-        # Search first for datastore cluster, then for specific datastore
-        datastore = datastore or template.datastore[0].info.name
-        ds = self.get_obj('datastore_cluster', datastore)
-        ds_type = 'cluster'
-        if not ds:
-            ds = self.get_obj('datastore', datastore)
+        folder = self.get_container_obj('folder', folder, [datacenter.vmFolder]) or datacenter.vmFolder
+
+        if auto_place:
+            # Explicitly provided cluster and datastore only restrict candidates of the placement engine
+            booking = self.place_clone(template, datacenter, cluster, datastore, mem, cpu,
+                                       full_copy=not (linked or instant))
+            cluster, datastore, host = booking['cluster'], booking['datastore'], booking['host']
             ds_type = 'specific'
+            resource_pool = self.get_container_obj('resource_pool', resource_pool, [cluster])
+            if resource_pool and resource_pool.owner != cluster:
+                self.logger.warning('Resource pool {} does not belong to cluster {}, using its root pool'.format(
+                        resource_pool.name, cluster.name))
+                resource_pool = None
+            resource_pool = resource_pool or booking['resource_pool']
+        else:
+            booking, host = None, None
+            cluster = self.get_obj('cluster', cluster, default=True)
+            resource_pool = (self.get_container_obj('resource_pool', resource_pool, [cluster, datacenter.hostFolder]) or
+                             cluster.resourcePool)
+
+            # Search first for datastore cluster, then for specific datastore
+            datastore = datastore or template.datastore[0].info.name
+            ds = self.get_obj('datastore_cluster', datastore)
+            ds_type = 'cluster'
             if not ds:
-                self.exit('Neither datastore cluster or specific datastore is matching {}. Exiting...'.format(
-                        datastore))
-        datastore = ds
+                ds = self.get_obj('datastore', datastore)
+                ds_type = 'specific'
+                if not ds:
+                    self.exit('Neither datastore cluster or specific datastore is matching {}. Exiting...'.format(
+                            datastore))
+            datastore = ds
+
+        # Full clone from replica placed on the target datastore is a fast local copy
+        if conf.TEMPLATE_USE_REPLICAS and ds_type == 'specific' and not (linked or instant):
+            template = find_local_replica(self.content, template, datastore)
 
         if self.get_obj('vm', name):
             self.exit('VM with name {} already exists. Exiting...'.format(name))
 
-        if not template:
-            self.exit('Specified template does not exists. Exiting...')
-
         self.logger.info('  * Using datacenter..........{}'.format(datacenter.name))
         self.logger.info('  * Using cluster.............{}'.format(cluster.name))
         self.logger.info('  * Using folder..............{}'.format(folder.name))
         self.logger.info('  * Using datastore...........{}'.format(datastore.name))
         self.logger.info('  * Using resource pool.......{}'.format(resource_pool.name))
+        if host:
+            self.logger.info('  * Using host................{}'.format(host.name))
 
+        try:
+            if instant:
+                self.run_instant_clone(template, name, folder, datastore, ds_type, resource_pool, mem, cpu)
+            else:
+                if linked:
+                    snapshot = self.get_linked_clone_snapshot(template, snapshot, resource_pool)
+                self.run_clone(template, name, folder, datastore, ds_type, resource_pool, host, poweron, mem, cpu,
+                               snapshot=snapshot if linked else None)
+        except BaseException:
+            # booking of created vm is kept until it expires, because usage of the powered off clone (datastore
+            # free space in particular) shows in live capacity data only after a while
+            if booking:
+                get_placement_engine(self.content, datacenter).release(booking)
+            raise
+
+    def deploy_from_library(self, name, item, datacenter=None, folder=None, datastore=None, cluster=None,
+                            resource_pool=None, poweron=None, mem=None, cpu=None):
+        """Deploys vm from content library OVF item instead of cloning, hardware is adjusted afterwards."""
+        stub_config = automationSDKConnect()
+        library = LibraryCommands(self.connection)
+        vm = library.deploy(stub_config, LibraryIndex(stub_config), item, [name], datacenter, folder, datastore,
+                            cluster, resource_pool)[name]
+        if mem or cpu:
+            configspec = vim.vm.ConfigSpec(memoryMB=mem, numCPUs=cpu)
+            self.wait_for_tasks([self.submit_task(vm, 'ReconfigVM_Task', configspec)])
+        if poweron:
+            self.wait_for_tasks([self.submit_task(vm, 'PowerOnVM_Task')])
+        return vm
+
+    def place_clone(self, template, datacenter, cluster=None, datastore=None, mem=None, cpu=None, full_copy=True):
+        """Books cluster, host and datastore for the clone via placement engine."""
+        if cluster:
+            cluster = self.get_obj('cluster', cluster)
+            if not cluster:
+                raise VmCLIException('Specified cluster does not exists. Exiting...')
+        if datastore:
+            datastore = self.get_obj('datastore_cluster', datastore) or self.get_obj('datastore', datastore)
+            if not datastore:
+                raise VmCLIException('Neither datastore cluster or specific datastore is matching. Exiting...')
+
+        self.logger.info('Selecting placement from live capacity data...')
+        engine = get_placement_engine(self.content, datacenter)
+        # full clone occupies roughly the same space as committed storage of its template, while linked
+        # and instant clones start with empty delta disks
+        disk = template.summary.storage.committed if full_copy else 0
+        return engine.place(cpu or template.summary.config.numCpu, mem or template.summary.config.memorySizeMB,
+                            disk, cluster=cluster, datastore=datastore)
+
+    def get_linked_clone_snapshot(self, template, name=None, resource_pool=None):
+        """Returns template's snapshot to be used as a base of linked clones. When no name is provided, current
+        snapshot of the template is used. Templates without any snapshot get LINKED_CLONE_SNAPSHOT created,
+        which requires them to be temporarily converted to virtual machines. Explicitly named snapshot
+        is never created, so a typo does not produce new base snapshot of shared template."""
+        if name:
+            snap = SnapshotCommands.get_snapshot_by_name(
+                    template.snapshot.rootSnapshotList if template.snapshot else None, name)
+            if snap:
+                return snap.snapshot
+            if name != LINKED_CLONE_SNAPSHOT:
+                raise VmCLIException('Snapshot {} of template {} not found!'.format(name, template.name))
+        elif template.snapshot:
+            return template.snapshot.currentSnapshot
+
+        name = name or LINKED_CLONE_SNAPSHOT
+        self.logger.info('Creating snapshot {} of {} as a base for linked clones...'.format(name, template.name))
+        is_template = template.config.template
+        if is_template:
+            template.MarkAsVirtualMachine(pool=resource_pool)
+        try:
+            task = self.submit_task(template, 'CreateSnapshot_Task', name=name,
+                                    description='Base for vmcli linked clones', memory=False, quiesce=False)
+            self.wait_for_tasks([task])
+        finally:
+            if is_template:
+                template.MarkAsTemplate()
+        return task.info.result
+
+    def run_clone(self, template, name, folder, datastore, ds_type, resource_pool, host=None, poweron=None,
+                  mem=None, cpu=None, snapshot=None):
+        """Runs clone task either through Storage DRS recommendation or directly to a specific datastore.
+        When snapshot is provided, linked clone with child disks backed by the snapshot is created."""
+        disk_move_type = 'createNewChildDiskBacking' if snapshot else None
         self.logger.info('Running cloning operation...')
         if ds_type == 'cluster':
             storagespec = vim.storageDrs.StoragePlacementSpec(
                     cloneName=name, vm=template, resourcePool=resource_pool, folder=folder, type='clone')
-            storagespec.cloneSpec = vim.vm.CloneSpec(location=vim.vm.RelocateSpec(pool=resource_pool), powerOn=poweron)
+            storagespec.cloneSpec = vim.vm.CloneSpec(
+                    location=vim.vm.RelocateSpec(pool=resource_pool, diskMoveType=disk_move_type),
+                    powerOn=poweron, snapshot=snapshot)
             storagespec.cloneSpec.config = vim.vm.ConfigSpec(name=name, memoryMB=mem, numCPUs=cpu, annotation=name)
             storagespec.podSelectionSpec = vim.storageDrs.PodSelectionSpec(storagePod=datastore)
             storagePlacementResult = self.content.storageResourceManager.RecommendDatastores(storageSpec=storagespec)
@@ -89,16 +221,31 @@ class CloneCommands(BaseCommands):
             except ValueError:
                 self.exit('No storage DRS recommentation provided for cluster {}, exiting...'.format(datastore.name))
 
-            task = self.content.storageResourceManager.ApplyStorageDrsRecommendation_Task(drs_key)
+            task = self.submit_task(self.content.storageResourceManager, 'ApplyStorageDrsRecommendation_Task', drs_key)
             self.wait_for_tasks([task])
 
         elif ds_type == 'specific':
-            relocspec = vim.vm.RelocateSpec(datastore=datastore, pool=resource_pool)
+            relocspec = vim.vm.RelocateSpec(datastore=datastore, pool=resource_pool, host=host,
+                                            diskMoveType=disk_move_type)
             configspec = vim.vm.ConfigSpec(name=name, memoryMB=mem, numCPUs=cpu, annotation=name)
-            clonespec = vim.vm.CloneSpec(config=configspec, location=relocspec, powerOn=poweron)
+            clonespec = vim.vm.CloneSpec(config=configspec, location=relocspec, powerOn=poweron, snapshot=snapshot)
 
-            task = template.Clone(folder=folder, name=name, spec=clonespec)
+            task = self.submit_task(template, 'Clone', folder=folder, name=name, spec=clonespec)
             self.wait_for_tasks([task])
 
+    def run_instant_clone(self, source, name, folder, datastore, ds_type, resource_pool, mem=None, cpu=None):
+        """Runs instant clone task, new vm is forked from running source and shares its memory and disks."""
+        if mem or cpu:
+            self.logger.warning('Memory and cpu count of instant clones are inherited from source vm, ignoring...')
+        # Storage DRS does not take part in instant cloning, datastore of the source is used with datastore clusters
+        if ds_type == 'cluster':
+            datastore = None
+
+        self.logger.info('Running instant cloning operation...')
+        relocspec = vim.vm.RelocateSpec(folder=folder, pool=resource_pool, datastore=datastore)
+        instantspec = vim.vm.InstantCloneSpec(name=name, location=relocspec)
+        task = self.submit_task(source, 'InstantClone_Task', spec=instantspec)
+        self.wait_for_tasks([task])
+
 
 BaseCommands.register('clone', CloneCommands)
@@ -1,10 +1,13 @@
 import netaddr
-import copy
 from pyVmomi import vim
 
 from lib.modules import BaseCommands
 from lib.tools import normalize_memory
 from lib.tools.argparser import args
+from lib.tools.journal import Journal
+from lib.tools.dag import StepGraph
+from lib.tools.ipam import AddressPool, scan_addresses, gateway_of, broadcast_of
+from lib.connector import automationSDKConnect
 from lib.exceptions import VmCLIException
 
 import lib.config as conf
@@ -62,13 +65,12 @@ class CreateEmptyVmCommands(BaseCommands):
         config_spec.files = vm_files
         config_spec.guestId = 'otherLinux64Guest'
 
-        folder = self.get_obj('folder', args.folder)
-        resource_pool = self.get_obj('resource_pool', args.resource_pool)
-        task = folder.CreateVM_Task(config=config_spec, pool=resource_pool)
+        folder = self.get_container_obj('folder', args.folder)
+        resource_pool = self.get_container_obj('resource_pool', args.resource_pool)
+        task = self.submit_task(folder, 'CreateVM_Task', config=config_spec, pool=resource_pool)
         self.wait_for_tasks([task])
 
 
-# TODO: should the bundle fail, provide option to rerun from failed command e.g. ansibles site.retry
 class CreateVmCommandBundle(BaseCommands):
     """execute series of tasks necessary to deploy new vm via cloning."""
 
@@ -87,74 +89,169 @@ class CreateVmCommandBundle(BaseCommands):
     @args('--cpu', help='cpu count to set for a vm', type=int, map='VM_CPU')
     @args('--hdd', help='size of additional hdd to attach in gigabytes', type=int, map='VM_HDD')
     @args('--net', help='network to attach to the vm', map='VM_NETWORK')
-    @args('--net-cfg', help="network configuration. E.g --net-cfg '10.1.10.2/24'", map='VM_NETWORK_CFG')
+    @args('--net-cfg', help="network configuration. E.g --net-cfg '10.1.10.2/24', auto allocates address from "
+          "address pool of the network", map='VM_NETWORK_CFG')
     @args('--guest-user', '--gu', help="guest's user under which to run command through vmtools", map='VM_GUEST_USER')
     @args('--guest-pass', '--gp', help="guest user's password", map='VM_GUEST_PASS')
     @args('--callback', help='arguments to pass to callback functions. E.g. --callback "var1; var 2"')
     @args('--tags', help='tags to assign to VM. E.g. "tag1,tag2". Requires vsphere-automation-sdk-python installed')
+    @args('--auto-place', help='pick least loaded cluster, host and datastore from live capacity data',
+          action='store_true', map='VM_AUTO_PLACE')
+    @args('--linked', help='create linked clone sharing disks with a snapshot of the template', action='store_true')
+    @args('--snapshot', help='snapshot of the template to use for linked clone, created when template has none')
+    @args('--resume', help='skip steps completed by previous failed run of the same vm', action='store_true')
     def execute(self, args):
-        """Clones VM, assigns it proper hardware devices, powers it on ad prepares it for further configuration."""
+        """Clones VM, assigns it proper hardware devices, powers it on ad prepares it for further configuration.
+        Every completed step is recorded into a journal, so failed run can be resumed with --resume option."""
         if not args.name or not args.template:
             raise VmCLIException('Arguments name or template are missing, cannot continue!')
 
-        clone = CloneCommands(self.connection)
-        clone.clone_vm(args.name, args.template, args.datacenter, args.folder, args.datastore,
-                       args.cluster, args.resource_pool, False, args.mem, args.cpu, flavor=args.flavor)
+        journal = Journal('create', args.name, resume=args.resume)
+        self.vm = None
+        self.gateway = None
+        # Address is allocated before cloning, so deploy does not even start when the pool is exhausted.
+        # Allocation is leased to the name of the vm, resumed run gets the same address.
+        if args.net_cfg == 'auto':
+            self.allocate_address(args)
+        # Steps form a dependency graph, independent branches run concurrently. Reconfiguration steps are
+        # chained, because vCenter allows only one reconfiguration task of a vm at a time.
+        graph = StepGraph()
 
-        vm = self.get_vm_obj(args.name, fail_missing=True)
+        clone_inputs = dict((key, getattr(args, key)) for key in [
+            'template', 'datacenter', 'folder', 'datastore', 'cluster', 'resource_pool', 'mem', 'cpu', 'flavor',
+            'auto_place', 'linked', 'snapshot'])
+        graph.add('clone', lambda: self.clone(journal, args, clone_inputs))
 
-        modify = ModifyCommands(self.connection)
         # Upgrade VM hardware version to the latest
-        modify.change_vHWversion(vm, vHWversion='latest')
+        graph.add('hw_upgrade', lambda: self.run_step(
+                journal, 'hw_upgrade', {},
+                lambda: ModifyCommands(self.connection).change_vHWversion(self.vm, vHWversion='latest')),
+                requires=['clone'])
+        last_reconfig = 'hw_upgrade'
         # Change network assigned to the first interface on the VM
         if args.net:
-            modify.change_network(vm, args.net, dev=1)
+            graph.add('net_change', lambda: self.run_step(
+                    journal, 'net_change', {'net': args.net},
+                    lambda: ModifyCommands(self.connection).change_network(self.vm, args.net, dev=1),
+                    verify=lambda: args.net in [net.name for net in self.vm.network]),
+                    requires=[last_reconfig])
+            last_reconfig = 'net_change'
         if args.hdd:
             # Attach additional hard drive
-            attach = AttachCommands(self.connection)
-            attach.attach_hdd(vm, args.hdd)
+            graph.add('disk_attach', lambda: self.run_step(
+                    journal, 'disk_attach', {'hdd': args.hdd},
+                    lambda: AttachCommands(self.connection).attach_hdd(self.vm, args.hdd)),
+                    requires=[last_reconfig])
+            last_reconfig = 'disk_attach'
 
-        power = PowerCommands(self.connection)
-        power.poweron_vm(vm)
-        self.wait_for_guest_os(vm)
+        graph.add('power_on', lambda: self.run_step(
+                journal, 'power_on', {}, lambda: PowerCommands(self.connection).poweron_vm(self.vm),
+                verify=lambda: self.vm.runtime.powerState == 'poweredOn'),
+                requires=[last_reconfig])
+        graph.add('guest_os', lambda: self.wait_for_guest_os(self.vm), requires=['power_on'])
+        final_steps = ['guest_os']
 
+        # Tagging needs only existing vm, vAPI login and tag lookup run already during cloning
         if args.tags:
-            args_copy = copy.deepcopy(args)
-            args_copy.name = vm
             tag_cmd = TagCommands(self.connection)
-            tag_cmd.execute(args_copy)
+            if not journal.completed('tag', {'tags': args.tags}):
+                graph.add('vapi_login', lambda: automationSDKConnect(
+                        args.vcenter, args.username, args.password, args.insecure))
+                graph.add('tag_lookup', lambda: tag_cmd.find_tags(graph.results['vapi_login'], args.tags),
+                          requires=['vapi_login'])
+                tag_requires = ['clone', 'tag_lookup']
+            else:
+                tag_requires = ['clone']
+            graph.add('tag', lambda: self.run_step(
+                    journal, 'tag', {'tags': args.tags}, lambda: tag_cmd.attach_tags(
+                            graph.results['vapi_login'], self.vm, graph.results['tag_lookup'])),
+                    requires=tag_requires)
+            final_steps.append('tag')
 
-        execute = ExecCommands(self.connection)
         # Configure first ethernet device on the host, assumes traditional naming scheme
+        guest_step = 'guest_os'
         if args.net_cfg:
-            # assume prefix 24 if user forgots
-            if len(args.net_cfg.split('/')) == 1:
-                args.net_cfg += '/24'
-
-            try:
-                ip = netaddr.IPNetwork(args.net_cfg)
-                gateway = list(ip)[1]
-            except netaddr.core.AddrFormatError as e:
-                ip, gateway = None, None
-                self.logger.warning(str(e.message) + '. Skipping network configuration')
-
-            if ip and gateway:
-                # expects script inside template
-                commands = [
-                    '/bin/bash /usr/share/vmcli/provision-interfaces.sh {} {} {} {} {}'.format(
-                            ip.ip, ip.netmask, gateway, ip.network, ip.broadcast)
-                ]
-                execute.exec_inside_vm(vm, commands, args.guest_user, args.guest_pass, wait_for_tools=True)
+            graph.add('net_config', lambda: self.run_step(
+                    journal, 'net_config', {'net_cfg': args.net_cfg}, lambda: self.configure_network(args)),
+                    requires=[guest_step])
+            guest_step = 'net_config'
 
         if conf.VM_ADDITIONAL_CMDS:
-            execute.exec_inside_vm(vm, conf.VM_ADDITIONAL_CMDS, args.guest_user,
-                                   args.guest_pass, wait_for_tools=True)
+            graph.add('additional_commands', lambda: self.run_step(
+                    journal, 'additional_commands', {'commands': conf.VM_ADDITIONAL_CMDS},
+                    lambda: ExecCommands(self.connection).exec_inside_vm(
+                            self.vm, conf.VM_ADDITIONAL_CMDS, args.guest_user, args.guest_pass, wait_for_tools=True)),
+                    requires=[guest_step])
+            guest_step = 'additional_commands'
+        final_steps.append(guest_step)
+
+        # Execute callbacks from callbacks/ directory, once everything else is finished
+        if args.callback:
+            execute = ExecCommands(self.connection)
+            graph.add('callbacks_prep', lambda: execute.prepare_callbacks(args.callback))
+            graph.add('callbacks', lambda: self.run_step(
+                    journal, 'callbacks', {'callback': args.callback},
+                    lambda: execute.run_callbacks(args, graph.results['callbacks_prep'])),
+                    requires=final_steps + ['callbacks_prep'])
 
+        graph.run()
         self.logger.info('Deployed vm {}'.format(args.name))
+        journal.finish()
 
-        # Execute callbacks from callbacks/ directory
-        if args.callback:
-            execute.exec_callbacks(args, args.callback)
+    def run_step(self, journal, step, inputs, run, verify=None):
+        """Runs single step of the bundle unless it is recorded in journal as completed with the same inputs.
+        Optional verify callable cheaply confirms against vCenter, that the recorded step really took effect."""
+        if journal.completed(step, inputs):
+            if verify is None or verify():
+                self.logger.info('Skipping step {}, already completed'.format(step))
+                return
+            self.logger.warning('Step {} is recorded as completed, but vCenter does not confirm it'.format(step))
+
+        self.logger.debug('Running step {}...'.format(step))
+        run()
+        journal.record(step, inputs)
+
+    def clone(self, journal, args, inputs):
+        """Clones the vm, unless it was already cloned by previous run, and loads it for the following steps."""
+        clone = CloneCommands(self.connection)
+        self.run_step(journal, 'clone', inputs, lambda: clone.clone_vm(
+                args.name, args.template, args.datacenter, args.folder, args.datastore, args.cluster,
+                args.resource_pool, False, args.mem, args.cpu, flavor=args.flavor, auto_place=args.auto_place,
+                linked=args.linked, snapshot=args.snapshot),
+                verify=lambda: self.get_obj('vm', args.name) is not None)
+        self.vm = self.get_vm_obj(args.name, fail_missing=True, datacenter=args.datacenter, folder=args.folder)
+
+    def allocate_address(self, args):
+        """Replaces --net-cfg auto with address allocated from address pool of the vm's network."""
+        if not args.net:
+            raise VmCLIException('Network is required to allocate address from its pool!')
+        pool = AddressPool.from_config(args.net)
+        address = pool.allocate([args.name], scan_addresses(self.content) if conf.IPAM_SCAN else ())[args.name]
+        self.logger.info('Allocated address {} from pool {}'.format(address, args.net))
+        args.net_cfg = str(address)
+        self.gateway = pool.gateway
+
+    def configure_network(self, args):
+        """Runs provisioning script inside the guest, which configures first ethernet device."""
+        # assume prefix 24 if user forgots
+        if len(args.net_cfg.split('/')) == 1:
+            args.net_cfg += '/24'
+
+        try:
+            ip = netaddr.IPNetwork(args.net_cfg)
+            gateway = self.gateway or gateway_of(ip)
+        except netaddr.core.AddrFormatError as e:
+            ip, gateway = None, None
+            self.logger.warning(str(e.message) + '. Skipping network configuration')
+
+        if ip and gateway:
+            # expects script inside template
+            commands = [
+                '/bin/bash /usr/share/vmcli/provision-interfaces.sh {} {} {} {} {}'.format(
+                        ip.ip, ip.netmask, gateway, ip.network, broadcast_of(ip))
+            ]
+            ExecCommands(self.connection).exec_inside_vm(self.vm, commands, args.guest_user, args.guest_pass,
+                                                         wait_for_tools=True)
 
 
 BaseCommands.register('create', CreateVmCommandBundle)
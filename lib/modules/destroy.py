@@ -0,0 +1,140 @@
+import fnmatch
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.tools.collector import retrieve_properties
+from lib.tools.inventory import get_inventory_mirror
+from lib.tools.ipam import AddressPool
+from lib.tools.journal import Journal
+from lib.tools.waiter import TaskWaiter
+from lib.exceptions import VmCLIException
+
+
+class DestroyCommands(BaseCommands):
+    """power off and destroy vms selected by names, shell-style wildcards or folder."""
+
+    def __init__(self, *args, **kwargs):
+        super(DestroyCommands, self).__init__(*args, **kwargs)
+
+    @args('names', help='names of vms to destroy, shell-style wildcards are accepted', nargs='*')
+    @args('--folder', help='destroy vms placed in the folder (name or path), names then only filter them')
+    @args('--templates', help='destroy also matching templates, they are skipped by default', action='store_true')
+    @args('--parallel', help='number of vms powered off and destroyed at once', type=int, map='DESTROY_PARALLEL')
+    @args('--dry-run', help='only list vms, which would be destroyed', action='store_true')
+    def execute(self, args):
+        try:
+            if not args.names and not args.folder:
+                raise VmCLIException('Provide names of vms or --folder to destroy!')
+            targets = self.get_targets(args.names, args.folder, args.templates)
+            if not targets:
+                raise VmCLIException('No matching vms found!')
+
+            if args.dry_run:
+                for name, vm, power in targets:
+                    print('{} {}'.format(name, power))
+                print('{} vms would be destroyed'.format(len(targets)))
+                return
+
+            destroyed, failed = self.destroy_vms(targets, args.parallel or conf.DESTROY_PARALLEL)
+            self.forget_vms(destroyed)
+            print('Destroyed {} vms, {} failed'.format(len(destroyed), len(failed)))
+            if failed:
+                raise VmCLIException('Failed to destroy: {}'.format(', '.join(sorted(failed))))
+        except VmCLIException as e:
+            self.exit(e.message, errno=6)
+
+    def get_targets(self, patterns, folder=None, templates=False):
+        """Returns sorted list of (name, vm, power state) of matching vms. Names, power states and template flags
+        of all vms (or vms in the folder) are retrieved with single bulk call."""
+        root = None
+        if folder:
+            root = self.get_container_obj('folder', folder)
+            if not root:
+                raise VmCLIException('Unable to find folder {}!'.format(folder))
+
+        targets = []
+        for vm, props in retrieve_properties(self.content, vim.VirtualMachine,
+                                             ['name', 'runtime.powerState', 'config.template'], root=root):
+            name = props.get('name')
+            if patterns and not any(fnmatch.fnmatchcase(name or '', pattern) for pattern in patterns):
+                continue
+            if props.get('config.template') and not templates:
+                self.logger.info('Skipping template {}'.format(name))
+                continue
+            targets.append((name, vm, props.get('runtime.powerState')))
+        return sorted(targets, key=lambda t: t[0])
+
+    def destroy_vms(self, targets, parallel):
+        """Powers off running vms and destroys all of them, at most parallel vms are processed at once. Tasks are
+        submitted from worker threads, because submissions may wait for throttle, while all running tasks are
+        watched by single shared waiter. Returns lists of destroyed vms (name, moid) and names of failed vms."""
+        queue = deque(targets)
+        submissions, running = {}, {}
+        destroyed, failed = [], []
+        waiter = TaskWaiter(self.content)
+        executor = ThreadPoolExecutor(max_workers=max(1, parallel))
+
+        def submit(name, vm, stage):
+            method = 'PowerOffVM_Task' if stage == 'poweroff' else 'Destroy_Task'
+            submissions[executor.submit(self.submit_task, vm, method)] = (name, vm, stage)
+
+        try:
+            while queue or submissions or running:
+                while queue and len(submissions) + len(running) < parallel:
+                    name, vm, power = queue.popleft()
+                    submit(name, vm, 'poweroff' if power == vim.VirtualMachinePowerState.poweredOn else 'destroy')
+
+                for future in [future for future in submissions if future.done()]:
+                    name, vm, stage = submissions.pop(future)
+                    try:
+                        task = future.result()
+                    except Exception as e:
+                        self.logger.error('Unable to destroy {}: {}'.format(name, getattr(e, 'msg', None) or e))
+                        failed.append(name)
+                        continue
+                    running[str(task)] = (name, vm, stage)
+                    waiter.add(task)
+
+                if not len(waiter):
+                    if submissions:
+                        wait(list(submissions), timeout=1, return_when=FIRST_COMPLETED)
+                    continue
+                # poll shortly while submissions are pending, so finished submissions are picked up quickly
+                for task, info in waiter.wait(1 if submissions or queue else 30):
+                    name, vm, stage = running.pop(str(task))
+                    if stage == 'poweroff':
+                        # destroy is attempted even if power off failed, e.g. because vm was already powered off
+                        submit(name, vm, 'destroy')
+                    elif info.state == vim.TaskInfo.State.error:
+                        self.logger.error('Unable to destroy {}: {}'.format(name, info.error.msg))
+                        failed.append(name)
+                    else:
+                        self.logger.info('Destroyed vm {}'.format(name))
+                        destroyed.append((name, vm._GetMoId()))
+        finally:
+            executor.shutdown(wait=True)
+            waiter.destroy()
+        return destroyed, failed
+
+    def forget_vms(self, destroyed):
+        """Removes destroyed vms from local state: inventory mirror, address leases and create journals."""
+        if not destroyed:
+            return
+        names = [name for name, _ in destroyed]
+        if conf.INVENTORY_MIRROR:
+            get_inventory_mirror(conf.VCENTER).forget([moid for _, moid in destroyed])
+        for network in conf.IPAM_POOLS or {}:
+            try:
+                for address in AddressPool.from_config(network).release(names):
+                    self.logger.info('Released address {} of pool {}'.format(address, network))
+            except VmCLIException as e:
+                self.logger.warning(e.message)
+        for name in names:
+            Journal('create', name).finish()
+
+
+BaseCommands.register('destroy', DestroyCommands)
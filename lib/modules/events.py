@@ -0,0 +1,126 @@
+import json
+import time
+import datetime
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.constants import VMWARE_TYPES
+from lib.exceptions import VmCLIException
+
+
+# Attributes of events referencing related objects by their names
+EVENT_ARGUMENTS = ('datacenter', 'computeResource', 'host', 'vm', 'ds', 'net', 'dvs')
+
+
+def _format_time(value):
+    return value.isoformat() if value else None
+
+
+def format_event(event):
+    """Converts event into json serializable dictionary. Names of related objects are part of the event
+    itself, so no additional calls to vCenter are needed."""
+    related = dict((attr, getattr(event, attr).name) for attr in EVENT_ARGUMENTS if getattr(event, attr, None))
+    return dict({
+        'key': event.key,
+        'type': type(event).__name__.split('.')[-1],
+        'created': _format_time(event.createdTime),
+        'user': event.userName or None,
+        'message': event.fullFormattedMessage,
+    }, **related)
+
+
+def format_task(task):
+    """Converts task info into json serializable dictionary."""
+    return {
+        'key': task.key,
+        'task': task.descriptionId,
+        'entity': task.entityName,
+        'state': str(task.state),
+        'user': getattr(task.reason, 'userName', None),
+        'queued': _format_time(task.queueTime),
+        'started': _format_time(task.startTime),
+        'completed': _format_time(task.completeTime),
+        'error': task.error.localizedMessage if task.error else None,
+    }
+
+
+class EventsCommands(BaseCommands):
+    """stream vCenter events or tasks as json lines."""
+
+    def __init__(self, *args, **kwargs):
+        super(EventsCommands, self).__init__(*args, **kwargs)
+
+    @args('--tasks', help='stream tasks instead of events', action='store_true')
+    @args('--entity', help='show only events related to this object and its children')
+    @args('--entity-type', help='type of the --entity object', choices=[key for key in VMWARE_TYPES], default='vm')
+    @args('--types', help='comma separated event types, e.g. VmPoweredOnEvent,VmRemovedEvent (events only)',
+          type=lambda value: [t.strip() for t in value.split(',') if t.strip()])
+    @args('--users', help='comma separated names of users who triggered events or tasks',
+          type=lambda value: [u.strip() for u in value.split(',') if u.strip()])
+    @args('--since', help='how many minutes back to start (default 60)', type=int, default=60)
+    @args('--page-size', help='number of events or tasks read with single call', type=int, dest='history_page_size',
+          map='EVENTS_PAGE_SIZE')
+    @args('--follow', help='keep streaming new events or tasks as they arrive', action='store_true')
+    def execute(self, args):
+        try:
+            entity = None
+            if args.entity:
+                entity = self.get_obj(args.entity_type, args.entity)
+                if not entity:
+                    raise VmCLIException('Unable to find {} {}!'.format(args.entity_type, args.entity))
+
+            begin = self.content.CurrentTime() - datetime.timedelta(minutes=args.since)
+            if args.tasks:
+                collector = self.create_task_collector(entity, args.users, begin)
+                self.stream(collector, format_task, args.history_page_size, args.follow)
+            else:
+                collector = self.create_event_collector(entity, args.types, args.users, begin)
+                self.stream(collector, format_event, args.history_page_size, args.follow)
+        except VmCLIException as e:
+            self.exit(e.message)
+
+    def create_event_collector(self, entity, types, users, begin):
+        """Creates event history collector filtered on the server side."""
+        spec = vim.event.EventFilterSpec(time=vim.event.EventFilterSpec.ByTime(beginTime=begin))
+        if entity:
+            spec.entity = vim.event.EventFilterSpec.ByEntity(entity=entity, recursion='all')
+        if types:
+            spec.eventTypeId = types
+        if users:
+            spec.userName = vim.event.EventFilterSpec.ByUsername(userList=users, systemUser=False)
+        return self.content.eventManager.CreateCollectorForEvents(filter=spec)
+
+    def create_task_collector(self, entity, users, begin):
+        """Creates task history collector filtered on the server side."""
+        spec = vim.TaskFilterSpec(time=vim.TaskFilterSpec.ByTime(timeType='queuedTime', beginTime=begin))
+        if entity:
+            spec.entity = vim.TaskFilterSpec.ByEntity(entity=entity, recursion='all')
+        if users:
+            spec.userName = vim.TaskFilterSpec.ByUsername(userList=users, systemUser=False)
+        return self.content.taskManager.CreateCollectorForTasks(filter=spec)
+
+    def stream(self, collector, formatter, page_size, follow):
+        """Reads the whole history page by page from the oldest item. In follow mode the collector is kept
+        open and asked for items collected since the last read, until interrupted."""
+        try:
+            collector.SetCollectorPageSize(page_size)
+            collector.RewindCollector()
+            read_next = collector.ReadNextEvents if hasattr(collector, 'ReadNextEvents') else collector.ReadNextTasks
+            while True:
+                items = read_next(page_size)
+                for item in items:
+                    print(json.dumps(formatter(item)))
+                if not items:
+                    if not follow:
+                        break
+                    time.sleep(conf.EVENTS_FOLLOW_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Number of collectors per session is limited, do not leave them behind
+            collector.DestroyCollector()
+
+
+BaseCommands.register('events', EventsCommands)
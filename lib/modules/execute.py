@@ -62,6 +62,11 @@ class ExecCommands(BaseCommands):
         For example, this --callback 'var1; var2; multi word var' will be passed as:
         ./callbacks/script.sh '{"name": "..", "template": ...}' 'var1' 'var2' 'multi word var'
         """
+        self.run_callbacks(args, self.prepare_callbacks(callback_args))
+
+    def prepare_callbacks(self, callback_args):
+        """Parses additional callback arguments and finds callback executables, which is independent of
+        the deployment itself and can be done upfront."""
         # Parse additional callback arguments passed from command line
         if callback_args:
             callback_args = [x.lstrip() for x in callback_args.rstrip(';').split(';')]
@@ -70,6 +75,11 @@ class ExecCommands(BaseCommands):
         # Get all callback scripts
         callbacks_dir = sorted(os.listdir('callbacks/'))
         callbacks = [os.path.realpath('callbacks/' + x) for x in callbacks_dir if not x.startswith('.')]
+        return callbacks, callback_args
+
+    def run_callbacks(self, args, prepared):
+        """Runs callbacks prepared by prepare_callbacks method."""
+        callbacks, callback_args = prepared
         # Prepare JSON serializable object from args namespace
         arguments = {}
         for argument in [x for x in dir(args) if not x.startswith('_')]:
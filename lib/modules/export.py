@@ -0,0 +1,197 @@
+import sys
+import csv
+import json
+from pyVmomi import vim
+
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.tools.collector import collect_properties
+from lib.exceptions import VmCLIException
+
+try:
+    # pyarrow is required only for parquet output
+    import pyarrow
+    import pyarrow.parquet
+    HAS_PYARROW_INSTALLED = True
+except ImportError:
+    HAS_PYARROW_INSTALLED = False
+
+
+VM_PROPERTIES = ['name', 'config.uuid', 'config.template', 'config.hardware.numCPU', 'config.hardware.memoryMB',
+                 'config.hardware.device', 'network', 'datastore', 'runtime.host', 'runtime.powerState',
+                 'guest.toolsStatus', 'guest.ipAddress']
+
+# Exported columns, lists hold one value per attached disk, network or datastore
+COLUMNS = [
+    ('name', 'string'),
+    ('uuid', 'string'),
+    ('template', 'bool'),
+    ('power_state', 'string'),
+    ('tools_status', 'string'),
+    ('cpu', 'int'),
+    ('memory_mb', 'int'),
+    ('disks_gb', 'float_list'),
+    ('disk_total_gb', 'float'),
+    ('networks', 'string_list'),
+    ('datastores', 'string_list'),
+    ('host', 'string'),
+    ('cluster', 'string'),
+    ('ip', 'string'),
+]
+
+
+class CsvWriter(object):
+    """Writes rows as csv, list values are joined with semicolon."""
+
+    def __init__(self, stream, columns):
+        self.columns = columns
+        self.writer = csv.writer(stream)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        for row in rows:
+            self.writer.writerow([';'.join(str(x) for x in row[c]) if isinstance(row[c], list) else
+                                  ('' if row[c] is None else row[c]) for c in self.columns])
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter(object):
+    """Writes every row as a separate json document on its own line."""
+
+    def __init__(self, stream, columns):
+        self.stream = stream
+        self.columns = columns
+
+    def write(self, rows):
+        for row in rows:
+            self.stream.write(json.dumps(dict((c, row[c]) for c in self.columns)) + '\n')
+
+    def close(self):
+        pass
+
+
+class ParquetWriter(object):
+    """Writes every page of rows as a separate row group of parquet file."""
+    TYPES = {
+        'string': lambda: pyarrow.string(),
+        'bool': lambda: pyarrow.bool_(),
+        'int': lambda: pyarrow.int64(),
+        'float': lambda: pyarrow.float64(),
+        'float_list': lambda: pyarrow.list_(pyarrow.float64()),
+        'string_list': lambda: pyarrow.list_(pyarrow.string()),
+    }
+
+    def __init__(self, stream, columns, types):
+        if not HAS_PYARROW_INSTALLED:
+            raise VmCLIException('Required pyarrow library not installed, parquet output is unavailable!')
+        self.columns = columns
+        self.schema = pyarrow.schema([(c, self.TYPES[types[c]]()) for c in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(stream, self.schema)
+
+    def write(self, rows):
+        if rows:
+            data = dict((c, [row[c] for row in rows]) for c in self.columns)
+            self.writer.write_table(pyarrow.Table.from_pydict(data, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ExportCommands(BaseCommands):
+    """export configuration of all VMs into csv, json lines or parquet file."""
+
+    def __init__(self, *args, **kwargs):
+        super(ExportCommands, self).__init__(*args, **kwargs)
+
+    @args('--format', help='format of exported data', choices=['csv', 'jsonl', 'parquet'], default='csv')
+    @args('--output', help='file to export data to (default stdout, required for parquet)')
+    @args('--page-size', help='number of VMs retrieved from vCenter in one call', type=int, map='EXPORT_PAGE_SIZE')
+    def execute(self, args):
+        try:
+            self.export(args.format, args.output, args.page_size)
+        except VmCLIException as e:
+            self.exit(e.message)
+
+    def export(self, fmt, output, page_size):
+        """Streams VMs of all connected vCenters page by page into the writer, so only one page of VMs is held
+        in memory at any time."""
+        columns = [c for c, _ in COLUMNS]
+        if len(self.sites) > 1:
+            columns.insert(0, 'vcenter')
+        if fmt == 'parquet' and not output:
+            raise VmCLIException('Argument --output is required with parquet format!')
+
+        stream = open(output, 'wb' if fmt == 'parquet' else 'w') if output else sys.stdout
+        try:
+            if fmt == 'parquet':
+                writer = ParquetWriter(stream, columns, dict(COLUMNS, vcenter='string'))
+            elif fmt == 'jsonl':
+                writer = JsonLinesWriter(stream, columns)
+            else:
+                writer = CsvWriter(stream, columns)
+
+            sites = self.sites or {None: self.connection}
+            total = 0
+            for site, connection in sites.items():
+                for rows in self.get_rows(connection.RetrieveContent(), page_size):
+                    for row in rows:
+                        row['vcenter'] = site
+                    writer.write(rows)
+                    total += len(rows)
+                    self.logger.info('Exported {} VMs...'.format(total))
+            writer.close()
+        finally:
+            if output:
+                stream.close()
+
+    def get_name_maps(self, content):
+        """Retrieves names of all datastores, networks and hosts with their clusters in one bulk call, so VMs
+        referencing them can be exported without touching the objects one by one."""
+        names, clusters = {}, {}
+        type_paths = {
+            vim.Datastore: ['name'],
+            vim.Network: ['name'],
+            vim.HostSystem: ['name', 'parent'],
+            vim.ComputeResource: ['name'],
+        }
+        for obj, props in collect_properties(content, type_paths):
+            names[obj._GetMoId()] = props.get('name')
+            if isinstance(obj, vim.HostSystem) and props.get('parent') is not None:
+                clusters[obj._GetMoId()] = props['parent']._GetMoId()
+        return names, dict((host, names.get(cluster)) for host, cluster in clusters.items())
+
+    def get_rows(self, content, page_size):
+        """Yields exported rows in lists holding at most page_size VMs."""
+        names, clusters = self.get_name_maps(content)
+        rows = []
+        for obj, props in collect_properties(content, {vim.VirtualMachine: VM_PROPERTIES}, page_size=page_size):
+            devices = props.get('config.hardware.device', [])
+            disks = [round(device.capacityInKB / 1024.0 / 1024.0, 2) for device in devices
+                     if isinstance(device, vim.vm.device.VirtualDisk)]
+            host = props.get('runtime.host')
+            rows.append({
+                'name': props.get('name'),
+                'uuid': props.get('config.uuid'),
+                'template': props.get('config.template'),
+                'power_state': str(props.get('runtime.powerState')),
+                'tools_status': props.get('guest.toolsStatus') and str(props['guest.toolsStatus']),
+                'cpu': props.get('config.hardware.numCPU'),
+                'memory_mb': props.get('config.hardware.memoryMB'),
+                'disks_gb': disks,
+                'disk_total_gb': round(sum(disks), 2),
+                'networks': [names.get(net._GetMoId()) for net in props.get('network', [])],
+                'datastores': [names.get(ds._GetMoId()) for ds in props.get('datastore', [])],
+                'host': names.get(host._GetMoId()) if host else None,
+                'cluster': clusters.get(host._GetMoId()) if host else None,
+                'ip': props.get('guest.ipAddress'),
+            })
+            if page_size and len(rows) >= page_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+
+BaseCommands.register('export', ExportCommands)
@@ -0,0 +1,39 @@
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.exceptions import VmCLIException
+from flavors import get_catalogue
+
+
+class FlavorCommands(BaseCommands):
+    """list available flavors and show their resolved configuration."""
+    requires_connection = False
+
+    def __init__(self, *args, **kwargs):
+        super(FlavorCommands, self).__init__(*args, **kwargs)
+
+    @args('operation', help='what operation to execute', choices=['list', 'show'])
+    @args('--name', help='name of the flavor to show')
+    def execute(self, args):
+        try:
+            if args.operation == 'list':
+                self.list_flavors()
+            elif args.operation == 'show':
+                if not args.name:
+                    raise VmCLIException('Argument --name is required with "show" operation!')
+                self.show_flavor(args.name)
+        except VmCLIException as e:
+            self.exit(e.message)
+
+    def list_flavors(self):
+        """Lists names of all flavors present in the flavor catalogue."""
+        for name in get_catalogue().names():
+            print(name)
+
+    def show_flavor(self, name):
+        """Lists directives of a flavor with all inherited directives already applied."""
+        flavor = get_catalogue().get(name)
+        for key in sorted(flavor):
+            print('{} {} {}'.format(key, '.' * max(3, 18 - len(key)), flavor[key]))
+
+
+BaseCommands.register('flavor', FlavorCommands)
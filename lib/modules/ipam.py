@@ -0,0 +1,44 @@
+import json
+
+from lib import config as conf
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.tools.ipam import AddressPool, scan_addresses
+from lib.exceptions import VmCLIException
+
+
+class IpamCommands(BaseCommands):
+    """allocate and release addresses from pools of networks configured in ipam section."""
+
+    def __init__(self, *args, **kwargs):
+        super(IpamCommands, self).__init__(*args, **kwargs)
+
+    @args('operation', help='what operation to execute', choices=['status', 'allocate', 'release'])
+    @args('--network', help='network whose address pool to use', map='VM_NETWORK')
+    @args('--names', help='comma separated names of vms to allocate or release addresses for',
+          type=lambda value: [name.strip() for name in value.split(',') if name.strip()])
+    @args('--no-scan', help='do not skip addresses reported by vmtools of existing vms', action='store_true')
+    def execute(self, args):
+        try:
+            if not args.network:
+                raise VmCLIException('Argument --network is required!')
+            if args.operation != 'status' and not args.names:
+                raise VmCLIException('Argument --names is required with "{}" operation!'.format(args.operation))
+
+            pool = AddressPool.from_config(args.network)
+            scan = conf.IPAM_SCAN and not args.no_scan
+            if args.operation == 'status':
+                print(json.dumps(pool.status(scan_addresses(self.content) if scan else ()), indent=2,
+                                 sort_keys=True))
+            elif args.operation == 'allocate':
+                addresses = pool.allocate(args.names, scan_addresses(self.content) if scan else ())
+                for name in args.names:
+                    print('{} {} {}'.format(name, addresses[name], pool.gateway))
+            elif args.operation == 'release':
+                for address in pool.release(args.names):
+                    print(address)
+        except VmCLIException as e:
+            self.exit(e.message, errno=6)
+
+
+BaseCommands.register('ipam', IpamCommands)
@@ -0,0 +1,149 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.tools.collector import retrieve_properties
+from lib.tools.library import LibraryIndex, sync_item, HAS_AUTOMAT_SDK_INSTALLED
+from lib.connector import automationSDKConnect
+from lib.exceptions import VmCLIException
+
+if HAS_AUTOMAT_SDK_INSTALLED:
+    from com.vmware.vcenter.ovf_client import LibraryItem
+
+# Templates prefixed with library: are deployed from content library by clone and create, e.g. library:golden/centos
+LIBRARY_PREFIX = 'library:'
+
+
+class LibraryCommands(BaseCommands):
+    """deploy vms from content library OVF items, list library items and prefetch subscribed libraries."""
+
+    def __init__(self, *args, **kwargs):
+        super(LibraryCommands, self).__init__(*args, **kwargs)
+
+    @args('operation', help='what operation to execute', choices=['list', 'deploy', 'prefetch', 'refresh'])
+    @args('--item', help='library item to deploy, either library/item or item name unique across libraries')
+    @args('--library', help='library whose items to list or prefetch')
+    @args('--names', help='comma separated names of vms to deploy',
+          type=lambda value: [name.strip() for name in value.split(',') if name.strip()])
+    @args('--datacenter', '--dc', help='datacenter where to deploy vms', map='VM_DATACENTER')
+    @args('--folder', help='folder where to place vms', map='VM_FOLDER')
+    @args('--datastore', '--ds', help='datastore where to store vms', map='VM_DATASTORE')
+    @args('--cluster', '--cl', help='cluster where to deploy vms', map='VM_CLUSTER')
+    @args('--resource-pool', '--rpool', help='resource pool, which should be used for vms', map='VM_RESOURCE_POOL')
+    @args('--net', help='network to connect all networks of deployed vms to', map='VM_NETWORK')
+    @args('--workers', help='number of vms deployed concurrently', type=int, map='LIBRARY_WORKERS')
+    def execute(self, args):
+        try:
+            stub_config = automationSDKConnect(args.vcenter, args.username, args.password, args.insecure)
+            index = LibraryIndex(stub_config, args.vcenter)
+            if args.operation == 'list':
+                for name, item in sorted(index.items(args.library).items()):
+                    print('{} {}{}'.format(name, item['type'], '' if item['cached'] else ' (not cached)'))
+            elif args.operation == 'refresh':
+                index.refresh()
+            elif args.operation == 'prefetch':
+                if not args.library and not args.item:
+                    raise VmCLIException('Argument --library or --item is required with "prefetch" operation!')
+                self.prefetch(stub_config, index, args.library, args.item, args.workers)
+            elif args.operation == 'deploy':
+                if not args.item or not args.names:
+                    raise VmCLIException('Arguments --item and --names are required with "deploy" operation!')
+                self.deploy(stub_config, index, args.item, args.names, args.datacenter, args.folder,
+                            args.datastore, args.cluster, args.resource_pool, args.net, args.workers)
+        except VmCLIException as e:
+            self.exit(e.message, errno=6)
+
+    def prefetch(self, stub_config, index, library=None, item=None, workers=None):
+        """Downloads content of subscribed library items, which are synced on demand, so later deploys do not
+        wait for the download. Items are synced concurrently."""
+        if item:
+            items = [index.item(item)]
+        else:
+            # fails early for unknown library
+            index.library(library)
+            items = list(index.items(library).values())
+        pending = [item for item in items if not item['cached']]
+        self.logger.info('Prefetching {} of {} library items...'.format(len(pending), len(items)))
+        with ThreadPoolExecutor(max_workers=max(1, workers or conf.LIBRARY_WORKERS)) as executor:
+            futures = [executor.submit(sync_item, stub_config, item) for item in pending]
+            for future in as_completed(futures):
+                future.result()
+        for item in pending:
+            index.mark_cached(item)
+
+    def get_placement(self, datacenter, folder, datastore, cluster, resource_pool):
+        """Returns resource pool, folder and datastore where to deploy vms."""
+        datacenter = self.get_obj('datacenter', datacenter, default=True)
+        cluster = self.get_obj('cluster', cluster, default=True)
+        if not datacenter or not cluster:
+            raise VmCLIException('Unable to find datacenter or cluster to deploy into!')
+        pool = cluster.resourcePool
+        if resource_pool:
+            pool = self.get_container_obj('resource_pool', resource_pool, bases=[cluster, datacenter.hostFolder])
+        vm_folder = datacenter.vmFolder
+        if folder:
+            vm_folder = self.get_container_obj('folder', folder, bases=[datacenter.vmFolder])
+        ds = self.get_obj('datastore', datastore, default=True)
+        if not pool or not vm_folder or not ds:
+            raise VmCLIException('Unable to find resource pool, folder or datastore to deploy into!')
+        return pool, vm_folder, ds
+
+    def deploy(self, stub_config, index, item_name, names, datacenter=None, folder=None, datastore=None,
+               cluster=None, resource_pool=None, net=None, workers=None):
+        """Deploys vm of every name from OVF library item, deployments run concurrently. Item of subscribed
+        library is synced once before deployments start. Returns dictionary of name: deployed vm."""
+        item = index.item(item_name)
+        if item['type'] != 'ovf':
+            raise VmCLIException('Only OVF library items can be deployed, {} is {}!'.format(item_name, item['type']))
+        if not item['cached']:
+            self.logger.info('Syncing content of library item {}...'.format(item_name))
+            sync_item(stub_config, item)
+            index.mark_cached(item)
+
+        existing = set(props.get('name') for _, props in retrieve_properties(self.content, vim.VirtualMachine,
+                                                                              ['name']))
+        duplicates = [name for name in names if name in existing]
+        if duplicates:
+            raise VmCLIException('VMs with names {} already exist. Exiting...'.format(', '.join(duplicates)))
+
+        pool, vm_folder, ds = self.get_placement(datacenter, folder, datastore, cluster, resource_pool)
+        ovf_svc = LibraryItem(stub_config)
+        target = LibraryItem.DeploymentTarget(resource_pool_id=pool._GetMoId(), folder_id=vm_folder._GetMoId())
+        network_mappings = None
+        if net:
+            network = self.get_obj('network', net)
+            if not network:
+                raise VmCLIException('Unable to find provided network {}! Aborting...'.format(net))
+            summary = ovf_svc.filter(item['id'], target)
+            network_mappings = dict((name, network._GetMoId()) for name in summary.networks or [])
+
+        def deploy_vm(name):
+            spec = LibraryItem.ResourcePoolDeploymentSpec(
+                    name=name, accept_all_eula=True, default_datastore_id=ds._GetMoId(),
+                    storage_provisioning='thin', network_mappings=network_mappings)
+            result = ovf_svc.deploy(item['id'], target, spec, client_token=str(uuid.uuid4()))
+            if not result.succeeded:
+                errors = [error.message.default_message for error in result.error.errors] if result.error else []
+                raise VmCLIException('Deployment of {} failed: {}'.format(name, '; '.join(errors) or 'unknown error'))
+            return vim.VirtualMachine(result.resource_id.id, self.connection._stub)
+
+        deployed, failed = {}, []
+        self.logger.info('Deploying {} vms from library item {}...'.format(len(names), item_name))
+        with ThreadPoolExecutor(max_workers=max(1, min(len(names), workers or conf.LIBRARY_WORKERS))) as executor:
+            futures = dict((executor.submit(deploy_vm, name), name) for name in names)
+            for future in as_completed(futures):
+                try:
+                    deployed[futures[future]] = future.result()
+                    self.logger.info('Deployed vm {}'.format(futures[future]))
+                except VmCLIException as e:
+                    self.logger.error(e.message)
+                    failed.append(futures[future])
+        if failed:
+            raise VmCLIException('Failed to deploy {} of {} vms!'.format(len(failed), len(names)))
+        return deployed
+
+
+BaseCommands.register('library', LibraryCommands)
@@ -1,10 +1,14 @@
 from pyVmomi import vim
-from collections import OrderedDict
 
+from lib import config as conf
 from lib.modules import BaseCommands
 from lib.tools.argparser import args
 from lib.tools import convert_to_mb
+from lib.tools.inventory import get_inventory_mirror
+from lib.tools.query import Query, print_rows
+from lib.tools.records import load_records
 from lib.constants import VMWARE_TYPES
+from lib.exceptions import VmCLIException
 
 
 class ListCommands(BaseCommands):
@@ -15,27 +19,74 @@ class ListCommands(BaseCommands):
 
     @args('type', help='for which type of objects to search', choices=[key for key in VMWARE_TYPES])
     def execute(self, args):
-        if args.name:
+        if args.where or args.fields or args.sort or args.limit or args.output:
+            self.query_items(args.type, args.where, args.fields, args.sort, args.limit, args.output)
+        elif args.name:
             self.show_item(args.type, args.name)
+        elif len(self.sites) > 1:
+            self.list_site_items([VMWARE_TYPES[args.type]])
+        elif conf.INVENTORY_MIRROR:
+            self.list_mirrored_items(args.type)
         else:
             self.list_items([VMWARE_TYPES[args.type]])
 
+    def get_items(self, vimtype, content=None):
+        """Returns items in a specific VMware object category sorted by their names."""
+        content = content or self.content
+        # Objects are loaded as compact records with names retrieved in one call, duplicate names are listed once
+        records = dict((record.name, record) for record in load_records(content, vimtype))
+        return [records[name] for name in sorted(records)]
+
     def list_items(self, vimtype):
         """Lists items in a specific VMware object category."""
-        container = self.content.viewManager.CreateContainerView(self.content.rootFolder, vimtype, True)
-        # Due to receiving generator-like object, which cannot be reliably sorted alphabeticaly we iterate the object
-        # and convert it to ordered dict with name attribute as a key used later in sort
-        view_items = list({x.name: x for x in container.view}.items())
-        sorted_view = OrderedDict(sorted(view_items, key=lambda t: t[0]))
-        sorted_view = list(sorted_view.values())
         self.logger.info('Searching for requested category...')
-        for item in sorted_view:
+        for item in self.get_items(vimtype):
             print(item.name)
 
+    def list_mirrored_items(self, kind):
+        """Lists names of items in a specific VMware object category from local inventory mirror."""
+        mirror = get_inventory_mirror(conf.VCENTER)
+        mirror.ensure_fresh()
+        for name in mirror.names(kind):
+            print(name)
+
+    def list_site_items(self, vimtype):
+        """Lists items of all connected vCenters. Output of each vCenter is printed as soon as it responds,
+        every line is prefixed with name of the vCenter."""
+        self.logger.info('Searching for requested category on {} vCenters...'.format(len(self.sites)))
+        for site, items in self.for_each_site(lambda site, content: [x.name for x in self.get_items(vimtype, content)]):
+            for name in items:
+                print('{}: {}'.format(site, name))
+
+    @args('--where', help='filter expression, e.g. "cpu > 8 and power == poweredOff and datastore == ds01"')
+    @args('--fields', help='comma separated properties or their aliases to display (default name)',
+          type=lambda value: [field.strip() for field in value.split(',') if field.strip()])
+    @args('--sort', help='property to sort results by, prefix with - for descending order')
+    @args('--limit', help='display at most this many results', type=int)
+    @args('--output', help='output format of query results', choices=['table', 'json', 'csv'])
+    def query_items(self, kind, where, fields, sort, limit, output):
+        """Lists objects matching filter expression with selected properties. Only referenced properties are
+        retrieved, with one bulk call per connected vCenter."""
+        output = output or 'table'
+        vimtype = VMWARE_TYPES[kind]
+        try:
+            query = Query(kind, where, fields, sort, limit)
+            if len(self.sites) > 1:
+                rows = []
+                for site, site_rows in self.for_each_site(lambda site, content: query.run(content, vimtype)):
+                    for row in site_rows:
+                        row['vcenter'] = site
+                        rows.append(row)
+                print_rows(query.select(rows, ['vcenter']), ['vcenter'] + query.fields, output)
+            else:
+                print_rows(query.select(query.run(self.content, vimtype)), query.fields, output)
+        except VmCLIException as e:
+            self.exit(e.message)
+
     @args('--name', help='search for a specific object instead')
     def show_item(self, vimtype, name):
         """Lists details about specific VMware object."""
-        obj = self.get_obj(vimtype, name, default=False)
+        obj = self.find_obj(vimtype, name)
         if not obj:
             return
 
@@ -46,7 +46,7 @@ class ModifyCommands(BaseCommands):
                 self.logger.info("Increasing cpu count to {} cores...".format(cpu))
                 config_spec.numCPUs = cpu
 
-        task = vm.ReconfigVM_Task(config_spec)
+        task = self.submit_task(vm, 'ReconfigVM_Task', config_spec)
         self.wait_for_tasks([task])
 
     @args('--net', help='network to attach to a network device')
@@ -90,7 +90,7 @@ class ModifyCommands(BaseCommands):
 
                 config_spec = vim.vm.ConfigSpec(deviceChange=[nicspec])
                 self.logger.info("Attaching network {} to {}. network device on VM...".format(net, dev))
-                task = vm.ReconfigVM_Task(config_spec)
+                task = self.submit_task(vm, 'ReconfigVM_Task', config_spec)
                 self.wait_for_tasks([task])
                 return
 
@@ -113,7 +113,7 @@ class ModifyCommands(BaseCommands):
 
         self.logger.info('Updating VM hardware version...')
         try:
-            task = vm.UpgradeVM_Task(version=version)
+            task = self.submit_task(vm, 'UpgradeVM_Task', version=version)
             self.wait_for_tasks([task])
         except vim.fault.AlreadyUpgraded:
             pass
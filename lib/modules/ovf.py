@@ -0,0 +1,203 @@
+import os
+import shutil
+import tarfile
+import tempfile
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.tools.nfc import http_session, wait_for_lease, device_url, LeaseKeeper, ChunkReader, transfer_all
+from lib.exceptions import VmCLIException
+
+
+class OvfPackage(object):
+    """OVF package, either OVA archive or descriptor with files placed in its directory. Files of OVA archive
+    are indexed once by their offsets, every file is then read directly from the archive without extracting
+    it, so more disks can be read at once through separate file handles."""
+
+    def __init__(self, path):
+        self.path = path
+        self.members = {}
+        if tarfile.is_tarfile(path):
+            with tarfile.open(path) as archive:
+                for member in archive:
+                    if member.isfile():
+                        self.members[member.name] = (member.offset_data, member.size)
+            self.directory = None
+        else:
+            self.directory = os.path.dirname(os.path.abspath(path))
+
+    def descriptor(self):
+        """Returns content of the OVF descriptor."""
+        if self.directory is not None:
+            with open(self.path) as descriptor_file:
+                return descriptor_file.read()
+        for name in self.members:
+            if name.endswith('.ovf'):
+                with self.open(name) as stream:
+                    return stream.read(self.size(name)).decode('utf-8')
+        raise VmCLIException('No OVF descriptor found in {}!'.format(self.path))
+
+    def size(self, name):
+        if self.directory is not None:
+            return os.path.getsize(os.path.join(self.directory, name))
+        try:
+            return self.members[name][1]
+        except KeyError:
+            raise VmCLIException('File {} is missing in {}!'.format(name, self.path))
+
+    def open(self, name):
+        """Returns file object positioned at the beginning of the file."""
+        if self.directory is not None:
+            return open(os.path.join(self.directory, name), 'rb')
+        stream = open(self.path, 'rb')
+        stream.seek(self.members[name][0])
+        return stream
+
+
+class OvfCommands(BaseCommands):
+    """import vm from OVF/OVA package or export vm into it."""
+
+    def __init__(self, *args, **kwargs):
+        super(OvfCommands, self).__init__(*args, **kwargs)
+
+    @args('operation', help='what operation to execute', choices=['import', 'export'])
+    @args('--name', required=True, help='name of the imported vm or name of the vm to export')
+    @args('--file', help='OVA or OVF file to import from or export into', dest='ovf_file', required=True)
+    @args('--datacenter', '--dc', help='datacenter where to import vm', map='VM_DATACENTER')
+    @args('--folder', help='folder where to place imported vm', map='VM_FOLDER')
+    @args('--datastore', '--ds', help='datastore where to store imported vm', map='VM_DATASTORE')
+    @args('--cluster', '--cl', help='cluster where to import vm', map='VM_CLUSTER')
+    @args('--resource-pool', '--rpool', help='resource pool, which should be used for vm', map='VM_RESOURCE_POOL')
+    @args('--net', help='network to connect all networks of imported vm to', map='VM_NETWORK')
+    @args('--workers', help='number of disks transferred concurrently', type=int, map='OVF_WORKERS')
+    def execute(self, args):
+        try:
+            host = args.vcenter or conf.VCENTER
+            if args.operation == 'import':
+                self.import_vm(args.ovf_file, args.name, args.datacenter, args.folder, args.datastore, args.cluster,
+                               args.resource_pool, args.net, args.workers, host, not conf.INSECURE_CONNECTION)
+            elif args.operation == 'export':
+                self.export_vm(args.name, args.ovf_file, args.workers, host, not conf.INSECURE_CONNECTION)
+        except VmCLIException as e:
+            self.exit(e.message, errno=6)
+
+    def import_vm(self, source, name, datacenter, folder, datastore, cluster, resource_pool, net, workers, host,
+                  verify=True):
+        """Imports vm from the package. Disks are streamed from the package to ESXi hosts in chunks, more of
+        them at once over pooled connections, while the NFC lease is kept alive."""
+        package = OvfPackage(source)
+        descriptor = package.descriptor()
+
+        datacenter = self.get_obj('datacenter', datacenter, default=True)
+        cluster = self.get_obj('cluster', cluster, default=True)
+        if not datacenter or not cluster:
+            raise VmCLIException('Unable to find datacenter or cluster to import vm into!')
+        pool = cluster.resourcePool
+        if resource_pool:
+            pool = self.get_container_obj('resource_pool', resource_pool, bases=[cluster, datacenter.hostFolder])
+        vm_folder = datacenter.vmFolder
+        if folder:
+            vm_folder = self.get_container_obj('folder', folder, bases=[datacenter.vmFolder])
+        ds = self.get_obj('datastore', datastore, default=True)
+        if not pool or not vm_folder or not ds:
+            raise VmCLIException('Unable to find resource pool, folder or datastore to import vm into!')
+
+        params = vim.OvfManager.CreateImportSpecParams(entityName=name, diskProvisioning='thin')
+        ovf_manager = self.content.ovfManager
+        if net:
+            network = self.get_obj('network', net)
+            if not network:
+                raise VmCLIException('Unable to find provided network {}! Aborting...'.format(net))
+            parsed = ovf_manager.ParseDescriptor(descriptor, vim.OvfManager.ParseDescriptorParams())
+            params.networkMapping = [vim.OvfManager.NetworkMapping(name=n.name, network=network)
+                                     for n in parsed.network or []]
+
+        result = ovf_manager.CreateImportSpec(descriptor, pool, ds, params)
+        if result.error:
+            raise VmCLIException('Unable to import {}: {}'.format(source, result.error[0].msg))
+        for warning in result.warning or []:
+            self.logger.warning(warning.msg)
+
+        self.logger.info('Importing vm {} from {}...'.format(name, source))
+        lease = pool.ImportVApp(result.importSpec, vm_folder)
+        info = wait_for_lease(lease)
+        urls = dict((url.importKey, device_url(url.url, host)) for url in info.deviceUrl)
+        items = result.fileItem or []
+        session = http_session(self.connection._stub, workers, verify)
+
+        def upload(item, keeper):
+            size = package.size(item.path)
+            # stream-optimized disks are posted into created disk, other files (ISO, nvram) are put as a whole
+            if item.create:
+                method, headers = 'PUT', {'Overwrite': 't', 'Content-Type': 'application/octet-stream'}
+            else:
+                method, headers = 'POST', {'Content-Type': 'application/x-vnd.vmware-streamVmdk'}
+            with package.open(item.path) as stream:
+                response = session.request(method, urls[item.deviceId], data=ChunkReader(stream, size, keeper),
+                                           headers=headers)
+            response.raise_for_status()
+            self.logger.debug('Uploaded {}'.format(item.path))
+
+        with LeaseKeeper(lease, sum(package.size(item.path) for item in items)) as keeper:
+            transfer_all([lambda item=item: upload(item, keeper) for item in items], workers)
+        self.logger.info('Imported vm {}'.format(name))
+        return info.entity
+
+    def export_vm(self, name, output, workers, host, verify=True):
+        """Exports powered off vm. Disks are downloaded concurrently in chunks, OVF descriptor describing them
+        is created by vCenter. Output ending with .ova is packed into single archive, otherwise it is
+        a directory with descriptor and disks."""
+        vm = self.get_vm_obj(name, fail_missing=True)
+        if vm.runtime.powerState != 'poweredOff':
+            raise VmCLIException('VM must be powered off to be exported!')
+
+        ova = output.endswith('.ova')
+        # disk sizes have to be known before they are written into tar, so OVA is packed after download
+        directory = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output))) if ova else output
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        try:
+            self.logger.info('Exporting vm {} into {}...'.format(vm.name, output))
+            lease = vm.ExportVm()
+            info = wait_for_lease(lease)
+            disks = [url for url in info.deviceUrl if url.disk]
+            session = http_session(self.connection._stub, workers, verify)
+
+            def download(url, keeper):
+                response = session.get(device_url(url.url, host), stream=True)
+                response.raise_for_status()
+                with open(os.path.join(directory, url.targetId), 'wb') as disk_file:
+                    for chunk in response.iter_content(conf.OVF_CHUNK_SIZE):
+                        disk_file.write(chunk)
+                        keeper.add(len(chunk))
+                self.logger.debug('Downloaded {}'.format(url.targetId))
+
+            with LeaseKeeper(lease, (info.totalDiskCapacityInKB or 0) * 1024) as keeper:
+                transfer_all([lambda url=url: download(url, keeper) for url in disks], workers)
+                ovf_files = [vim.OvfManager.OvfFile(deviceId=url.key, path=url.targetId,
+                                                    size=os.path.getsize(os.path.join(directory, url.targetId)))
+                             for url in disks]
+                result = self.content.ovfManager.CreateDescriptor(
+                        obj=vm, cdp=vim.OvfManager.CreateDescriptorParams(ovfFiles=ovf_files, name=vm.name))
+                if result.error:
+                    raise VmCLIException('Unable to create OVF descriptor: {}'.format(result.error[0].msg))
+
+            descriptor_name = '{}.ovf'.format(vm.name)
+            with open(os.path.join(directory, descriptor_name), 'w') as descriptor_file:
+                descriptor_file.write(result.ovfDescriptor)
+
+            if ova:
+                # descriptor has to be the first file of the archive
+                with tarfile.open(output, 'w') as archive:
+                    for file_name in [descriptor_name] + [url.targetId for url in disks]:
+                        archive.add(os.path.join(directory, file_name), arcname=file_name)
+        finally:
+            if ova:
+                shutil.rmtree(directory, ignore_errors=True)
+        self.logger.info('Exported vm {} into {}'.format(vm.name, output))
+
+
+BaseCommands.register('ovf', OvfCommands)
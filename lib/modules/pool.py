@@ -0,0 +1,199 @@
+import os
+import sys
+import uuid
+import subprocess
+from pyVmomi import vim
+
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.tools.collector import retrieve_properties
+from lib.tools.state import state_path, locked
+from lib.exceptions import VmCLIException
+from flavors import load_vm_flavor
+
+import lib.config as conf
+
+# import commands used to prepare pool members
+from lib.modules.clone import CloneCommands
+from lib.modules.snapshot import SnapshotCommands
+
+
+POOL_PREFIX = 'vmcli-pool'
+# Memory snapshot taken once the pool member is running with vmtools ready, reverting to it recycles the vm
+POOL_SNAPSHOT = 'vmcli-pool-ready'
+
+
+class PoolCommands(BaseCommands):
+    """maintain pool of pre-cloned running vms per flavor, which are handed out in seconds."""
+
+    def __init__(self, *args, **kwargs):
+        super(PoolCommands, self).__init__(*args, **kwargs)
+
+    @args('operation', help='what operation to execute', choices=['status', 'fill', 'checkout', 'return'])
+    @args('--flavor', help='flavor of the pool to operate on')
+    @args('--name', help='new name of the checked out vm or name of the vm to return')
+    @args('--size', help='number of ready vms to keep in the pool', type=int, map='POOL_SIZE')
+    @args('--folder', help='folder where to move checked out vm')
+    @args('--no-refill', help='do not refill the pool in background after checkout', action='store_true')
+    def execute(self, args):
+        try:
+            if args.operation != 'return' and not args.flavor:
+                raise VmCLIException('Argument --flavor is required with "{}" operation!'.format(args.operation))
+
+            if args.operation == 'status':
+                self.show_status(args.flavor)
+            elif args.operation == 'fill':
+                self.fill_pool(args.flavor, args.size)
+            elif args.operation == 'checkout':
+                if not args.name:
+                    raise VmCLIException('Argument --name is required with "checkout" operation!')
+                vm = self.checkout_vm(args.flavor, args.name, args.folder)
+                print('{} {}'.format(vm.name, vm.guest.ipAddress or ''))
+                if not args.no_refill:
+                    self.refill_in_background(args.flavor, args.size)
+            elif args.operation == 'return':
+                if not args.name:
+                    raise VmCLIException('Argument --name is required with "return" operation!')
+                self.return_vm(args.name)
+        except VmCLIException as e:
+            self.exit(e.message, errno=6)
+
+    def get_pool_folder(self):
+        folder = self.get_container_obj('folder', conf.POOL_FOLDER)
+        if not folder:
+            raise VmCLIException('Pool folder {} not found! Configure pool.folder directive.'.format(conf.POOL_FOLDER))
+        return folder
+
+    @staticmethod
+    def member_prefix(flavor):
+        return '{}-{}-'.format(POOL_PREFIX, flavor)
+
+    def get_members(self, flavor):
+        """Returns pool members of the flavor split into ready and preparing vms. Members are looked up with
+        single bulk property retrieval over the pool folder. Member is ready when it is running with vmtools
+        available and its pool snapshot already exists."""
+        prefix = self.member_prefix(flavor)
+        properties = ['name', 'runtime.powerState', 'guest.toolsRunningStatus', 'rootSnapshot']
+        ready, preparing = [], []
+        for vm, props in retrieve_properties(self.content, vim.VirtualMachine, properties,
+                                             root=self.get_pool_folder()):
+            if not props.get('name', '').startswith(prefix):
+                continue
+            if (props.get('runtime.powerState') == 'poweredOn' and props.get('rootSnapshot') and
+                    props.get('guest.toolsRunningStatus') == 'guestToolsRunning'):
+                ready.append((props['name'], vm))
+            else:
+                preparing.append((props['name'], vm))
+        return sorted(ready, key=lambda t: t[0]), sorted(preparing, key=lambda t: t[0])
+
+    def show_status(self, flavor):
+        """Prints pool members and their state."""
+        ready, preparing = self.get_members(flavor)
+        for name, _ in ready:
+            print('{} ready'.format(name))
+        for name, _ in preparing:
+            print('{} preparing'.format(name))
+
+    def fill_pool(self, flavor, size):
+        """Clones new members until the pool contains requested number of vms. Members are linked clones
+        of flavor's template, powered on and snapshotted with memory once their vmtools are running."""
+        size = size or conf.POOL_SIZE
+        # Serialize refills of the same pool, so concurrent checkouts do not overfill it
+        with locked(state_path('pool', '{}.fill'.format(flavor))):
+            ready, preparing = self.get_members(flavor)
+            missing = size - len(ready) - len(preparing)
+            if missing <= 0:
+                self.logger.info('Pool {} is already full'.format(flavor))
+                return
+
+            settings = load_vm_flavor(flavor)
+            template = settings.get('template') or conf.VM_TEMPLATE
+            clone = CloneCommands(self.connection)
+            pool_folder = self.get_pool_folder()
+            for _ in range(missing):
+                name = self.member_prefix(flavor) + uuid.uuid4().hex[:8]
+                self.logger.info('Preparing pool member {}...'.format(name))
+                clone.clone_vm(name, template, settings.get('datacenter'), conf.POOL_FOLDER, settings.get('datastore'),
+                               settings.get('cluster'), settings.get('resource_pool'), True, settings.get('mem'),
+                               settings.get('cpu'), auto_place=conf.VM_AUTO_PLACE, linked=conf.POOL_LINKED)
+                vm = self.get_vm_obj(name, fail_missing=True, folder=pool_folder)
+                if self.wait_for_guest_vmtools(vm, timeout=conf.VM_OS_TIMEOUT) is False:
+                    raise VmCLIException('Pool member {} did not start vmtools in time!'.format(name))
+
+                task = self.submit_task(vm, 'CreateSnapshot_Task', name=POOL_SNAPSHOT,
+                                        description='vmcli pool member ready state', memory=True, quiesce=False)
+                self.wait_for_tasks([task])
+
+    def checkout_vm(self, flavor, name, folder=None):
+        """Hands out ready pool member by renaming it. Each member is claimed under a guard shared by checkouts
+        running on any host (see claim_member), local lock only keeps checkouts of this host from competing."""
+        if self.get_obj('vm', name):
+            raise VmCLIException('VM with name {} already exists!'.format(name))
+
+        with locked(state_path('pool', '{}.checkout'.format(flavor))):
+            ready, _ = self.get_members(flavor)
+            pool_folder = self.get_pool_folder()
+            for member_name, vm in ready:
+                if not self.claim_member(pool_folder, member_name, vm, name):
+                    self.logger.debug('Pool member {} taken by another checkout'.format(member_name))
+                    continue
+
+                self.logger.info('Checked out pool member {} as {}'.format(member_name, name))
+                if folder:
+                    target = self.get_container_obj('folder', folder)
+                    if not target:
+                        raise VmCLIException('Folder {} not found!'.format(folder))
+                    self.wait_for_tasks([self.submit_task(target, 'MoveIntoFolder_Task', [vm])])
+                return vm
+
+        raise VmCLIException('No ready vm in pool {}! Run "pool fill" first.'.format(flavor))
+
+    def claim_member(self, pool_folder, member_name, vm, name):
+        """Renames pool member to name, unless another checkout took it already. vCenter creates folder of
+        a given name only once, so guard folder named after the member is held while its name is checked
+        and changed. Returns True when the member was claimed."""
+        try:
+            guard = pool_folder.CreateFolder('{}-checkout'.format(member_name))
+        except vim.fault.DuplicateName:
+            return False
+        try:
+            # member list could have been retrieved before another checkout renamed the vm
+            if vm.name != member_name:
+                return False
+            self.wait_for_tasks([self.submit_task(vm, 'Rename_Task', newName=name)])
+            return True
+        finally:
+            self.wait_for_tasks([self.submit_task(guard, 'Destroy_Task')])
+
+    def return_vm(self, name):
+        """Recycles checked out vm back into its pool by reverting it to pool snapshot. Original member name
+        is kept in vm's annotation, which is set to the vm name during cloning."""
+        vm = self.get_vm_obj(name, fail_missing=True)
+        member_name = vm.config.annotation or ''
+        if not member_name.startswith(POOL_PREFIX + '-'):
+            raise VmCLIException('VM {} does not originate from any pool!'.format(name))
+
+        self.logger.info('Returning {} into the pool as {}...'.format(name, member_name))
+        SnapshotCommands(self.connection).revert_snapshot(vm, POOL_SNAPSHOT)
+        self.wait_for_tasks([self.submit_task(vm, 'Rename_Task', newName=member_name)])
+        if vm.parent != self.get_pool_folder():
+            self.wait_for_tasks([self.submit_task(self.get_pool_folder(), 'MoveIntoFolder_Task', [vm])])
+
+    def refill_in_background(self, flavor, size=None):
+        """Spawns detached vmcli process refilling the pool, so checkout returns immediately."""
+        command = [sys.executable, os.path.join(conf.BASE_DIR, 'vmcli.py'), '--quiet', 'pool', 'fill',
+                   '--flavor', flavor]
+        if size:
+            command.extend(['--size', str(size)])
+        # credentials could have been provided via command line or prompt, hand them over to the child process
+        env = dict(os.environ, VMCLI_VCENTER=conf.VCENTER or '', VMCLI_USERNAME=conf.USERNAME or '',
+                   VMCLI_PASSWORD=conf.PASSWORD or '')
+        if conf.INSECURE_CONNECTION:
+            env['VMCLI_INSECURE_CONNECTION'] = 'yes'
+        self.logger.info('Refilling pool {} in background...'.format(flavor))
+        with open(os.devnull, 'w') as devnull:
+            subprocess.Popen(command, env=env, cwd=conf.BASE_DIR, stdout=devnull, stderr=devnull,
+                             close_fds=True, preexec_fn=os.setsid)
+
+
+BaseCommands.register('pool', PoolCommands)
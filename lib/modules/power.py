@@ -24,18 +24,18 @@ class PowerCommands(BaseCommands):
         elif args.reset:
             self.reset_vm(args.name)
         elif args.show:
-            vm = self.get_obj('vm', args.name)
+            vm = self.get_vm_obj(args.name, fail_missing=True)
             print(vm.runtime.powerState)
 
     def poweron_vm(self, name):
         vm = self.get_vm_obj(name, fail_missing=True)
         if vm.runtime.powerState == 'poweredOff':
-            self.wait_for_tasks([vm.PowerOnVM_Task()])
+            self.wait_for_tasks([self.submit_task(vm, 'PowerOnVM_Task')])
 
     def poweroff_vm(self, name):
         vm = self.get_vm_obj(name, fail_missing=True)
         if vm.runtime.powerState == 'poweredOn':
-            self.wait_for_tasks([vm.PowerOffVM_Task()])
+            self.wait_for_tasks([self.submit_task(vm, 'PowerOffVM_Task')])
 
     def reboot_vm(self, name):
         vm = self.get_vm_obj(name, fail_missing=True)
@@ -43,7 +43,7 @@ class PowerCommands(BaseCommands):
 
     def reset_vm(self, name):
         vm = self.get_vm_obj(name, fail_missing=True)
-        self.wait_for_tasks([vm.ResetVM_Task()])
+        self.wait_for_tasks([self.submit_task(vm, 'ResetVM_Task')])
 
 
 BaseCommands.register('power', PowerCommands)
@@ -41,13 +41,16 @@ class SnapshotCommands(BaseCommands):
                 break
             tree = tree[0].childSnapshotList
 
-    def get_snapshot_by_name(self, snapshots, name):
+    @staticmethod
+    def get_snapshot_by_name(snapshots, name):
         """Gets first snapshot object found based on name."""
-        for snap in snapshots:
+        for snap in snapshots or []:
             if snap.name == name:
                 return snap
-            else:
-                return self.get_snapshot_by_name(snap.childSnapshotList, name)
+            child = SnapshotCommands.get_snapshot_by_name(snap.childSnapshotList, name)
+            if child:
+                return child
+        return None
 
     @args('--desc', help='snapshot description (required when action==create)')
     @args('--memory', help='snapshot VM memory (default is False)', action='store_true', default=False)
@@ -58,21 +61,22 @@ class SnapshotCommands(BaseCommands):
             raise VmCLIException('Argument --desc is required with "create" operation!')
 
         self.logger.info('Creating snapshot of the virtual machine...')
-        task = vm.CreateSnapshot_Task(name=snapshot, description=desc, memory=memory, quiesce=quiesce)
+        task = self.submit_task(vm, 'CreateSnapshot_Task', name=snapshot, description=desc, memory=memory,
+                                quiesce=quiesce)
         self.wait_for_tasks([task])
 
     def delete_snapshot(self, vm, snapshot):
         """Deletes specific snapshot on the VM."""
         snap = self.get_snapshot_by_name(vm.snapshot.rootSnapshotList, snapshot)
         self.logger.info('Deleting snapshot from the virtual machine...')
-        task = snap.snapshot.RemoveSnapshot_Task(removeChildren=False)
+        task = self.submit_task(snap.snapshot, 'RemoveSnapshot_Task', removeChildren=False)
         self.wait_for_tasks([task])
 
     def revert_snapshot(self, vm, snapshot):
         """Reverts VM to a specific snapshot."""
         snap = self.get_snapshot_by_name(vm.snapshot.rootSnapshotList, snapshot)
         self.logger.info('Reverting VM to specified snapshot...')
-        task = snap.snapshot.RevertToSnapshot_Task()
+        task = self.submit_task(snap.snapshot, 'RevertToSnapshot_Task')
         self.wait_for_tasks([task])
 
 
@@ -0,0 +1,146 @@
+import json
+import time
+import fnmatch
+import datetime
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.tools.collector import retrieve_properties
+from lib.tools.state import state_path, load_json, save_json
+from lib.exceptions import VmCLIException
+
+
+DEFAULT_COUNTERS = ['cpu.usage.average', 'cpu.ready.summation', 'mem.usage.average',
+                    'datastore.totalReadLatency.average', 'datastore.totalWriteLatency.average']
+
+ENTITY_TYPES = {
+    'vm': vim.VirtualMachine,
+    'host': vim.HostSystem,
+}
+
+
+class StatsCommands(BaseCommands):
+    """stream performance metrics of VMs or hosts as json lines."""
+
+    def __init__(self, *args, **kwargs):
+        super(StatsCommands, self).__init__(*args, **kwargs)
+        self._counters = {}
+
+    @args('type', help='type of entities to query metrics of', choices=['vm', 'host'])
+    @args('names', help='names of entities, shell-style wildcards are accepted', nargs='+')
+    @args('--counters', help='comma separated counters in group.name.rollup form (default: cpu, mem and '
+          'datastore latency)', type=lambda value: [c.strip() for c in value.split(',') if c.strip()])
+    @args('--interval', help='realtime or id of historical interval in seconds, e.g. 300, 1800, 7200, 86400',
+          default='realtime')
+    @args('--since', help='how many minutes back to query (default latest sample only)', type=int)
+    @args('--instance', help='counter instance, "*" for all instances (default aggregated value only)', default='')
+    @args('--batch-size', help='number of entities queried with single QueryPerf call', type=int,
+          map='STATS_BATCH_SIZE')
+    @args('--follow', help='keep streaming new realtime samples as they arrive', action='store_true')
+    def execute(self, args):
+        try:
+            self.stream_stats(ENTITY_TYPES[args.type], args.names, args.counters or DEFAULT_COUNTERS,
+                              args.interval, args.since, args.instance, args.batch_size, args.follow)
+        except VmCLIException as e:
+            self.exit(e.message)
+
+    def get_counter_ids(self, site, content, names):
+        """Translates counter names into counter ids. All counters of the vCenter are loaded only once and kept
+        in state directory, perfManager is asked again only when an unknown counter is requested."""
+        if site not in self._counters:
+            self._counters[site] = load_json(state_path('perf', '{}.json'.format(site)), {})
+        counters = self._counters[site]
+
+        if any(name not in counters for name in names):
+            counters.clear()
+            for counter in content.perfManager.perfCounter:
+                name = '{}.{}.{}'.format(counter.groupInfo.key, counter.nameInfo.key, counter.rollupType)
+                counters[name] = [counter.key, counter.unitInfo.key]
+            save_json(state_path('perf', '{}.json'.format(site)), counters)
+
+        missing = [name for name in names if name not in counters]
+        if missing:
+            raise VmCLIException('Unknown performance counters: {}'.format(', '.join(missing)))
+        return dict((name, counters[name]) for name in names)
+
+    def get_entities(self, content, vimtype, patterns):
+        """Returns list of (name, entity) matching any of the patterns, names are retrieved in one bulk call."""
+        entities = []
+        for obj, props in retrieve_properties(content, vimtype, ['name']):
+            name = props.get('name')
+            if name and any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns):
+                entities.append((name, obj))
+        return sorted(entities, key=lambda t: t[0])
+
+    def query_stats(self, content, entities, counters, interval_id, start, end, instance, batch_size, max_sample):
+        """Queries metrics of all entities with as few QueryPerf calls as possible. Every call carries query
+        specifications of batch_size entities. Yields samples as dictionaries."""
+        names = dict((entity._GetMoId(), name) for name, entity in entities)
+        by_id = dict((key, (counter, unit)) for counter, (key, unit) in counters.items())
+        metric_ids = [vim.PerformanceManager.MetricId(counterId=key, instance=instance) for key, _ in counters.values()]
+
+        for i in range(0, len(entities), batch_size):
+            specs = [vim.PerformanceManager.QuerySpec(entity=entity, metricId=metric_ids, intervalId=interval_id,
+                                                      startTime=start, endTime=end, maxSample=max_sample,
+                                                      format='normal')
+                     for _, entity in entities[i:i + batch_size]]
+            for result in content.perfManager.QueryPerf(querySpec=specs) or []:
+                timestamps = [info.timestamp for info in result.sampleInfo]
+                for series in result.value:
+                    counter, unit = by_id.get(series.id.counterId, (series.id.counterId, None))
+                    for timestamp, value in zip(timestamps, series.value):
+                        yield {
+                            'entity': names.get(result.entity._GetMoId()),
+                            'counter': counter,
+                            'instance': series.id.instance,
+                            'timestamp': timestamp,
+                            'value': value,
+                            'unit': unit,
+                        }
+
+    def stream_stats(self, vimtype, patterns, counter_names, interval, since, instance, batch_size, follow):
+        """Prints samples of requested counters as json lines for all matching entities of all vCenters."""
+        sites = self.sites or {conf.VCENTER: self.connection}
+        queries = []
+        for site, connection in sites.items():
+            content = connection.RetrieveContent()
+            entities = self.get_entities(content, vimtype, patterns)
+            if not entities:
+                self.logger.warning('No matching entities found on {}'.format(site))
+                continue
+
+            counters = self.get_counter_ids(site, content, counter_names)
+            if interval == 'realtime':
+                # realtime interval id equals to refresh rate of the entities, usually 20 seconds
+                interval_id = content.perfManager.QueryPerfProviderSummary(entity=entities[0][1]).refreshRate
+            else:
+                try:
+                    interval_id = int(interval)
+                except ValueError:
+                    raise VmCLIException('Interval must be either realtime or number of seconds!')
+            start = content.CurrentTime() - datetime.timedelta(minutes=since) if since else None
+            queries.append({'site': site, 'content': content, 'entities': entities, 'counters': counters,
+                            'interval': interval_id, 'start': start})
+
+        while queries:
+            for query in queries:
+                # without start time, only the latest sample is requested
+                max_sample = None if query['start'] else 1
+                for sample in self.query_stats(query['content'], query['entities'], query['counters'],
+                                               query['interval'], query['start'], None, instance, batch_size,
+                                               max_sample):
+                    if len(sites) > 1:
+                        sample['vcenter'] = query['site']
+                    print(json.dumps(dict(sample, timestamp=sample['timestamp'].isoformat())))
+                    # next query continues right after the newest sample already printed
+                    query['newest'] = max(query.get('newest') or sample['timestamp'], sample['timestamp'])
+                query['start'] = query.get('newest') or query['start']
+
+            if not (follow and interval == 'realtime'):
+                break
+            time.sleep(min(query['interval'] for query in queries))
+
+
+BaseCommands.register('stats', StatsCommands)
@@ -46,19 +46,16 @@ class TagCommands(BaseCommands):
             raise VmCLIException('Arguments name or tags are missing, cannot continue!')
 
         vm = self.get_vm_obj(name, fail_missing=True)
-        # Get vmware ID representation in form 'vm-XXX' for later association
-        vm_id = vm._GetMoId()
-        vm_dynid = DynamicID(type='VirtualMachine', id=vm_id)
-        # Create API services for Tag and TagAssociation backends
+        tags_found = self.find_tags(stub_config, tags)
+        self.attach_tags(stub_config, vm, tags_found)
+
+    def find_tags(self, stub_config, tags):
+        """Searches for tag objects by their names. Tags can be provided as list or comma separated string."""
         tag_svc = Tag(stub_config)
-        tag_asoc = TagAssociation(stub_config)
-        # Search for tag object(s)
-        tags_found = []
-        if ',' in tags:
+        if not isinstance(tags, list):
             tags = tags.split(',')
-        else:
-            tags = [tags]
 
+        tags_found = []
         for t in tag_svc.list():
             tag = tag_svc.get(t)
             if tag.name in tags:
@@ -66,6 +63,15 @@ class TagCommands(BaseCommands):
 
         if len(tags_found) != len(tags):
             raise VmCLIException('One or more tags were not found')
+        return tags_found
+
+    def attach_tags(self, stub_config, name, tags_found):
+        """Attaches already found tag objects to the VM."""
+        vm = self.get_vm_obj(name, fail_missing=True)
+        # Get vmware ID representation in form 'vm-XXX' for later association
+        vm_id = vm._GetMoId()
+        vm_dynid = DynamicID(type='VirtualMachine', id=vm_id)
+        tag_asoc = TagAssociation(stub_config)
 
         # Asosociate tags with VM
         for tag in tags_found:
@@ -0,0 +1,111 @@
+from pyVmomi import vim
+
+from lib.modules import BaseCommands
+from lib.tools.argparser import args
+from lib.tools.collector import retrieve_properties
+from lib.tools.replicas import replica_name, replica_marker, get_replicas
+from lib.exceptions import VmCLIException
+
+
+class TemplateCommands(BaseCommands):
+    """keep replicas of a template on more datastores, clones then use replica local to their datastore."""
+
+    def __init__(self, *args, **kwargs):
+        super(TemplateCommands, self).__init__(*args, **kwargs)
+
+    @args('operation', help='what operation to execute', choices=['sync', 'status'])
+    @args('--template', '--tem', help='template to replicate', map='VM_TEMPLATE')
+    @args('--datastores', help='comma separated datastores, which should hold replica of the template',
+          type=lambda value: [ds.strip() for ds in value.split(',') if ds.strip()], map='TEMPLATE_DATASTORES')
+    @args('--prune', help='destroy replicas on datastores not listed in --datastores', action='store_true')
+    def execute(self, args):
+        try:
+            if not args.template:
+                raise VmCLIException('Argument --template is required!')
+            template = self.get_obj('vm', args.template)
+            if not template:
+                raise VmCLIException('Specified template does not exists. Exiting...')
+
+            if args.operation == 'sync':
+                if not args.datastores:
+                    raise VmCLIException('Argument --datastores is required with "sync" operation!')
+                self.sync_replicas(template, args.datastores, args.prune)
+            elif args.operation == 'status':
+                self.show_status(template)
+        except VmCLIException as e:
+            self.exit(e.message, errno=6)
+
+    def get_template_state(self, template):
+        """Returns name, replica marker, folder and datastores of the template with single retrieval."""
+        props = next((props for _, props in retrieve_properties(
+                self.content, vim.VirtualMachine, ['name', 'config.modified', 'parent', 'datastore'],
+                objects=[template])), {})
+        marker = replica_marker(props.get('name'), props.get('config.modified'))
+        return props.get('name'), marker, props.get('parent'), [ds.name for ds in props.get('datastore') or []]
+
+    def show_status(self, template):
+        name, marker, _, _ = self.get_template_state(template)
+        for datastore, replica in sorted(get_replicas(self.content, name).items()):
+            state = 'in sync' if replica.get('config.annotation') == marker else 'out of sync'
+            print('{} {} {}'.format(datastore, replica['name'], state))
+
+    def get_datastore_host(self, datastore):
+        """Returns host, which has the datastore mounted and accessible, replica is registered there."""
+        for mount in datastore.host:
+            if mount.mountInfo.accessible and mount.mountInfo.mounted is not False:
+                return mount.key
+        raise VmCLIException('Datastore {} is not accessible from any host!'.format(datastore.name))
+
+    def sync_replicas(self, template, datastores, prune=False):
+        """Copies template to every datastore, where its replica is missing or out of sync. Outdated replica
+        is replaced only after its new copy is ready, so clones can use it during sync. All copies run
+        concurrently."""
+        name, marker, folder, template_datastores = self.get_template_state(template)
+        replicas = get_replicas(self.content, name)
+
+        tasks, outdated = [], []
+        for ds_name in datastores:
+            if ds_name in template_datastores:
+                self.logger.info('Template itself is placed on datastore {}, no replica needed'.format(ds_name))
+                continue
+            replica = replicas.get(ds_name)
+            if replica and replica.get('config.annotation') == marker:
+                self.logger.info('Replica {} is in sync'.format(replica['name']))
+                continue
+
+            datastore = self.get_obj('datastore', ds_name)
+            if not datastore:
+                raise VmCLIException('Unable to find datastore {}!'.format(ds_name))
+            new_name = replica_name(name, ds_name)
+            if replica:
+                # copy is created under temporary name and renamed once the outdated replica is destroyed
+                new_name = '{}-sync'.format(new_name)
+                leftover = replicas.get('{}-sync'.format(ds_name))
+                if leftover:
+                    self.wait_for_tasks([self.submit_task(leftover['obj'], 'Destroy_Task')])
+
+            self.logger.info('Copying template {} to datastore {}...'.format(name, ds_name))
+            relocspec = vim.vm.RelocateSpec(datastore=datastore, host=self.get_datastore_host(datastore))
+            clonespec = vim.vm.CloneSpec(location=relocspec, template=True, powerOn=False,
+                                         config=vim.vm.ConfigSpec(annotation=marker))
+            task = self.submit_task(template, 'Clone', folder=folder, name=new_name, spec=clonespec)
+            tasks.append(task)
+            if replica:
+                outdated.append((replica, task))
+
+        if tasks:
+            self.wait_for_tasks(tasks)
+        for replica, task in outdated:
+            self.wait_for_tasks([self.submit_task(replica['obj'], 'Destroy_Task')])
+            self.wait_for_tasks([self.submit_task(task.info.result, 'Rename_Task', newName=replica['name'])])
+
+        if prune:
+            obsolete = [replica['obj'] for ds_name, replica in replicas.items()
+                        if ds_name not in datastores and not ds_name.endswith('-sync')]
+            if obsolete:
+                self.logger.info('Destroying {} replicas on unlisted datastores...'.format(len(obsolete)))
+                self.wait_for_tasks([self.submit_task(replica, 'Destroy_Task') for replica in obsolete])
+        self.logger.info('Template {} copied to {} datastores'.format(name, len(tasks)))
+
+
+BaseCommands.register('template', TemplateCommands)
@@ -0,0 +1,52 @@
+from pyVmomi import vim, vmodl
+
+from lib.tools.views import get_view
+
+
+def _object_specs(root, objects):
+    """Prepares object specifications pointing property collector either to the explicit list of objects or
+    to every object present in provided container view."""
+    if objects is not None:
+        return [vmodl.query.PropertyCollector.ObjectSpec(obj=obj) for obj in objects]
+
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+            name='traverseEntities', path='view', skip=False, type=vim.view.ContainerView)
+    return [vmodl.query.PropertyCollector.ObjectSpec(obj=root, skip=True, selectSet=[traversal_spec])]
+
+
+def collect_properties(content, type_paths, root=None, objects=None, page_size=None):
+    """Retrieves requested properties of many objects with one bulk call to the property collector instead of
+    touching every object separately. type_paths maps vim types to lists of property paths. Results are yielded
+    as (object, {path: value}) tuples page by page, so memory stays bounded with huge inventories."""
+    view = None
+    if objects is None:
+        view = get_view(content, list(type_paths), root)
+
+    collector = content.propertyCollector
+    token = None
+    try:
+        prop_specs = [vmodl.query.PropertyCollector.PropertySpec(type=vimtype, pathSet=list(paths), all=False)
+                      for vimtype, paths in type_paths.items()]
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=_object_specs(view, objects), propSet=prop_specs)
+        options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+
+        result = collector.RetrievePropertiesEx(specSet=[filter_spec], options=options)
+        while result:
+            token = result.token
+            for obj_content in result.objects:
+                yield obj_content.obj, dict((prop.name, prop.val) for prop in obj_content.propSet)
+
+            if not token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(token=token)
+            token = None
+    finally:
+        # Free server side resources, when caller stopped reading before the last page
+        if token:
+            collector.CancelRetrievePropertiesEx(token=token)
+
+
+def retrieve_properties(content, vimtype, path_set, root=None, objects=None, page_size=None):
+    """Shortcut for collect_properties retrieving properties of a single object type."""
+    return collect_properties(content, {vimtype: path_set}, root=root, objects=objects, page_size=page_size)
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from lib.tools.logger import logger
+from lib.exceptions import VmCLIException
+
+
+class StepGraph(object):
+    """Runs steps with declared dependencies. Step is started as soon as all steps it requires have finished,
+    so independent branches of the graph run concurrently. Value returned by each step is stored in results
+    under the step name. First failure stops scheduling of new steps and is re-raised once running steps end."""
+
+    def __init__(self):
+        self.steps = OrderedDict()
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, func, requires=()):
+        """Adds step into graph. Required steps must be added before the step itself, which rules out cycles."""
+        missing = [req for req in requires if req not in self.steps]
+        if missing:
+            raise VmCLIException('Step {} requires unknown steps: {}'.format(name, ', '.join(missing)))
+        self.steps[name] = (func, tuple(requires))
+
+    def _run_step(self, name, func):
+        logger.debug('Step {} started'.format(name))
+        result = func()
+        with self.lock:
+            self.results[name] = result
+        logger.debug('Step {} finished'.format(name))
+        return result
+
+    def run(self):
+        """Executes whole graph and returns dictionary of step results."""
+        pending = OrderedDict(self.steps)
+        running = {}
+        done = set()
+        error = None
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self.steps)))
+        try:
+            while pending or running:
+                if not error:
+                    for name, (func, requires) in list(pending.items()):
+                        if all(req in done for req in requires):
+                            running[executor.submit(self._run_step, name, func)] = name
+                            del pending[name]
+
+                if not running:
+                    break
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        logger.debug('Step {} failed'.format(name))
+                    else:
+                        done.add(name)
+        finally:
+            executor.shutdown(wait=True)
+
+        if error:
+            raise error
+        return self.results
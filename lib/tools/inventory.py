@@ -0,0 +1,228 @@
+import os
+import time
+import sqlite3
+import threading
+from pyVmomi import vim, vmodl, VmomiSupport
+
+from lib import config as conf
+from lib.connector import login
+from lib.constants import VMWARE_TYPES
+from lib.tools.logger import logger
+from lib.tools.retry import describe
+from lib.tools.state import state_path
+from lib.exceptions import VmCLIException
+
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS objects (moid TEXT PRIMARY KEY, type TEXT NOT NULL, name TEXT, parent TEXT)',
+    'CREATE INDEX IF NOT EXISTS objects_name ON objects (name)',
+    'CREATE TABLE IF NOT EXISTS kinds (kind TEXT NOT NULL, moid TEXT NOT NULL, PRIMARY KEY (kind, moid))',
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+]
+
+
+class InventoryMirror(object):
+    """Local SQLite mirror of names and parents of inventory objects of all types listed in VMWARE_TYPES.
+    After the first full load the mirror is kept current with WaitForUpdatesEx. Property collector, its filter
+    and vCenter session it belongs to outlive vmcli process, their identifiers are stored in the mirror together
+    with the version token, so every following run pulls only changes made since the previous one. When the
+    session expires, mirror is loaded from scratch again.
+
+    Stored session id is a credential, anyone able to read it can take over the session, so the mirror file
+    is readable only by its owner."""
+
+    def __init__(self, vcenter, path=None):
+        self.vcenter = vcenter
+        self.path = path or state_path('inventory', '{}.sqlite'.format(vcenter))
+        # SQLite creates its journal files with permissions of the database file
+        os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(self.path, 0o600)
+        # connection is shared by threads of the program, lock serializes its use and keeps syncs from overlapping
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.RLock()
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.collector = None
+        self.last_sync = 0
+
+    def _meta(self, key):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def _attach(self):
+        """Reuses session and property collector stored in the mirror. Returns False when they are gone."""
+        session_id, collector_id = self._meta('session'), self._meta('collector')
+        if not (session_id and collector_id and self._meta('version')):
+            return False
+        try:
+            connection = login(self.vcenter, None, None, conf.INSECURE_CONNECTION, session_id=session_id,
+                               keep_session=True)
+            if not connection.RetrieveContent().sessionManager.currentSession:
+                return False
+            self.collector = vmodl.query.PropertyCollector(collector_id, connection._stub)
+            return True
+        except (VmCLIException, vmodl.MethodFault):
+            return False
+
+    def _release(self):
+        """Logs out session stored in the mirror, if it is still alive. Its property collector and container view
+        are destroyed together with it, so reloads do not leave orphaned sessions on vCenter."""
+        session_id = self._meta('session')
+        if not session_id:
+            return
+        try:
+            connection = login(self.vcenter, None, None, conf.INSECURE_CONNECTION, session_id=session_id,
+                               keep_session=True)
+            session_manager = connection.RetrieveContent().sessionManager
+            if session_manager.currentSession:
+                session_manager.Logout()
+        except (VmCLIException, vmodl.MethodFault) as e:
+            logger.debug('Unable to log out previous inventory mirror session: {}'.format(e))
+
+    def _create(self):
+        """Logs in new long lived session and creates property collector with filter over whole inventory.
+        Previous session of the mirror is logged out first."""
+        self._release()
+        self._set_meta('session', None)
+        connection = login(self.vcenter, conf.USERNAME, conf.PASSWORD, conf.INSECURE_CONNECTION, keep_session=True)
+        content = connection.RetrieveContent()
+        types = list(VMWARE_TYPES.values())
+        try:
+            view = content.viewManager.CreateContainerView(content.rootFolder, types, True)
+            traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+                    name='traverseEntities', path='view', skip=False, type=vim.view.ContainerView)
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                    objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True,
+                                                                        selectSet=[traversal_spec])],
+                    propSet=[vmodl.query.PropertyCollector.PropertySpec(type=t, pathSet=['name', 'parent'])
+                             for t in types])
+
+            self.collector = content.propertyCollector.CreatePropertyCollector()
+            self.collector.CreateFilter(filter_spec, True)
+        except Exception:
+            # session is not stored anywhere yet, nothing else could log it out
+            content.sessionManager.Logout()
+            raise
+
+        self.db.execute('DELETE FROM objects')
+        self.db.execute('DELETE FROM kinds')
+        self._set_meta('session', connection._stub.GetSessionId())
+        self._set_meta('collector', self.collector._GetMoId())
+        self._set_meta('version', '')
+
+    def _apply(self, update):
+        """Stores changes of one WaitForUpdatesEx result."""
+        for filter_set in update.filterSet:
+            for obj_set in filter_set.objectSet:
+                obj, moid = obj_set.obj, obj_set.obj._GetMoId()
+                if obj_set.kind == 'leave':
+                    self.db.execute('DELETE FROM objects WHERE moid = ?', (moid,))
+                    self.db.execute('DELETE FROM kinds WHERE moid = ?', (moid,))
+                    continue
+
+                changes = dict((change.name, change.val) for change in obj_set.changeSet)
+                if obj_set.kind == 'enter':
+                    self.db.execute('INSERT OR REPLACE INTO objects (moid, type) VALUES (?, ?)',
+                                    (moid, type(obj).__name__))
+                    self.db.executemany('INSERT OR IGNORE INTO kinds (kind, moid) VALUES (?, ?)',
+                                        [(kind, moid) for kind, t in VMWARE_TYPES.items() if isinstance(obj, t)])
+                if 'name' in changes:
+                    self.db.execute('UPDATE objects SET name = ? WHERE moid = ?', (changes['name'], moid))
+                if 'parent' in changes:
+                    parent = changes['parent']._GetMoId() if changes['parent'] is not None else None
+                    self.db.execute('UPDATE objects SET parent = ? WHERE moid = ?', (parent, moid))
+
+    def sync(self, reload=True):
+        """Pulls changes made since the last sync. Full load is performed on the first run or when stored
+        session or collector are no longer valid, it is attempted only once unless reload is set."""
+        with self.lock:
+            return self._sync(reload)
+
+    def _sync(self, reload):
+        started = time.time()
+        if self.collector is None and not self._attach():
+            logger.info('Loading inventory mirror of {}...'.format(self.vcenter))
+            self._create()
+
+        version = self._meta('version')
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0)
+        try:
+            update = self.collector.WaitForUpdatesEx(version, options)
+            # large changes are returned in several truncated parts
+            while update:
+                self._apply(update)
+                version = update.version
+                if not update.truncated:
+                    break
+                update = self.collector.WaitForUpdatesEx(version, options)
+        except (vmodl.fault.ManagedObjectNotFound, vmodl.fault.InvalidArgument, vim.fault.NotAuthenticated,
+                vmodl.query.InvalidCollectorVersion) as e:
+            self.db.rollback()
+            self.collector = None
+            self._set_meta('collector', None)
+            self.db.commit()
+            if not reload:
+                raise VmCLIException('Unable to sync inventory mirror of {}: {}'.format(self.vcenter, describe(e)))
+            logger.debug('Inventory mirror session expired, reloading...')
+            return self._sync(reload=False)
+
+        self._set_meta('version', version)
+        self.db.commit()
+        self.last_sync = time.time()
+        logger.debug('Inventory mirror synced in {:.3f}s'.format(self.last_sync - started))
+
+    def ensure_fresh(self):
+        """Syncs mirror if it was not synced within configured interval, interval 0 syncs it once per run.
+        Returns True if sync took place."""
+        with self.lock:
+            if not self.last_sync or (conf.INVENTORY_SYNC_INTERVAL and
+                                      time.time() - self.last_sync > conf.INVENTORY_SYNC_INTERVAL):
+                self.sync()
+                return True
+            return False
+
+    def lookup(self, kind, name=None, default=False):
+        """Returns (moid, type name) of object of the kind with provided name. With default, object with
+        alphabetically first name is returned when name does not match."""
+        with self.lock:
+            query = 'SELECT o.moid, o.type FROM objects o JOIN kinds k ON k.moid = o.moid WHERE k.kind = ?'
+            row = None
+            if name is not None:
+                row = self.db.execute(query + ' AND o.name = ? LIMIT 1', (kind, name)).fetchone()
+            if row is None and default:
+                row = self.db.execute(query + ' ORDER BY o.name LIMIT 1', (kind,)).fetchone()
+            return row
+
+    def names(self, kind):
+        """Returns sorted names of all objects of the kind."""
+        with self.lock:
+            query = 'SELECT o.name FROM objects o JOIN kinds k ON k.moid = o.moid WHERE k.kind = ? ORDER BY o.name'
+            return [row[0] for row in self.db.execute(query, (kind,))]
+
+    def forget(self, moids):
+        """Removes objects deleted by vmcli itself, so they are not found before the next sync."""
+        with self.lock:
+            self.db.executemany('DELETE FROM objects WHERE moid = ?', [(moid,) for moid in moids])
+            self.db.executemany('DELETE FROM kinds WHERE moid = ?', [(moid,) for moid in moids])
+            self.db.commit()
+
+    @staticmethod
+    def to_object(row, stub):
+        """Converts row returned by lookup into managed object bound to provided stub."""
+        return VmomiSupport.GetVmodlType(row[1])(row[0], stub)
+
+
+# Mirrors are opened once per vCenter within single run
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_inventory_mirror(vcenter):
+    """Returns inventory mirror of the vCenter shared across the program."""
+    with _mirrors_lock:
+        if vcenter not in _mirrors:
+            _mirrors[vcenter] = InventoryMirror(vcenter)
+        return _mirrors[vcenter]
@@ -0,0 +1,208 @@
+import os
+import netaddr
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.tools.logger import logger
+from lib.tools.collector import retrieve_properties
+from lib.tools.state import state_path, locked, load_json, save_json
+from lib.exceptions import VmCLIException
+
+
+BITMAP_MAGIC = b'vmcli-ipam'
+
+
+def gateway_of(subnet):
+    """Returns conventional gateway of the subnet, i.e. its first host address. Computed arithmetically, the
+    subnet is never expanded into list of its addresses."""
+    return netaddr.IPAddress(subnet.first + 1, subnet.version)
+
+
+def broadcast_of(subnet):
+    """Returns broadcast address of the subnet, the last address within it."""
+    return netaddr.IPAddress(subnet.last, subnet.version)
+
+
+class Bitmap(object):
+    """Fixed size set of allocated offsets, one bit per address of the pool."""
+
+    def __init__(self, size, data=None):
+        self.size = size
+        self.data = bytearray(data or b'\0' * ((size + 7) // 8))
+
+    def __contains__(self, offset):
+        return bool(self.data[offset >> 3] & (1 << (offset & 7)))
+
+    def set(self, offset):
+        self.data[offset >> 3] |= 1 << (offset & 7)
+
+    def clear(self, offset):
+        self.data[offset >> 3] &= ~(1 << (offset & 7)) & 0xff
+
+    def count(self):
+        return sum(bin(byte).count('1') for byte in self.data)
+
+    def free(self, skip=()):
+        """Yields free offsets in ascending order, offsets in skip are considered allocated as well."""
+        for index, byte in enumerate(self.data):
+            # fully allocated bytes are skipped without looking at their bits
+            if byte == 0xff:
+                continue
+            for bit in range(8):
+                offset = (index << 3) + bit
+                if offset >= self.size:
+                    return
+                if not byte & (1 << bit) and offset not in skip:
+                    yield offset
+
+
+class AddressPool(object):
+    """Pool of addresses assigned to vms attached to the network. Pools are configured in ipam section:
+
+        pools:
+          dvPortGroup10:
+            cidr: 10.1.10.0/24
+            range: 10.1.10.10-10.1.10.250   # optional, whole subnet without gateway and broadcast by default
+            gateway: 10.1.10.1              # optional, first address of the subnet by default
+            exclude: [10.1.10.100]          # optional addresses never handed out
+
+    Allocated addresses are kept in a bitmap state file, addresses are leased to vm names, so allocating address
+    for the same name again returns its existing lease. All changes are done under exclusive lock of the pool."""
+
+    def __init__(self, network, cidr, address_range=None, gateway=None, exclude=None):
+        self.network = network
+        try:
+            self.subnet = netaddr.IPNetwork(cidr)
+            if address_range:
+                first, last = [netaddr.IPAddress(address.strip()) for address in address_range.split('-')]
+                self.first, self.last = int(first), int(last)
+            else:
+                self.first, self.last = self.subnet.first + 2, self.subnet.last - 1
+            self.gateway = netaddr.IPAddress(gateway) if gateway else gateway_of(self.subnet)
+            self.exclude = set(int(netaddr.IPAddress(address)) for address in exclude or [])
+        except (netaddr.core.AddrFormatError, ValueError) as e:
+            raise VmCLIException('Invalid address pool of network {}: {}'.format(network, e))
+
+        if not (self.subnet.first <= self.first <= self.last <= self.subnet.last):
+            raise VmCLIException('Range of address pool {} is not within {}!'.format(network, self.subnet))
+        self.exclude.add(int(self.gateway))
+        self.size = self.last - self.first + 1
+
+        file_name = network.replace(os.sep, '_')
+        self.bitmap_path = state_path('ipam', '{}.bitmap'.format(file_name))
+        self.leases_path = state_path('ipam', '{}.json'.format(file_name))
+
+    @classmethod
+    def from_config(cls, network):
+        """Returns pool of the network configured in ipam section."""
+        settings = (conf.IPAM_POOLS or {}).get(network)
+        if not settings or 'cidr' not in settings:
+            raise VmCLIException('No address pool configured for network {}!'.format(network))
+        return cls(network, settings['cidr'], settings.get('range'), settings.get('gateway'),
+                   settings.get('exclude'))
+
+    def header(self):
+        return BITMAP_MAGIC + ' {} {}\n'.format(self.first, self.last).encode('ascii')
+
+    def load(self):
+        """Returns bitmap and leases stored in state files. Bitmap of differently configured range is discarded."""
+        bitmap = Bitmap(self.size)
+        leases = load_json(self.leases_path, default={})
+        try:
+            with open(self.bitmap_path, 'rb') as bitmap_file:
+                header = bitmap_file.readline()
+                if header == self.header():
+                    bitmap = Bitmap(self.size, bitmap_file.read())
+                else:
+                    logger.warning('Range of address pool {} changed, allocations are reset'.format(self.network))
+                    leases = {}
+        except (IOError, OSError):
+            pass
+        return bitmap, leases
+
+    def save(self, bitmap, leases):
+        """Atomically replaces state files of the pool."""
+        tmp_path = '{}.{}'.format(self.bitmap_path, os.getpid())
+        with open(tmp_path, 'wb') as bitmap_file:
+            bitmap_file.write(self.header())
+            bitmap_file.write(bytes(bitmap.data))
+        os.rename(tmp_path, self.bitmap_path)
+        save_json(self.leases_path, leases)
+
+    def interface(self, address):
+        """Returns address together with prefix of the subnet."""
+        return netaddr.IPNetwork('{}/{}'.format(address, self.subnet.prefixlen))
+
+    def allocate(self, names, in_use=()):
+        """Leases address to every name and returns dictionary of name: IPNetwork. Addresses are allocated
+        all at once, when the pool cannot satisfy all names, none of them is allocated. in_use are integer
+        addresses found on running vms, which are skipped even though the pool did not hand them out."""
+        with locked(self.bitmap_path):
+            bitmap, leases = self.load()
+            # addresses in use or excluded are skipped, they are not recorded as allocated
+            skip = set(address - self.first for address in set(in_use) | self.exclude
+                       if self.first <= address <= self.last)
+            missing = [name for name in names if name not in leases]
+            offsets = []
+            for offset in bitmap.free(skip):
+                if len(offsets) == len(missing):
+                    break
+                offsets.append(offset)
+            if len(offsets) < len(missing):
+                raise VmCLIException('Address pool {} has only {} free addresses, {} requested!'.format(
+                        self.network, len(offsets), len(missing)))
+
+            for name, offset in zip(missing, offsets):
+                bitmap.set(offset)
+                leases[name] = str(netaddr.IPAddress(self.first + offset, self.subnet.version))
+            if missing:
+                self.save(bitmap, leases)
+                logger.info('Allocated {} addresses from pool {}'.format(len(missing), self.network))
+        return dict((name, self.interface(leases[name])) for name in names)
+
+    def release(self, names):
+        """Returns addresses leased to names into the pool, returns list of released addresses."""
+        released = []
+        with locked(self.bitmap_path):
+            bitmap, leases = self.load()
+            for name in names:
+                address = leases.pop(name, None)
+                if address is None:
+                    continue
+                offset = int(netaddr.IPAddress(address)) - self.first
+                if 0 <= offset < self.size:
+                    bitmap.clear(offset)
+                released.append(address)
+            if released:
+                self.save(bitmap, leases)
+        return released
+
+    def status(self, in_use=()):
+        """Returns dictionary with usage of the pool."""
+        bitmap, leases = self.load()
+        foreign = set(address for address in in_use if self.first <= address <= self.last and
+                      address - self.first not in bitmap)
+        return {
+            'network': self.network,
+            'subnet': str(self.subnet),
+            'range': '{}-{}'.format(netaddr.IPAddress(self.first), netaddr.IPAddress(self.last)),
+            'gateway': str(self.gateway),
+            'size': self.size,
+            'allocated': bitmap.count(),
+            'in_use_elsewhere': len(foreign - self.exclude),
+            'leases': leases,
+        }
+
+
+def scan_addresses(content):
+    """Returns set of integer addresses reported by vmtools of all vms, retrieved with single bulk call."""
+    addresses = set()
+    for vm, props in retrieve_properties(content, vim.VirtualMachine, ['guest.net']):
+        for nic in props.get('guest.net') or []:
+            for address in nic.ipAddress or []:
+                try:
+                    addresses.add(int(netaddr.IPAddress(address.split('%')[0])))
+                except (netaddr.core.AddrFormatError, ValueError):
+                    continue
+    logger.debug('Found {} addresses in use by vms'.format(len(addresses)))
+    return addresses
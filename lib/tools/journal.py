@@ -0,0 +1,50 @@
+import os
+import json
+import time
+import threading
+
+from lib.tools.logger import logger
+from lib.tools.state import state_path, load_json, save_json
+
+
+class Journal(object):
+    """Persists completed steps of a multi-step operation together with inputs they were run with. When the
+    operation is resumed, steps recorded with the same inputs can be skipped. Journal is removed once the
+    whole operation finishes successfully."""
+
+    def __init__(self, operation, name, resume=False):
+        file_name = '{}-{}.json'.format(operation, name.replace(os.sep, '_'))
+        self.path = state_path('journal', file_name)
+        self.steps = {}
+        if resume:
+            self.steps = load_json(self.path, default={}).get('steps', {})
+            if self.steps:
+                logger.info('Resuming from journal {}, completed steps: {}'.format(
+                        self.path, ', '.join(sorted(self.steps))))
+            else:
+                logger.warning('No journal found for {}, running all steps'.format(name))
+        self.header = {'operation': operation, 'name': name}
+        # steps may be recorded concurrently from multiple threads
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(inputs):
+        """Converts inputs into their JSON representation, so they compare equal to previously stored ones."""
+        return json.loads(json.dumps(inputs, sort_keys=True, default=str))
+
+    def completed(self, step, inputs):
+        """Checks whether the step was recorded as completed with the same inputs."""
+        record = self.steps.get(step)
+        return bool(record) and record.get('inputs') == self._normalize(inputs)
+
+    def record(self, step, inputs):
+        """Marks step as completed and writes journal to the state file."""
+        with self.lock:
+            self.steps[step] = {'inputs': self._normalize(inputs), 'finished': time.time()}
+            save_json(self.path, dict(self.header, steps=self.steps))
+
+    def finish(self):
+        """Removes journal after successful run."""
+        self.steps = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,106 @@
+import time
+
+from lib import config as conf
+from lib.tools.logger import logger
+from lib.tools.state import state_path, locked, load_json, save_json
+from lib.exceptions import VmCLIException
+
+try:
+    # Content Library is available only through vsphere-automation-sdk-python
+    from com.vmware.content_client import Library
+    from com.vmware.content.library_client import Item, SubscribedItem
+    HAS_AUTOMAT_SDK_INSTALLED = True
+except ImportError:
+    HAS_AUTOMAT_SDK_INSTALLED = False
+
+
+class LibraryIndex(object):
+    """Maps names of content libraries and their items to ids. Resolving a name through vAPI takes a list call
+    and a get call per library or item, so the whole index is kept in state directory and rebuilt only when
+    it is older than conf.LIBRARY_CACHE_TTL seconds or when a name is not found in it.
+
+    Items are keyed by library/item, every item records its type and whether its content is cached locally,
+    which is false for items of subscribed libraries synced on demand."""
+
+    def __init__(self, stub_config, vcenter=None):
+        if not HAS_AUTOMAT_SDK_INSTALLED:
+            raise VmCLIException('Required vsphere-automation-sdk-python not installed. Exiting...')
+        self.stub_config = stub_config
+        self.path = state_path('library', '{}.json'.format(vcenter or conf.VCENTER))
+        self.index = load_json(self.path, default={})
+
+    def stale(self):
+        return time.time() - self.index.get('updated', 0) > conf.LIBRARY_CACHE_TTL
+
+    def refresh(self):
+        """Rebuilds the index from vCenter."""
+        library_svc, item_svc = Library(self.stub_config), Item(self.stub_config)
+        libraries, items = {}, {}
+        for library_id in library_svc.list():
+            library = library_svc.get(library_id)
+            libraries[library.name] = {'id': library_id, 'type': str(library.type)}
+            for item_id in item_svc.list(library_id):
+                item = item_svc.get(item_id)
+                items['{}/{}'.format(library.name, item.name)] = {
+                    'id': item_id, 'type': item.type, 'cached': bool(item.cached), 'library': library.name}
+
+        self.index = {'updated': time.time(), 'libraries': libraries, 'items': items}
+        with locked(self.path):
+            save_json(self.path, self.index)
+        logger.debug('Content library index rebuilt with {} libraries and {} items'.format(
+                len(libraries), len(items)))
+
+    def _find(self, name):
+        items = self.index.get('items', {})
+        if '/' in name:
+            return items.get(name)
+        # item name without library is accepted, when it is unique across libraries
+        found = [item for key, item in items.items() if key.split('/', 1)[1] == name]
+        if len(found) > 1:
+            raise VmCLIException('Item {} exists in more libraries, use library/item form!'.format(name))
+        return found[0] if found else None
+
+    def item(self, name):
+        """Returns item of library/item (or just item) name, index is rebuilt once when name is unknown."""
+        item = None if self.stale() else self._find(name)
+        if item is None:
+            self.refresh()
+            item = self._find(name)
+        if item is None:
+            raise VmCLIException('Content library item {} not found!'.format(name))
+        return item
+
+    def library(self, name):
+        library = None if self.stale() else self.index.get('libraries', {}).get(name)
+        if library is None:
+            self.refresh()
+            library = self.index.get('libraries', {}).get(name)
+        if library is None:
+            raise VmCLIException('Content library {} not found!'.format(name))
+        return library
+
+    def items(self, library=None):
+        """Returns dictionary of library/item: item, optionally only items of one library."""
+        if self.stale():
+            self.refresh()
+        return dict((key, item) for key, item in self.index.get('items', {}).items()
+                    if library is None or item['library'] == library)
+
+    def mark_cached(self, item):
+        item['cached'] = True
+        with locked(self.path):
+            save_json(self.path, self.index)
+
+
+def sync_item(stub_config, item, timeout=None):
+    """Downloads content of subscribed library item and waits until it is cached locally."""
+    if item.get('cached'):
+        return
+    item_svc = Item(stub_config)
+    SubscribedItem(stub_config).sync(item['id'], True)
+    deadline = time.time() + (timeout or conf.LIBRARY_SYNC_TIMEOUT)
+    while not item_svc.get(item['id']).cached:
+        if time.time() > deadline:
+            raise VmCLIException('Content of library item {} was not synced in time!'.format(item['id']))
+        time.sleep(5)
+    item['cached'] = True
@@ -0,0 +1,134 @@
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from pyVmomi import vim, vmodl
+
+from lib import config as conf
+from lib.tools.logger import logger
+from lib.exceptions import VmCLIException
+
+
+def session_cookie(stub):
+    """Returns cookie of vCenter session, which authorizes transfers to and from NFC lease urls."""
+    name, _, value = stub.cookie.split(';')[0].partition('=')
+    return {name.strip(): value.strip()}
+
+
+def http_session(stub, workers, verify=True):
+    """Returns requests session authorized with vCenter session cookie. Its connection pool is as large as
+    the number of concurrent transfers, so connections to ESXi hosts are reused between chunks and disks."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.cookies.update(session_cookie(stub))
+    session.verify = verify
+    return session
+
+
+def wait_for_lease(lease, timeout=300):
+    """Waits until the lease is ready for transfers, error of the lease is raised."""
+    deadline = time.time() + timeout
+    while True:
+        state = lease.state
+        if state == vim.HttpNfcLease.State.ready:
+            return lease.info
+        if state == vim.HttpNfcLease.State.error:
+            raise VmCLIException('NFC lease failed: {}'.format(lease.error.msg))
+        if state == vim.HttpNfcLease.State.done or time.time() > deadline:
+            raise VmCLIException('NFC lease is not ready (state {})!'.format(state))
+        time.sleep(1)
+
+
+def device_url(url, host):
+    """ESXi returns urls with * in place of host, they are reachable through vCenter's address."""
+    return url.replace('*', host)
+
+
+class LeaseKeeper(object):
+    """Keeps NFC lease alive while disks are transferred. Lease times out after few minutes without progress
+    reports, so transferred bytes are reported to vCenter and logged every interval seconds from background
+    thread. Lease is completed when transfers succeed and aborted when they fail."""
+
+    def __init__(self, lease, total, interval=None):
+        self.lease = lease
+        self.total = max(1, total)
+        self.interval = interval or conf.OVF_PROGRESS_INTERVAL
+        self.transferred = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def add(self, size):
+        with self.lock:
+            self.transferred += size
+
+    def percent(self):
+        return min(99, int(self.transferred * 100 / self.total))
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            percent = self.percent()
+            speed = self.transferred / max(1, time.time() - self.started) / 1024 / 1024
+            logger.info('Transferred {} MB ({}%, {:.1f} MB/s)'.format(
+                    self.transferred // 1024 // 1024, percent, speed))
+            try:
+                self.lease.HttpNfcLeaseProgress(percent)
+            except (vmodl.MethodFault, requests.exceptions.RequestException) as e:
+                logger.warning('Unable to report progress of NFC lease: {}'.format(e))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+        if exc_type is None:
+            self.lease.HttpNfcLeaseProgress(100)
+            self.lease.HttpNfcLeaseComplete()
+            logger.info('Transferred {} MB in {:.0f}s'.format(
+                    self.transferred // 1024 // 1024, time.time() - self.started))
+        else:
+            fault = vmodl.fault.SystemError(reason=str(exc_value))
+            try:
+                self.lease.HttpNfcLeaseAbort(fault)
+            except vmodl.MethodFault as e:
+                logger.debug('Unable to abort NFC lease: {}'.format(e))
+        return False
+
+
+class ChunkReader(object):
+    """Iterates over size bytes of the stream in chunks, transferred bytes are reported to the lease keeper.
+    Length is known upfront, so requests sends the body with Content-Length instead of chunked encoding."""
+
+    def __init__(self, stream, size, keeper, chunk_size=None):
+        self.stream = stream
+        self.size = size
+        self.keeper = keeper
+        self.chunk_size = chunk_size or conf.OVF_CHUNK_SIZE
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        remaining = self.size
+        while remaining > 0:
+            chunk = self.stream.read(min(self.chunk_size, remaining))
+            if not chunk:
+                raise VmCLIException('Unexpected end of file, {} bytes missing!'.format(remaining))
+            remaining -= len(chunk)
+            self.keeper.add(len(chunk))
+            yield chunk
+
+
+def transfer_all(transfers, workers):
+    """Runs transfer callables concurrently, the first failure is raised once all of them stopped."""
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(transfers)))) as executor:
+        futures = [executor.submit(transfer) for transfer in transfers]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        raise errors[0]
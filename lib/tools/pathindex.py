@@ -0,0 +1,99 @@
+import bisect
+import threading
+from pyVmomi import vim
+
+from lib.tools.collector import collect_properties
+from lib.tools.logger import logger
+
+
+# Containers forming inventory paths of folders and resource pools, vApps are resource pools as well
+INDEXED_TYPES = [vim.Folder, vim.Datacenter, vim.ComputeResource, vim.ResourcePool]
+
+
+class PathIndex(object):
+    """Maps full inventory paths of folders, datacenters, clusters and resource pools to their objects, e.g.
+    dc1/vm/team/prod or dc1/host/cl01/Resources/web. Paths use the same format as FindByInventoryPath, root
+    folder is not part of them. Whole index is built with single bulk retrieval of names and parents."""
+
+    def __init__(self, content):
+        self.content = content
+        self.paths = {}
+        self.objects = {}
+        self.build()
+
+    def build(self):
+        """Retrieves names and parents of all indexed objects and computes their paths."""
+        entries = {}
+        for obj, props in collect_properties(self.content, dict((t, ['name', 'parent']) for t in INDEXED_TYPES)):
+            entries[obj._GetMoId()] = (obj, props.get('name'), props.get('parent'))
+
+        paths = {}
+
+        def path_of(moid):
+            if moid not in paths:
+                obj, name, parent = entries[moid]
+                # root folder has no parent and it is not part of inventory paths
+                if parent is None:
+                    paths[moid] = None
+                else:
+                    parent_path = path_of(parent._GetMoId()) if parent._GetMoId() in entries else None
+                    paths[moid] = '{}/{}'.format(parent_path, name) if parent_path else name
+            return paths[moid]
+
+        self.paths, self.objects = {}, {}
+        for moid, (obj, _, _) in entries.items():
+            path = path_of(moid)
+            if path:
+                self.paths[path] = obj
+                self.objects[moid] = path
+        self.sorted_paths = sorted(self.paths)
+        logger.debug('Inventory path index built with {} paths'.format(len(self.paths)))
+
+    def get(self, path, vimtype=None):
+        """Returns object with exact path, optionally only when it is instance of vimtype."""
+        obj = self.paths.get(path.strip('/'))
+        if obj is not None and vimtype is not None and not isinstance(obj, vimtype):
+            return None
+        return obj
+
+    def path_of(self, obj):
+        """Returns full path of indexed object."""
+        return self.objects.get(obj._GetMoId())
+
+    def find(self, prefix):
+        """Returns sorted (path, object) tuples of all paths starting with the prefix."""
+        prefix = prefix.lstrip('/')
+        start = bisect.bisect_left(self.sorted_paths, prefix)
+        result = []
+        for path in self.sorted_paths[start:]:
+            if not path.startswith(prefix):
+                break
+            result.append((path, self.paths[path]))
+        return result
+
+    def resolve(self, path, vimtype, bases=()):
+        """Returns object of vimtype at path, which is either full path or path relative to any of bases.
+        Bases are objects, e.g. datacenter's vmFolder for folders or cluster for resource pools."""
+        obj = self.get(path, vimtype)
+        for base in bases:
+            if obj is not None:
+                break
+            base_path = self.path_of(base) if base is not None else None
+            if base_path:
+                obj = self.get('{}/{}'.format(base_path, path.strip('/')), vimtype)
+        return obj
+
+
+# Index is built once per vCenter within single run
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_path_index(content):
+    """Returns path index of the vCenter the content belongs to, built on the first use."""
+    key = getattr(content.rootFolder._stub, 'host', None)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = PathIndex(content)
+        return _indexes[key]
+
@@ -0,0 +1,176 @@
+import time
+import uuid
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.tools.logger import logger
+from lib.tools.collector import collect_properties
+from lib.tools.state import state_path, locked, load_json, save_json
+from lib.exceptions import VmCLIException
+
+
+CLUSTER_PROPERTIES = ['name', 'host', 'datastore', 'resourcePool']
+HOST_PROPERTIES = [
+    'name', 'parent', 'runtime.connectionState', 'runtime.inMaintenanceMode',
+    'summary.hardware.cpuMhz', 'summary.hardware.numCpuCores', 'summary.hardware.memorySize',
+    'summary.quickStats.overallCpuUsage', 'summary.quickStats.overallMemoryUsage'
+]
+DATASTORE_PROPERTIES = [
+    'name', 'summary.capacity', 'summary.freeSpace', 'summary.accessible', 'summary.maintenanceMode'
+]
+
+
+class PlacementEngine(object):
+    """Selects cluster, host and datastore for new vms based on live capacity data. Capacity of all candidates
+    is fetched in one bulk property retrieval and every placement made is booked, so following placements see
+    the reduced capacity even before vCenter does. Bookings are shared between concurrently running vmcli
+    processes through a state file and expire after conf.PLACEMENT_BOOKING_TTL seconds."""
+
+    def __init__(self, content, datacenter):
+        self.content = content
+        self.datacenter = datacenter
+        self.bookings_path = state_path('placement.json')
+        self.clusters, self.hosts, self.datastores = {}, {}, {}
+        self.stale = True
+
+    def refresh(self):
+        """Loads capacity data of all clusters, hosts and datastores within the datacenter."""
+        self.clusters, self.hosts, self.datastores = {}, {}, {}
+        type_paths = {
+            vim.ClusterComputeResource: CLUSTER_PROPERTIES,
+            vim.HostSystem: HOST_PROPERTIES,
+            vim.Datastore: DATASTORE_PROPERTIES,
+        }
+        for obj, props in collect_properties(self.content, type_paths, root=self.datacenter):
+            if isinstance(obj, vim.ClusterComputeResource):
+                self.clusters[obj._GetMoId()] = dict(props, obj=obj)
+            elif isinstance(obj, vim.HostSystem):
+                self.hosts[obj._GetMoId()] = dict(props, obj=obj)
+            elif isinstance(obj, vim.Datastore):
+                self.datastores[obj._GetMoId()] = dict(props, obj=obj)
+        self.stale = False
+        logger.debug('Placement data loaded for {} clusters, {} hosts and {} datastores'.format(
+                len(self.clusters), len(self.hosts), len(self.datastores)))
+
+    def _load_bookings(self):
+        """Returns bookings, which have not expired yet."""
+        now = time.time()
+        bookings = load_json(self.bookings_path, default={})
+        return dict((key, b) for key, b in bookings.items() if b.get('expires', 0) > now)
+
+    @staticmethod
+    def _booked(bookings, kind, moid, value):
+        return sum(b[value] for b in bookings.values() if b.get(kind) == moid)
+
+    def _host_usable(self, host):
+        return host['runtime.connectionState'] == 'connected' and not host['runtime.inMaintenanceMode']
+
+    def _host_capacity(self, host, bookings):
+        """Returns free cpu in MHz and free memory in MB of the host, including pending bookings."""
+        cpu_total = (host['summary.hardware.cpuMhz'] or 0) * (host['summary.hardware.numCpuCores'] or 0)
+        mem_total = (host['summary.hardware.memorySize'] or 0) // (1024 * 1024)
+        moid = host['obj']._GetMoId()
+        cpu_free = cpu_total - (host['summary.quickStats.overallCpuUsage'] or 0)
+        cpu_free -= self._booked(bookings, 'host', moid, 'cpu')
+        mem_free = mem_total - (host['summary.quickStats.overallMemoryUsage'] or 0)
+        mem_free -= self._booked(bookings, 'host', moid, 'mem')
+        return cpu_total, cpu_free, mem_total, mem_free
+
+    def _score_host(self, host, bookings, cpu, mem):
+        """Score is the smaller of free cpu and memory ratios left after placing the vm."""
+        cpu_total, cpu_free, mem_total, mem_free = self._host_capacity(host, bookings)
+        if not cpu_total or not mem_total or mem_free < mem:
+            return None
+        return min(float(cpu_free - cpu) / cpu_total, float(mem_free - mem) / mem_total)
+
+    def _score_datastore(self, ds, bookings, disk):
+        """Score is the free space ratio left after placing the vm. Datastores, which would drop below the
+        reserved free space ratio, are not considered at all."""
+        if not ds['summary.accessible'] or ds['summary.maintenanceMode'] not in (None, 'normal'):
+            return None
+        capacity = ds['summary.capacity'] or 0
+        free = (ds['summary.freeSpace'] or 0) - self._booked(bookings, 'datastore', ds['obj']._GetMoId(), 'disk')
+        if not capacity or float(free - disk) / capacity < conf.PLACEMENT_DS_RESERVE:
+            return None
+        return float(free - disk) / capacity
+
+    def _candidate_clusters(self, cluster):
+        if cluster:
+            return [self.clusters[cluster._GetMoId()]] if cluster._GetMoId() in self.clusters else []
+        return list(self.clusters.values())
+
+    def _candidate_datastores(self, cluster, datastore):
+        """Datastore clusters are expanded to their members, specific datastore is used as is."""
+        moids = set(ds._GetMoId() for ds in cluster['datastore'])
+        if isinstance(datastore, vim.StoragePod):
+            moids &= set(ds._GetMoId() for ds in datastore.childEntity)
+        elif isinstance(datastore, vim.Datastore):
+            moids &= set([datastore._GetMoId()])
+        return [self.datastores[moid] for moid in moids if moid in self.datastores]
+
+    def place(self, cpu, mem, disk, cluster=None, datastore=None):
+        """Books the best cluster, host and datastore for a vm with provided cpu count, memory in megabytes
+        and disk space in bytes. Placement can be restricted to a cluster or datastore (cluster). Returns
+        booking dictionary with selected objects, which should be released when the vm is not created."""
+        if self.stale:
+            self.refresh()
+
+        with locked(self.bookings_path):
+            bookings = self._load_bookings()
+            best = None
+            for cl in self._candidate_clusters(cluster):
+                hosts = [self.hosts[h._GetMoId()] for h in cl['host'] if h._GetMoId() in self.hosts]
+                hosts = [h for h in hosts if self._host_usable(h)]
+                # vm cpu demand is estimated as the number of vcpus times speed of a single core on the host
+                scored = [(self._score_host(h, bookings, cpu * (h['summary.hardware.cpuMhz'] or 0), mem), h)
+                          for h in hosts]
+                scored = [x for x in scored if x[0] is not None]
+                datastores = [(self._score_datastore(ds, bookings, disk), ds)
+                              for ds in self._candidate_datastores(cl, datastore)]
+                datastores = [x for x in datastores if x[0] is not None]
+                if not scored or not datastores:
+                    continue
+
+                host_score, host = max(scored, key=lambda t: t[0])
+                ds_score, ds = max(datastores, key=lambda t: t[0])
+                score = min(host_score, ds_score)
+                if not best or score > best[0]:
+                    best = (score, cl, host, ds)
+
+            if not best:
+                raise VmCLIException('No cluster, host and datastore with enough free capacity found!')
+
+            score, cl, host, ds = best
+            booking = {
+                'cluster': cl['obj']._GetMoId(), 'host': host['obj']._GetMoId(), 'datastore': ds['obj']._GetMoId(),
+                'cpu': cpu * (host['summary.hardware.cpuMhz'] or 0), 'mem': mem, 'disk': disk,
+                'expires': time.time() + conf.PLACEMENT_BOOKING_TTL
+            }
+            key = str(uuid.uuid4())
+            bookings[key] = booking
+            save_json(self.bookings_path, bookings)
+
+        logger.debug('Placement scored {:.3f}: cluster {}, host {}, datastore {}'.format(
+                score, cl['name'], host['name'], ds['name']))
+        return dict(booking, key=key, cluster=cl['obj'], host=host['obj'], datastore=ds['obj'],
+                    resource_pool=cl['resourcePool'])
+
+    def release(self, booking):
+        """Removes booking of vm, which was not created. Bookings of created vms are kept until they expire,
+        so placements made before live capacity data catches up with new vms still see their usage."""
+        with locked(self.bookings_path):
+            bookings = self._load_bookings()
+            bookings.pop(booking['key'], None)
+            save_json(self.bookings_path, bookings)
+
+
+# Engines are reused within single run, so bulk operations do not refetch capacity data for every vm
+_engines = {}
+
+
+def get_placement_engine(content, datacenter):
+    """Returns placement engine shared for the datacenter across the program."""
+    key = datacenter._GetMoId()
+    if key not in _engines:
+        _engines[key] = PlacementEngine(content, datacenter)
+    return _engines[key]
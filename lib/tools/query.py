@@ -0,0 +1,271 @@
+import re
+import csv
+import sys
+import json
+import fnmatch
+import operator
+from pyVmomi import vim, vmodl
+
+from lib.tools.collector import collect_properties
+from lib.exceptions import VmCLIException
+
+
+# Short names of frequently used properties, any other name is treated as a property path, e.g. summary.overallStatus
+FIELD_ALIASES = {
+    'vm': {
+        'cpu': 'config.hardware.numCPU',
+        'mem': 'config.hardware.memoryMB',
+        'power': 'runtime.powerState',
+        'host': 'runtime.host',
+        'datastore': 'datastore',
+        'network': 'network',
+        'folder': 'parent',
+        'template': 'config.template',
+        'os': 'config.guestFullName',
+        'ip': 'guest.ipAddress',
+        'hostname': 'guest.hostName',
+        'tools': 'guest.toolsStatus',
+        'uuid': 'config.uuid',
+        'annotation': 'config.annotation',
+    },
+    'datastore': {
+        'capacity': 'summary.capacity',
+        'free': 'summary.freeSpace',
+        'type': 'summary.type',
+        'accessible': 'summary.accessible',
+    },
+    'cluster': {
+        'cpu': 'summary.numCpuCores',
+        'mem': 'summary.totalMemory',
+        'hosts': 'summary.numHosts',
+    },
+}
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '~': lambda value, pattern: fnmatch.fnmatchcase(value, pattern),
+    '=~': lambda value, pattern: re.search(pattern, value) is not None,
+}
+
+TOKENS = re.compile(r'\s*(?:(?P<op>==|!=|>=|<=|=~|>|<|~)|(?P<paren>[()])|'
+                    r'(?P<string>"[^"]*"|\'[^\']*\')|(?P<word>[^\s()=!<>~"\']+))')
+
+
+def tokenize(expression):
+    """Splits where expression into list of (kind, value) tokens."""
+    tokens, position = [], 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKENS.match(expression, position)
+        if not match:
+            raise VmCLIException('Unable to parse expression near: {}'.format(expression[position:]))
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            value = value[1:-1]
+        elif kind == 'word' and value.lower() in ('and', 'or', 'not'):
+            kind = value = value.lower()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+def convert_literal(value):
+    """Converts literal from expression to number or boolean when possible."""
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+class Query(object):
+    """Filter and projection over properties of one VMware object type. Filter is a where expression like
+    "cpu > 8 and power == poweredOff and (datastore == ds01 or name ~ 'web-*')". Comparison with list properties
+    (e.g. datastore) is true when any of the list items matches. Only properties referenced by the filter, fields
+    and sort key are retrieved from vCenter."""
+
+    def __init__(self, kind, where=None, fields=None, sort=None, limit=None):
+        self.kind = kind
+        self.aliases = FIELD_ALIASES.get(kind, {})
+        self.fields = fields or ['name']
+        self.reverse = bool(sort and sort.startswith('-'))
+        self.sort = sort.lstrip('-') if sort else None
+        self.limit = limit
+        self.referenced = set(self.fields)
+        if self.sort:
+            self.referenced.add(self.sort)
+
+        self.tokens = tokenize(where) if where else []
+        self.filter = self.parse_or() if self.tokens else (lambda row: True)
+        if self.tokens:
+            raise VmCLIException('Unexpected token in expression: {}'.format(self.tokens[0][1]))
+
+    def path(self, field):
+        """Returns property path of provided field name."""
+        return self.aliases.get(field, field)
+
+    def paths(self):
+        """Returns property paths, which have to be retrieved to evaluate the query."""
+        return sorted(set(self.path(field) for field in self.referenced) | set(['name']))
+
+    def _next(self, expected=None):
+        if not self.tokens:
+            raise VmCLIException('Unexpected end of expression!')
+        kind, value = self.tokens.pop(0)
+        if expected and kind != expected:
+            raise VmCLIException('Unexpected token in expression: {}'.format(value))
+        return kind, value
+
+    def _peek(self):
+        return self.tokens[0][0] if self.tokens else None
+
+    def parse_or(self):
+        left = self.parse_and()
+        while self._peek() == 'or':
+            self._next()
+            left = (lambda a, b: lambda row: a(row) or b(row))(left, self.parse_and())
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self._peek() == 'and':
+            self._next()
+            left = (lambda a, b: lambda row: a(row) and b(row))(left, self.parse_not())
+        return left
+
+    def parse_not(self):
+        if self._peek() == 'not':
+            self._next()
+            inner = self.parse_not()
+            return lambda row: not inner(row)
+        if self._peek() == 'paren':
+            self._next('paren')
+            inner = self.parse_or()
+            self._next('paren')
+            return inner
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        field = self._next('word')[1]
+        op = self._next('op')[1]
+        kind, literal = self._next()
+        if kind not in ('word', 'string'):
+            raise VmCLIException('Unexpected token in expression: {}'.format(literal))
+        self.referenced.add(field)
+        compare = OPERATORS[op]
+        # Pattern operators and quoted literals work with strings, others compare numbers and booleans as such
+        if kind == 'word' and op not in ('~', '=~'):
+            literal = convert_literal(literal)
+
+        def evaluate(row):
+            values = row.get(field)
+            values = values if isinstance(values, list) else [values]
+            for value in values:
+                if value is None:
+                    continue
+                if isinstance(literal, str) and not isinstance(value, str):
+                    value = str(value)
+                try:
+                    if compare(value, literal):
+                        return True
+                except TypeError:
+                    continue
+            return False
+        return evaluate
+
+    def run(self, content, vimtype):
+        """Executes query with single property retrieval and returns list of matching rows."""
+        # only properties are kept, proxies of the objects themselves are not needed for filtering
+        try:
+            objects = [props for _, props in collect_properties(content, {vimtype: self.paths()})]
+        except vmodl.query.InvalidProperty as e:
+            raise VmCLIException('Unknown property {} of {} objects!'.format(e.name, self.kind))
+        names = resolve_names(content, objects)
+
+        rows = []
+        for props in objects:
+            row = dict((field, simplify(props.get(self.path(field)), names)) for field in self.referenced)
+            row['name'] = props.get('name')
+            if self.filter(row):
+                rows.append(row)
+        return rows
+
+    def select(self, rows, extra_fields=()):
+        """Sorts and limits rows returned by run, only requested fields (and extra_fields) are kept."""
+        if self.sort:
+            # rows missing the sort key are placed last in both orders
+            rows = (sorted([row for row in rows if row.get(self.sort) is not None],
+                           key=lambda row: row.get(self.sort), reverse=self.reverse) +
+                    [row for row in rows if row.get(self.sort) is None])
+        if self.limit:
+            rows = rows[:self.limit]
+        fields = list(extra_fields) + self.fields
+        return [dict((field, row.get(field)) for field in fields) for row in rows]
+
+
+def resolve_names(content, property_sets):
+    """Retrieves names of all managed objects referenced in properties with one bulk call."""
+    references = {}
+    for props in property_sets:
+        for value in props.values():
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, vim.ManagedEntity):
+                    references[item._GetMoId()] = item
+    if not references:
+        return {}
+
+    names = {}
+    try:
+        for obj, props in collect_properties(content, {vim.ManagedEntity: ['name']},
+                                             objects=list(references.values())):
+            names[obj._GetMoId()] = props.get('name')
+    except vmodl.fault.ManagedObjectNotFound:
+        pass
+    return names
+
+
+def simplify(value, names):
+    """Converts property value to plain python type suitable for comparison and output."""
+    if isinstance(value, vmodl.ManagedObject):
+        return names.get(value._GetMoId(), value._GetMoId())
+    if isinstance(value, (list, tuple)):
+        return [simplify(item, names) for item in value]
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def format_value(value):
+    """Formats value for table and csv output."""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ','.join(format_value(item) for item in value)
+    return str(value)
+
+
+def print_rows(rows, fields, output='table', stream=None):
+    """Prints rows in table, json or csv format."""
+    stream = stream or sys.stdout
+    if output == 'json':
+        json.dump(rows, stream, indent=2)
+        stream.write('\n')
+    elif output == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([format_value(row.get(field)) for field in fields])
+    else:
+        lines = [[format_value(row.get(field)) for field in fields] for row in rows]
+        widths = [max([len(field)] + [len(line[i]) for line in lines]) for i, field in enumerate(fields)]
+        for line in [fields] + lines:
+            stream.write('  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip() + '\n')
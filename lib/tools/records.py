@@ -0,0 +1,42 @@
+import sys
+from pyVmomi import VmomiSupport
+
+from lib.tools.collector import collect_properties
+
+
+def intern(value):
+    """Interns strings repeated across many records (ids of parents, type names), so they are stored once."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class InventoryRecord(object):
+    """Compact representation of inventory object. Instead of pyVmomi proxy with its own dictionary only
+    managed object id, type name, name and id of the parent are kept, all of them interned. Proxy object
+    can be recreated on demand with to_object."""
+    __slots__ = ('moid', 'type', 'name', 'parent')
+
+    def __init__(self, moid, type, name, parent=None):
+        self.moid = intern(moid)
+        self.type = intern(type)
+        self.name = name
+        self.parent = intern(parent)
+
+    @classmethod
+    def from_object(cls, obj, name, parent=None):
+        """Creates record of managed object with its retrieved name and parent object."""
+        return cls(obj._GetMoId(), type(obj).__name__, name, parent._GetMoId() if parent is not None else None)
+
+    def to_object(self, stub):
+        """Returns managed object of the record bound to provided SOAP stub."""
+        return VmomiSupport.GetVmodlType(self.type)(self.moid, stub)
+
+    def __repr__(self):
+        return '{}:{}({})'.format(self.type, self.moid, self.name)
+
+
+def load_records(content, vimtypes, root=None, page_size=None):
+    """Yields records of all objects of provided types, names and parents of all of them are retrieved with
+    single bulk call and objects are never held as pyVmomi proxies."""
+    for obj, props in collect_properties(content, dict((t, ['name', 'parent']) for t in vimtypes), root=root,
+                                         page_size=page_size):
+        yield InventoryRecord.from_object(obj, props.get('name'), props.get('parent'))
@@ -0,0 +1,50 @@
+from pyVmomi import vim
+
+from lib.tools.logger import logger
+from lib.tools.collector import retrieve_properties
+
+
+# Replicas are named after their template and the datastore holding them
+REPLICA_NAME = '{template}-replica-{datastore}'
+# Annotation of replica records version of the template it was copied from
+REPLICA_MARKER = 'vmcli replica of {template} modified {modified}'
+
+
+def replica_name(template_name, datastore_name):
+    return REPLICA_NAME.format(template=template_name, datastore=datastore_name)
+
+
+def replica_marker(template_name, modified):
+    """Returns annotation identifying replica of the template in its current version."""
+    return REPLICA_MARKER.format(template=template_name, modified=modified.isoformat() if modified else None)
+
+
+def get_replicas(content, template_name):
+    """Returns dictionary of datastore name: replica properties of all replicas of the template. Names of all
+    vms are loaded with single bulk retrieval, annotations only of replicas."""
+    prefix = replica_name(template_name, '')
+    replicas = [vm for vm, props in retrieve_properties(content, vim.VirtualMachine, ['name'])
+                if (props.get('name') or '').startswith(prefix)]
+    if not replicas:
+        return {}
+    return dict((props['name'][len(prefix):], dict(props, obj=vm)) for vm, props in retrieve_properties(
+            content, vim.VirtualMachine, ['name', 'config.annotation'], objects=replicas))
+
+
+def find_local_replica(content, template, datastore):
+    """Returns replica of the template placed on the datastore, if it exists and is in sync with the template.
+    Otherwise template itself is returned."""
+    if not isinstance(datastore, vim.Datastore):
+        return template
+    props = next((props for _, props in retrieve_properties(
+            content, vim.VirtualMachine, ['name', 'config.modified'], objects=[template])), {})
+    marker = replica_marker(props.get('name'), props.get('config.modified'))
+
+    replica = get_replicas(content, props.get('name')).get(datastore.name)
+    if replica is None:
+        return template
+    if replica.get('config.annotation') != marker:
+        logger.warning('Replica {} is out of sync with its template, run template sync'.format(replica['name']))
+        return template
+    logger.info('Using replica {} local to datastore {}'.format(replica['name'], datastore.name))
+    return replica['obj']
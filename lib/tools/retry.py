@@ -0,0 +1,100 @@
+import time
+import socket
+import random
+import requests
+from pyVmomi import vim, vmodl
+
+from lib import config as conf
+from lib.tools.logger import logger
+
+try:
+    from http.client import HTTPException
+except ImportError:
+    from httplib import HTTPException
+
+
+# Errors caused by unreliable network, restarting vCenter or expired session. Calls failing with them
+# can be repeated, anything else is considered to be a permanent failure.
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    socket.gaierror,
+    socket.timeout,
+    HTTPException,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    vim.fault.NotAuthenticated,
+    vim.fault.HostConnectFault,
+    vmodl.fault.HostCommunication,
+)
+
+
+def is_transient(error):
+    """Returns True if failed call can be repeated."""
+    # invalid certificate does not get any better with repeating
+    if isinstance(error, requests.exceptions.SSLError):
+        return False
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def describe(error):
+    """Returns short description of the error for log messages."""
+    if isinstance(error, vmodl.MethodFault):
+        return error.msg or error.__class__.__name__
+    return str(error) or error.__class__.__name__
+
+
+class RetryPolicy(object):
+    """Repeats calls failing with transient errors with exponentially growing delays with full jitter,
+    so many clients recovering at the same time do not hit vCenter at once."""
+
+    def __init__(self, attempts, base_delay, max_delay):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Returns random delay before the next attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(self, func, check=None, relogin=None, description='vCenter call'):
+        """Calls func until it succeeds or attempts are exhausted. Expired session is renewed by relogin before
+        the next attempt. Because failed call could have been carried out by vCenter anyway (e.g. connection
+        dropped after the request was received), check is called before every repeated attempt and when it
+        returns anything else than None, the operation is considered done and its value is returned."""
+        attempt, repeated, expired = 1, False, False
+        while True:
+            try:
+                if expired:
+                    # failed relogin counts as a failed attempt, it is tried again before the next one
+                    relogin()
+                    expired = False
+                if repeated and check:
+                    try:
+                        result = check()
+                    except Exception as e:
+                        if not is_transient(e):
+                            raise
+                        result = None
+                    if result is not None:
+                        logger.info('{} has already been carried out, not repeating'.format(description))
+                        return result
+                return func()
+            except Exception as e:
+                if not is_transient(e) or attempt >= self.attempts:
+                    raise
+                delay = self.delay(attempt)
+                logger.warning('{} failed ({}), retrying in {:.1f}s...'.format(description, describe(e), delay))
+                time.sleep(delay)
+                attempt += 1
+                repeated = True
+                if isinstance(e, vim.fault.NotAuthenticated) and relogin:
+                    expired = True
+
+
+def get_retry_policy(command=None):
+    """Returns retry policy of the subcommand. Global directives of the retry section can be overriden
+    for particular subcommands in its commands subsection."""
+    overrides = (conf.RETRY_COMMANDS or {}).get(command) or {}
+    return RetryPolicy(int(overrides.get('attempts', conf.RETRY_ATTEMPTS)),
+                       float(overrides.get('base_delay', conf.RETRY_BASE_DELAY)),
+                       float(overrides.get('max_delay', conf.RETRY_MAX_DELAY)))
@@ -0,0 +1,44 @@
+import os
+import json
+import fcntl
+from contextlib import contextmanager
+
+from lib import config as conf
+
+
+def state_path(*parts):
+    """Returns path inside vmcli state directory, parent directories are created when missing."""
+    path = os.path.join(conf.STATE_DIR, *parts)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return path
+
+
+@contextmanager
+def locked(path):
+    """Holds exclusive lock tied to provided path for the duration of the with block. Lock is kept in separate
+    .lock file, so the file itself can be atomically replaced while lock is held."""
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_json(path, default=None):
+    """Loads JSON document from a state file, default is returned if file is missing or unreadable."""
+    try:
+        with open(path) as state_file:
+            return json.load(state_file)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def save_json(path, data):
+    """Atomically replaces state file with JSON representation of data."""
+    tmp_path = '{}.{}'.format(path, os.getpid())
+    with open(tmp_path, 'w') as state_file:
+        json.dump(data, state_file, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
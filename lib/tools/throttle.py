@@ -0,0 +1,168 @@
+import time
+import random
+import threading
+from collections import OrderedDict
+from pyVmomi import vim
+
+from lib import config as conf
+from lib.tools.logger import logger
+
+try:
+    from http.client import HTTPException
+except ImportError:
+    from httplib import HTTPException
+
+
+# Faults returned by vCenter or ESXi when they refuse to take more work at the moment
+THROTTLING_FAULTS = (vim.fault.TooManyConcurrentNativeClones,)
+# HTTP status codes of overloaded or rate limiting vCenter (or proxy in front of it)
+THROTTLING_STATUSES = ('429', '503')
+
+
+def is_throttling(error):
+    """Returns True if error means vCenter is overloaded and the call should be repeated later."""
+    if isinstance(error, THROTTLING_FAULTS):
+        return True
+    return isinstance(error, HTTPException) and str(error).split(' ')[0] in THROTTLING_STATUSES
+
+
+class TokenBucket(object):
+    """Limits rate of calls to rate per second, while allowing bursts of up to burst calls."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter(object):
+    """Limits number of concurrently running tasks with additive increase, multiplicative decrease algorithm.
+    Limit grows by one with every limit of tasks finishing in time and it is halved when vCenter throttles
+    or when tasks wait too long in vCenter's queue before they start."""
+
+    def __init__(self, initial, minimum, maximum, decrease=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, blocking=True):
+        """Takes free slot under current limit, blocks until there is one unless blocking is False.
+        Returns True when the slot was taken."""
+        with self.condition:
+            while self.running >= int(self.limit):
+                if not blocking:
+                    return False
+                self.condition.wait()
+            self.running += 1
+            return True
+
+    def release(self, congested=False, adjust=True):
+        """Frees slot, congested tells whether vCenter showed signs of overload while the slot was held.
+        Limit is left as it is without adjust, e.g. when slot is freed before its task finished."""
+        with self.condition:
+            self.running = max(0, self.running - 1)
+            if adjust and congested:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                logger.debug('vCenter congested, concurrency limit lowered to {}'.format(int(self.limit)))
+            elif adjust:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+
+class Throttle(object):
+    """Guards submission of vCenter tasks. Every submission takes token from rate limiting bucket and holds
+    a concurrency slot until the task finishes. Throttled submissions are repeated with growing delay."""
+
+    def __init__(self, rate=None, burst=None, initial=None, maximum=None, queue_delay=None):
+        self.bucket = TokenBucket(rate or conf.THROTTLE_RATE, burst or conf.THROTTLE_BURST)
+        self.limiter = AdaptiveLimiter(initial or conf.THROTTLE_CONCURRENCY, 1,
+                                       maximum or conf.THROTTLE_MAX_CONCURRENCY)
+        self.queue_delay = queue_delay or conf.THROTTLE_QUEUE_DELAY
+        # running tasks holding concurrency slot mapped to threads which submitted them, in submission order
+        self.tasks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, obj, method, *args, **kwargs):
+        """Calls *_Task method of the object and returns created task. Concurrency slot is held until finish
+        is called."""
+        delay = 1
+        while True:
+            self.bucket.acquire()
+            self.acquire_slot()
+            try:
+                task = getattr(obj, method)(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttling(e)
+                self.limiter.release(congested=throttled)
+                if not throttled or delay > conf.THROTTLE_MAX_DELAY:
+                    raise
+                logger.debug('Task submission throttled by vCenter, retrying in {}s...'.format(delay))
+                time.sleep(delay + random.uniform(0, delay))
+                delay *= 2
+                continue
+
+            with self.lock:
+                self.tasks[str(task)] = threading.current_thread()
+            return task
+
+    def acquire_slot(self):
+        """Takes concurrency slot. Caller submitting more tasks before waiting for them would block forever
+        once its own tasks fill the limit, so slot of the oldest task the thread submitted is handed over
+        instead. Such task is no longer counted as running."""
+        # thread objects are compared, idents of finished threads are reused by new ones
+        thread = threading.current_thread()
+        while not self.limiter.acquire(blocking=False):
+            with self.lock:
+                own = next((task for task, owner in self.tasks.items() if owner is thread), None)
+                if own is not None:
+                    del self.tasks[own]
+            if own is None:
+                self.limiter.acquire()
+                return
+            self.limiter.release(adjust=False)
+
+    def finish(self, task, info=None):
+        """Frees concurrency slot of the finished task. Time the task spent queued in vCenter is used to
+        detect congestion."""
+        with self.lock:
+            if str(task) not in self.tasks:
+                return
+            del self.tasks[str(task)]
+
+        congested = False
+        if info is not None:
+            queued = info.startTime and info.queueTime and (info.startTime - info.queueTime).total_seconds()
+            congested = bool(queued and queued > self.queue_delay) or is_throttling(info.error)
+        self.limiter.release(congested=congested)
+
+
+# Tasks of all commands running in the program share single throttle per vCenter
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+def get_throttle(stub):
+    """Returns throttle shared by all tasks submitted through provided SOAP stub."""
+    with _throttles_lock:
+        key = getattr(stub, 'host', None) or id(stub)
+        if key not in _throttles:
+            _throttles[key] = Throttle()
+        return _throttles[key]
@@ -0,0 +1,67 @@
+import atexit
+import threading
+
+from lib.tools.logger import logger
+
+
+class ViewRegistry(object):
+    """Keeps one container view per vCenter, root object and set of types for the whole run. Container views
+    are updated by vCenter as the inventory changes, so single view can serve any number of lookups instead
+    of creating (and leaking) new server side view for each of them. All views are destroyed on exit."""
+
+    def __init__(self):
+        self.views = {}
+        self.lookups = 0
+        self.lock = threading.Lock()
+        self.registered = False
+
+    def get(self, content, types, root=None):
+        """Returns container view of provided types under root (root folder by default), creates it if needed."""
+        root = root or content.rootFolder
+        key = (getattr(root._stub, 'host', None), root._GetMoId(), tuple(sorted(t.__name__ for t in types)))
+        with self.lock:
+            self.lookups += 1
+            view = self.views.get(key)
+            if view is None:
+                view = content.viewManager.CreateContainerView(root, list(types), True)
+                self.views[key] = view
+                logger.debug('Created container view of {} under {} ({} views open)'.format(
+                        ', '.join(key[2]), key[1], len(self.views)))
+                if not self.registered:
+                    # registered after the first view is created, i.e. after login, so views are destroyed
+                    # before sessions are closed by handlers registered at connect time
+                    atexit.register(self.destroy)
+                    self.registered = True
+            return view
+
+    def forget(self, host):
+        """Drops views of the vCenter without destroying them, used when their session is gone."""
+        with self.lock:
+            for key in [key for key in self.views if key[0] == host]:
+                del self.views[key]
+
+    def destroy(self):
+        """Destroys all views created during the run."""
+        with self.lock:
+            destroyed = 0
+            for view in self.views.values():
+                try:
+                    view.Destroy()
+                    destroyed += 1
+                except Exception as e:
+                    logger.debug('Unable to destroy container view {}: {}'.format(view, e))
+            logger.debug('Destroyed {} container views, they served {} lookups'.format(destroyed, self.lookups))
+            self.views.clear()
+
+
+_registry = ViewRegistry()
+
+
+def get_view(content, types, root=None):
+    """Returns container view shared by all lookups of the run, see ViewRegistry."""
+    return _registry.get(content, types, root)
+
+
+def forget_views(host):
+    """Drops views bound to expired session of the vCenter, new ones are created on the next lookup."""
+    _registry.forget(host)
@@ -0,0 +1,64 @@
+from pyVmomi import vim, vmodl
+
+from lib.tools.logger import logger
+from lib.tools.throttle import get_throttle
+
+
+class TaskWaiter(object):
+    """Watches any number of tasks through single dedicated property collector. Tasks can be added while
+    others are still running, wait returns tasks finished since the previous call, so callers can keep
+    fixed number of operations in flight and submit new ones as soon as running ones finish."""
+
+    def __init__(self, content):
+        self.collector = content.propertyCollector.CreatePropertyCollector()
+        self.filters = {}
+        self.version = None
+
+    def add(self, task):
+        """Starts watching the task."""
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=task)],
+                propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info'])])
+        self.filters[str(task)] = self.collector.CreateFilter(filter_spec, True)
+
+    def __len__(self):
+        return len(self.filters)
+
+    def wait(self, timeout):
+        """Waits up to timeout seconds for updates and returns list of (task, info) of finished tasks. Concurrency
+        slots of finished tasks are released in the throttle."""
+        finished = []
+        if not self.filters:
+            return finished
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=timeout)
+        update = self.collector.WaitForUpdatesEx(self.version, options)
+        while update:
+            self.version = update.version
+            for filter_set in update.filterSet:
+                for obj_set in filter_set.objectSet:
+                    for change in obj_set.changeSet:
+                        info = change.val
+                        if change.name != 'info' or info.state not in (vim.TaskInfo.State.success,
+                                                                       vim.TaskInfo.State.error):
+                            continue
+                        task = obj_set.obj
+                        pcfilter = self.filters.pop(str(task), None)
+                        if pcfilter is None:
+                            continue
+                        pcfilter.Destroy()
+                        get_throttle(task._stub).finish(task, info)
+                        finished.append((task, info))
+            if not update.truncated:
+                break
+            update = self.collector.WaitForUpdatesEx(self.version, options)
+        return finished
+
+    def destroy(self):
+        """Destroys the collector together with filters of tasks still being watched."""
+        for task in list(self.filters):
+            get_throttle(self.collector._stub).finish(task)
+        self.filters = {}
+        try:
+            self.collector.Destroy()
+        except vmodl.MethodFault as e:
+            logger.debug('Unable to destroy property collector of task waiter: {}'.format(e))
@@ -0,0 +1,102 @@
+import datetime
+import socket
+import unittest
+from pyVmomi import vim, VmomiSupport
+
+from lib.modules import BaseCommands
+from lib.tools.retry import RetryPolicy
+
+
+class FakeTask(object):
+    def __init__(self, info):
+        self.info = info
+
+
+class FakeVM(object):
+    """Stands in for vim.VirtualMachine, only recentTask and method lookup are needed."""
+
+    def __init__(self, tasks):
+        self.recentTask = tasks
+
+    def _GetMethodInfo(self, method):
+        return vim.VirtualMachine._GetMethodInfo(method)
+
+
+class FakeCommands(BaseCommands):
+    def __init__(self, now):
+        self.now = now
+
+    def get_content(self, obj):
+        now = self.now
+
+        class Content(object):
+            def CurrentTime(self):
+                return now
+        return Content()
+
+
+class FindSubmittedTaskTest(unittest.TestCase):
+    def make_task(self, wsdl_name, state=vim.TaskInfo.State.running):
+        # task info retrieved from vCenter holds managed method, not a string
+        method = VmomiSupport.GetWsdlMethod('urn:vim25', wsdl_name)
+        return FakeTask(vim.TaskInfo(name=method, queueTime=self.now, state=state))
+
+    def setUp(self):
+        self.now = datetime.datetime(2024, 1, 1, 12, 0, 0)
+        self.commands = FakeCommands(self.now)
+
+    def test_finds_task_by_python_method_name(self):
+        task = self.make_task('CloneVM_Task')
+        vm = FakeVM([self.make_task('ReconfigVM_Task'), task])
+        self.assertIs(self.commands.find_submitted_task(vm, 'Clone', started=0), task)
+
+    def test_finds_task_by_wsdl_method_name(self):
+        task = self.make_task('ReconfigVM_Task')
+        vm = FakeVM([task])
+        self.assertIs(self.commands.find_submitted_task(vm, 'ReconfigVM_Task', started=0), task)
+
+    def test_ignores_failed_and_other_tasks(self):
+        vm = FakeVM([self.make_task('CloneVM_Task', state=vim.TaskInfo.State.error),
+                     self.make_task('PowerOnVM_Task')])
+        self.assertIsNone(self.commands.find_submitted_task(vm, 'Clone', started=0))
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(3, 0, 0)
+
+    def test_failed_relogin_counts_as_attempt(self):
+        calls = {'func': 0, 'relogin': 0}
+
+        def func():
+            calls['func'] += 1
+            if calls['func'] == 1:
+                raise vim.fault.NotAuthenticated()
+            return 'done'
+
+        def relogin():
+            calls['relogin'] += 1
+            if calls['relogin'] == 1:
+                raise socket.timeout()
+
+        self.assertEqual(self.policy.call(func, relogin=relogin), 'done')
+        self.assertEqual(calls, {'func': 2, 'relogin': 2})
+
+    def test_relogin_failures_exhaust_attempts(self):
+        def func():
+            raise vim.fault.NotAuthenticated()
+
+        def relogin():
+            raise socket.timeout()
+
+        self.assertRaises(socket.timeout, self.policy.call, func, relogin=relogin)
+
+    def test_check_stops_repeating(self):
+        def func():
+            raise socket.timeout()
+
+        self.assertEqual(self.policy.call(func, check=lambda: 'task'), 'task')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import threading
+import unittest
+
+from lib.tools.throttle import Throttle
+
+
+class FakeVM(object):
+    """Creates numbered fake tasks."""
+
+    def __init__(self):
+        self.created = 0
+
+    def PowerOnVM_Task(self):
+        self.created += 1
+        return 'task-{}'.format(self.created)
+
+
+class ThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.throttle = Throttle(rate=1000, burst=1000, initial=2, maximum=2)
+        self.vm = FakeVM()
+
+    def submit_in_thread(self, count, timeout=5):
+        tasks = []
+        thread = threading.Thread(target=lambda: tasks.extend(self.throttle.submit(self.vm, 'PowerOnVM_Task')
+                                                              for _ in range(count)))
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+        return thread, tasks
+
+    def test_batch_over_limit_does_not_block(self):
+        thread, tasks = self.submit_in_thread(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(tasks), 5)
+        # oldest tasks handed their slots over, only the latest ones are counted as running
+        self.assertEqual(list(self.throttle.tasks), ['task-4', 'task-5'])
+        self.assertEqual(self.throttle.limiter.running, 2)
+
+    def test_finish_frees_slot(self):
+        _, tasks = self.submit_in_thread(5)
+        for task in tasks:
+            self.throttle.finish(task)
+        self.assertEqual(self.throttle.limiter.running, 0)
+        self.assertEqual(len(self.throttle.tasks), 0)
+
+    def test_other_threads_wait_for_free_slot(self):
+        self.submit_in_thread(2)
+        thread, tasks = self.submit_in_thread(1, timeout=0.5)
+        self.assertTrue(thread.is_alive())
+        self.throttle.finish('task-1')
+        thread.join(5)
+        self.assertEqual(tasks, ['task-3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
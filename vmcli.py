@@ -5,7 +5,8 @@ import argparse
 
 from lib.tools.logger import logger
 from lib.tools.argparser import get_arg_subparsers, argument_loader
-from lib.connector import connect
+from lib.connector import connect, connect_all
+from lib import config as conf
 from lib.modules import module_loader
 from lib.exceptions import VmCLIException
 
@@ -41,10 +42,17 @@ if __name__ == '__main__':
     if args.quiet:
         logger.quiet()
 
-    connection = connect(args.vcenter, args.username, args.password, args.insecure)
+    connection, sites = None, None
+    if commands[args.subcommand].requires_connection:
+        # Explicitly selected vCenter takes precedence over list of configured vCenters
+        if conf.VCENTERS and not args.vcenter:
+            sites = connect_all(conf.VCENTERS, args.username, args.password, args.insecure)
+            connection = next(iter(sites.values()))
+        else:
+            connection = connect(args.vcenter, args.username, args.password, args.insecure)
 
     # load appropiate command, argparse will handle correct input for us
-    command = commands[args.subcommand](connection=connection)
+    command = commands[args.subcommand](connection=connection, sites=sites)
 
     try:
         command.execute(args)